@@ -2,11 +2,13 @@ from http.server import BaseHTTPRequestHandler
 import json
 import os
 import sys
-import requests
 
-# Add parent directory to path to import utils
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+# Add parent directory to path to import utils (once; warm invocations and reloads re-run this)
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
 from api.utils import create_response
+from api import salesforce_client
 
 class handler(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
@@ -91,7 +93,7 @@ class handler(BaseHTTPRequestHandler):
             }
             
             # Make request
-            api_response = requests.post(token_url, data=payload, timeout=30)
+            api_response = salesforce_client.post(token_url, data=payload, timeout=30)
             
             if api_response.status_code == 200:
                 token_data = api_response.json()
@@ -0,0 +1,211 @@
+"""
+Per-instance circuit breaker and request deadlines for extract-data calls.
+
+After CIRCUIT_FAILURE_THRESHOLD consecutive failures (server errors, timeouts
+or network errors) against a Salesforce instance its circuit opens and calls
+fail at once for CIRCUIT_OPEN_SECONDS instead of tying up a worker for the
+full timeout. The circuit then lets CIRCUIT_HALF_OPEN_PROBES trial calls
+through; a success closes it, a failure opens it again.
+
+Clients may send a time budget; it becomes a deadline that every outbound
+call on the request's behalf (governor wait, fallback models, page chunks,
+re-extraction) takes its timeout from.
+"""
+import os
+import time
+import threading
+
+from api.governor import org_key
+
+# Breaker configuration (overridable via environment variables)
+CIRCUIT_BREAKER = os.environ.get("CIRCUIT_BREAKER", "true").lower() == "true"
+CIRCUIT_FAILURE_THRESHOLD = int(os.environ.get("CIRCUIT_FAILURE_THRESHOLD", "5"))
+CIRCUIT_OPEN_SECONDS = float(os.environ.get("CIRCUIT_OPEN_SECONDS", "30"))
+CIRCUIT_HALF_OPEN_PROBES = int(os.environ.get("CIRCUIT_HALF_OPEN_PROBES", "1"))
+# Largest time budget a client may ask for (seconds)
+REQUEST_MAX_BUDGET = float(os.environ.get("REQUEST_MAX_BUDGET", "300"))
+
+CLOSED, OPEN, HALF_OPEN = 'closed', 'open', 'half_open'
+
+# Failure flags set on responses produced locally; retrying them elsewhere cannot help
+LOCAL_FAILURES = ('throttled', 'circuit_open', 'deadline_exceeded')
+
+
+class CircuitOpen(Exception):
+    """Raised instead of calling an instance whose circuit is open"""
+
+    def __init__(self, org, retry_after):
+        super().__init__(f'Document AI at {org} is failing; calls are paused for {retry_after:.0f}s')
+        self.org = org
+        self.retry_after = retry_after
+
+
+class _Circuit:
+    def __init__(self):
+        self.state = CLOSED
+        self.failures = 0
+        self.opened_at = 0.0
+        self.probes = 0
+        self.counters = {'calls': 0, 'failures': 0, 'rejected': 0, 'trips': 0}
+
+
+class CircuitBreaker:
+    """Closed / open / half-open state per Salesforce instance"""
+
+    def __init__(self, failure_threshold=CIRCUIT_FAILURE_THRESHOLD, open_seconds=CIRCUIT_OPEN_SECONDS,
+                 half_open_probes=CIRCUIT_HALF_OPEN_PROBES, enabled=CIRCUIT_BREAKER):
+        self.failure_threshold = failure_threshold
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.enabled = enabled
+        self._circuits = {}
+        self._lock = threading.Lock()
+
+    def _circuit(self, org):
+        circuit = self._circuits.get(org)
+        if circuit is None:
+            circuit = self._circuits[org] = _Circuit()
+        return circuit
+
+    def _trip(self, circuit, now):
+        circuit.state = OPEN
+        circuit.opened_at = now
+        circuit.probes = 0
+        circuit.counters['trips'] += 1
+
+    def allow(self, url):
+        """Admit a call to the instance, or raise CircuitOpen"""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            circuit = self._circuit(org_key(url))
+            if circuit.state == OPEN and now - circuit.opened_at >= self.open_seconds:
+                circuit.state = HALF_OPEN
+                circuit.probes = 0
+            if circuit.state == OPEN or (circuit.state == HALF_OPEN and circuit.probes >= self.half_open_probes):
+                circuit.counters['rejected'] += 1
+                retry_after = max(1.0, self.open_seconds - (now - circuit.opened_at))
+                raise CircuitOpen(org_key(url), retry_after)
+            if circuit.state == HALF_OPEN:
+                circuit.probes += 1
+            circuit.counters['calls'] += 1
+
+    def record(self, url, success):
+        """Outcome of an admitted call: True, False, or None when it never reached the instance"""
+        if not self.enabled:
+            return
+        now = time.monotonic()
+        with self._lock:
+            circuit = self._circuit(org_key(url))
+            if circuit.state == HALF_OPEN:
+                circuit.probes = max(0, circuit.probes - 1)
+            if success is None:
+                return
+            if not success:
+                circuit.counters['failures'] += 1
+            if circuit.state == HALF_OPEN:
+                if success:
+                    circuit.state = CLOSED
+                    circuit.failures = 0
+                else:
+                    self._trip(circuit, now)
+            elif circuit.state == CLOSED:
+                circuit.failures = 0 if success else circuit.failures + 1
+                if circuit.failures >= self.failure_threshold:
+                    self._trip(circuit, now)
+
+    def stats(self):
+        now = time.monotonic()
+        with self._lock:
+            orgs = {
+                org: dict(
+                    circuit.counters,
+                    state=circuit.state,
+                    consecutive_failures=circuit.failures,
+                    open_for_s=round(max(0.0, self.open_seconds - (now - circuit.opened_at)), 1)
+                    if circuit.state == OPEN else 0.0
+                )
+                for org, circuit in self._circuits.items()
+            }
+        return {
+            'enabled': self.enabled,
+            'failure_threshold': self.failure_threshold,
+            'open_seconds': self.open_seconds,
+            'half_open_probes': self.half_open_probes,
+            'orgs': orgs
+        }
+
+
+breaker = CircuitBreaker()
+
+
+def is_failure(status_code):
+    """Whether a response counts against the circuit (throttling and client errors do not)"""
+    if status_code == 429:
+        return None
+    return status_code >= 500
+
+
+def outcome(status_code):
+    """Value for breaker.record() after a response: True, False, or None for throttling"""
+    failure = is_failure(status_code)
+    return None if failure is None else not failure
+
+
+def timeout_outcome(timeout, configured_timeout):
+    """Value for breaker.record() after a timed-out call.
+
+    A timeout shortened by the client's own time budget says nothing about the
+    instance, so it is not counted; only a call that ran out the configured
+    timeout is a failure.
+    """
+    return None if timeout < configured_timeout else False
+
+
+def open_response(error):
+    """(status_code, body) for a call rejected by an open circuit"""
+    return 503, {
+        'success': False,
+        'error': str(error),
+        'circuit_open': True,
+        'retry_after': round(error.retry_after),
+        'status_code': 503
+    }
+
+
+def fails_fast(body):
+    """True for failures produced locally (throttled, open circuit, spent deadline)"""
+    return any(body.get(flag) for flag in LOCAL_FAILURES)
+
+
+def deadline_from(budget):
+    """time.monotonic() deadline for a client time budget in seconds, or None when none (or an invalid one) was sent"""
+    try:
+        budget = float(budget)
+    except (TypeError, ValueError):
+        return None
+    if budget <= 0:
+        return None
+    return time.monotonic() + min(budget, REQUEST_MAX_BUDGET)
+
+
+def call_timeout(timeout, deadline):
+    """Timeout for the next outbound call: the configured one, shrunk to what is left of the deadline"""
+    if deadline is None:
+        return timeout
+    return min(timeout, deadline - time.monotonic())
+
+
+def deadline_response():
+    """(status_code, body) for a request whose time budget ran out before the call"""
+    return 504, {
+        'success': False,
+        'error': 'Request time budget exhausted before the Document AI call',
+        'deadline_exceeded': True,
+        'status_code': 504
+    }
+
+
+def get_stats():
+    return breaker.stats()
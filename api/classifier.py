@@ -0,0 +1,224 @@
+"""
+Offline document classifier used to pick an extraction schema.
+
+Looks at the document itself - the PDF text layer, page count and the
+keywords in the first lines - using only the standard library, and is
+bounded in the amount of data it inspects so it can run inline with a
+request. Returns a schema family from the registry plus a confidence score;
+callers fall back to the filename heuristic when confidence is low.
+"""
+import os
+import re
+import time
+import zlib
+import base64
+import binascii
+
+# Minimum confidence for a content-based decision to override the filename
+CLASSIFIER_MIN_CONFIDENCE = float(os.environ.get("CLASSIFIER_MIN_CONFIDENCE", "0.35"))
+# Work limits that keep classification in the low milliseconds
+MAX_SCAN_BYTES = 1024 * 1024
+MAX_STREAMS = 64
+MAX_TEXT_CHARS = 20000
+HEADER_CHARS = 600
+
+# (keyword, weight) per schema family; header hits count double
+FAMILY_KEYWORDS = {
+    'invoice': [
+        ('invoice', 3), ('invoice number', 3), ('invoice date', 2), ('bill to', 2), ('amount due', 2),
+        ('balance due', 2), ('due date', 1), ('subtotal', 1), ('remit to', 2), ('payment terms', 1)
+    ],
+    'receipt': [
+        ('receipt', 3), ('cashier', 2), ('change due', 2), ('thank you for', 1), ('transaction', 1),
+        ('visa', 1), ('mastercard', 1), ('store', 1)
+    ],
+    'purchase_order': [
+        ('purchase order', 4), ('po number', 3), ('p.o.', 2), ('order date', 1), ('ship to', 1),
+        ('vendor', 1), ('requested by', 1), ('delivery date', 1)
+    ],
+    'resume': [
+        ('resume', 3), ('curriculum vitae', 4), ('experience', 2), ('education', 2), ('skills', 2),
+        ('objective', 1), ('employment history', 3), ('references', 1), ('linkedin', 1)
+    ],
+    'contract': [
+        ('agreement', 3), ('whereas', 3), ('hereinafter', 3), ('parties', 2), ('governing law', 2),
+        ('in witness whereof', 3), ('terms and conditions', 1), ('effective date', 1)
+    ],
+    'sales': [
+        ('bill of sale', 4), ('proof of sale', 4), ('seller', 2), ('buyer', 2), ('sold to', 2),
+        ('sale price', 2)
+    ]
+}
+
+_INVOICE_HEADER = re.compile(r'invoice\s*(?:number|no\.?|#)', re.IGNORECASE)
+_INVOICE_NUMBER = re.compile(r'invoice\s*(?:number|no\.?|#)\s*[:.#]?\s*([A-Za-z0-9][A-Za-z0-9\-/]*)', re.IGNORECASE)
+_PAGE_COUNT = re.compile(rb'/Type\s*/Pages\b[^>]*?/Count\s+(\d+)|/Count\s+(\d+)[^>]*?/Type\s*/Pages\b', re.DOTALL)
+_PAGE_OBJECT = re.compile(rb'/Type\s*/Page(?![a-zA-Z])')
+_STREAM = re.compile(rb'<<(.{0,512}?)>>\s*stream\r?\n', re.DOTALL)
+_TEXT_OPERATOR = re.compile(rb'\((?:\\.|[^\\)])*\)\s*(?:Tj|\'|")|\[(?:\\.|[^\]])*\]\s*TJ', re.DOTALL)
+_LITERAL = re.compile(rb'\(((?:\\.|[^\\)])*)\)', re.DOTALL)
+_ESCAPE = re.compile(rb'\\([nrtbf()\\]|[0-7]{1,3})')
+_ESCAPES = {b'n': b'\n', b'r': b'\r', b't': b'\t', b'b': b'', b'f': b'', b'(': b'(', b')': b')', b'\\': b'\\'}
+_WHITESPACE = re.compile(r'\s+')
+
+
+def _unescape(match):
+    value = match.group(1)
+    if value in _ESCAPES:
+        return _ESCAPES[value]
+    return bytes([int(value, 8) & 0xFF])
+
+
+def _content_streams(data):
+    """Yield decoded PDF stream contents, bounded by MAX_STREAMS"""
+    for count, match in enumerate(_STREAM.finditer(data)):
+        if count >= MAX_STREAMS:
+            break
+        start = match.end()
+        end = data.find(b'endstream', start)
+        if end == -1:
+            break
+        raw = data[start:end]
+        if b'/FlateDecode' in match.group(1):
+            try:
+                raw = zlib.decompressobj().decompress(raw, 1024 * 1024)
+            except zlib.error:
+                continue
+        elif b'/Filter' in match.group(1):
+            # Images and other encodings carry no text layer
+            continue
+        yield raw
+
+
+def _stream_strings(stream):
+    """Yield the text shown by the Tj/TJ operators of one decoded content stream"""
+    for operator in _TEXT_OPERATOR.finditer(stream):
+        for literal in _LITERAL.findall(operator.group(0)):
+            yield _ESCAPE.sub(_unescape, literal).decode('latin-1')
+        yield ' '
+
+
+def content_text(stream, limit=MAX_TEXT_CHARS):
+    """Best-effort text of a single decoded content stream (e.g. one page)"""
+    parts = []
+    size = 0
+    for text in _stream_strings(stream):
+        parts.append(text)
+        size += len(text)
+        if size >= limit:
+            break
+    return _WHITESPACE.sub(' ', ''.join(parts))
+
+
+def pdf_text(data):
+    """Best-effort text layer of a PDF (literal strings of Tj/TJ operators)"""
+    parts = []
+    size = 0
+    for stream in _content_streams(data):
+        for text in _stream_strings(stream):
+            parts.append(text)
+            size += len(text)
+            if size >= MAX_TEXT_CHARS:
+                return _WHITESPACE.sub(' ', ''.join(parts))
+    return _WHITESPACE.sub(' ', ''.join(parts))
+
+
+def pdf_page_count(data):
+    """Page count from the page tree (/Count), falling back to counting page objects"""
+    counts = [int(a or b) for a, b in _PAGE_COUNT.findall(data)]
+    if counts:
+        return max(counts)
+    return len(_PAGE_OBJECT.findall(data))
+
+
+def invoice_header(text):
+    """Invoice number announced near the top of a page ('' if unnumbered, None if there is no invoice header)"""
+    header = text[:HEADER_CHARS]
+    match = _INVOICE_NUMBER.search(header)
+    if match:
+        return match.group(1).upper()
+    return '' if _INVOICE_HEADER.search(header) else None
+
+
+def score_text(text):
+    """Weighted keyword score per schema family"""
+    lowered = text.lower()
+    header = lowered[:HEADER_CHARS]
+    scores = {}
+    for family, keywords in FAMILY_KEYWORDS.items():
+        score = 0
+        for keyword, weight in keywords:
+            hits = min(lowered.count(keyword), 3)
+            if hits:
+                score += weight * hits
+                if keyword in header:
+                    score += weight
+        if score:
+            scores[family] = score
+    return scores
+
+
+def classify_content(data, mime_type='application/pdf'):
+    """Classify a document from its bytes.
+
+    Returns a dict with the schema family (or None), a 0-1 confidence, the page
+    count and the time spent in milliseconds.
+    """
+    started = time.perf_counter()
+    result = {'family': None, 'confidence': 0.0, 'page_count': None, 'scores': {}}
+
+    if data and (mime_type == 'application/pdf' or data[:5] == b'%PDF-'):
+        # Large files: the page tree and first pages are enough to decide
+        sample = data if len(data) <= MAX_SCAN_BYTES else data[:MAX_SCAN_BYTES // 2] + data[-MAX_SCAN_BYTES // 2:]
+        page_count = pdf_page_count(sample)
+        text = pdf_text(sample)
+        scores = score_text(text)
+
+        # Several invoice headers across several pages: a combined/batch document
+        if page_count > 1 and len(_INVOICE_HEADER.findall(text)) >= 2:
+            scores['multi_invoice'] = scores.pop('invoice', 0) + 5
+
+        result['page_count'] = page_count
+        result['scores'] = scores
+        if scores:
+            ranked = sorted(scores.values(), reverse=True)
+            top = ranked[0]
+            second = ranked[1] if len(ranked) > 1 else 0
+            result['family'] = max(scores, key=scores.get)
+            # Margin over the runner-up, damped when there is little evidence at all
+            result['confidence'] = round((top - second) / top * min(1.0, top / 8.0), 3)
+
+    result['elapsed_ms'] = round((time.perf_counter() - started) * 1000, 3)
+    return result
+
+
+def classify_base64(base64_data, mime_type='application/pdf'):
+    """Classify a base64-encoded document, decoding at most MAX_SCAN_BYTES of it"""
+    budget = (MAX_SCAN_BYTES // 2) // 3 * 4
+    try:
+        if len(base64_data) <= 2 * budget:
+            data = base64.b64decode(base64_data)
+        else:
+            # Head and tail samples, both aligned to 4-character base64 groups
+            tail_start = (len(base64_data) - budget) // 4 * 4
+            data = base64.b64decode(base64_data[:budget]) + base64.b64decode(base64_data[tail_start:])
+    except (binascii.Error, ValueError):
+        data = b''
+    return classify_content(data, mime_type)
+
+
+def classify_stream(stream, mime_type='application/pdf'):
+    """Classify a seekable binary stream, reading at most MAX_SCAN_BYTES of it"""
+    start = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell() - start
+    stream.seek(start)
+    if size <= MAX_SCAN_BYTES:
+        data = stream.read()
+    else:
+        # Head and tail samples, like classify_base64
+        data = stream.read(MAX_SCAN_BYTES // 2)
+        stream.seek(start + size - MAX_SCAN_BYTES // 2)
+        data += stream.read()
+    stream.seek(start)
+    return classify_content(data, mime_type)
@@ -0,0 +1,208 @@
+"""
+Confidence-score post-processing of extraction results.
+
+Extract-data is called with `extractDataWithConfidenceScore=true`, so every
+extracted field arrives as `{"value": ..., "confidence_score": ...}`. This
+walks a result, flags fields scored below a threshold and, when asked,
+builds a schema holding only those fields so they can be re-extracted on
+their own (optionally with a different model) instead of re-processing the
+whole document. Re-extracted fields replace the originals only when they
+score higher, and the merged result records which pass each flagged field
+came from.
+"""
+import os
+import copy
+
+# Post-processing configuration (overridable via environment variables)
+CONFIDENCE_THRESHOLD = float(os.environ.get("CONFIDENCE_THRESHOLD", "0.7"))
+CONFIDENCE_REEXTRACT = os.environ.get("CONFIDENCE_REEXTRACT", "false").lower() == "true"
+# Model used to re-extract low-confidence fields (empty: the model of the first pass)
+CONFIDENCE_REEXTRACT_MODEL = os.environ.get("CONFIDENCE_REEXTRACT_MODEL", "")
+# Above this many flagged fields a narrowed schema saves little; the result is returned as is
+CONFIDENCE_REEXTRACT_MAX_FIELDS = int(os.environ.get("CONFIDENCE_REEXTRACT_MAX_FIELDS", "50"))
+
+SOURCE_EXTRACTION = 'extraction'
+SOURCE_REEXTRACTION = 'reextraction'
+
+
+def _score(field):
+    score = field.get('confidence_score', field.get('confidence'))
+    try:
+        return float(score)
+    except (TypeError, ValueError):
+        return None
+
+
+def _is_field(node):
+    return isinstance(node, dict) and 'value' in node and ('confidence_score' in node or 'confidence' in node)
+
+
+def iter_fields(data, path=()):
+    """Yield (path, field) for every scored field; paths hold property names and list indices"""
+    if _is_field(data):
+        yield path, data
+    elif isinstance(data, dict):
+        for key, value in data.items():
+            yield from iter_fields(value, path + (key,))
+    elif isinstance(data, list):
+        for index, value in enumerate(data):
+            yield from iter_fields(value, path + (index,))
+
+
+def format_path(path):
+    """Display form of a field path, e.g. invoices[0].line_items[2].quantity"""
+    text = ''
+    for part in path:
+        text += f'[{part}]' if isinstance(part, int) else (f'.{part}' if text else part)
+    return text
+
+
+def find_low_confidence(data, threshold):
+    """Paths of the fields scored below `threshold` (fields without a score are never flagged)"""
+    low = []
+    for path, field in iter_fields(data):
+        score = _score(field)
+        if score is not None and score < threshold:
+            low.append(path)
+    return low
+
+
+def narrow_schema(schema, paths):
+    """JSON schema keeping only the properties along `paths`, or None when none of them are in it"""
+    if not isinstance(schema, dict):
+        return None
+    if any(not path for path in paths):
+        return schema
+
+    if isinstance(schema.get('properties'), dict):
+        grouped = {}
+        for path in paths:
+            if isinstance(path[0], str) and path[0] in schema['properties']:
+                grouped.setdefault(path[0], []).append(path[1:])
+        properties = {}
+        for key, sub_paths in grouped.items():
+            narrowed = narrow_schema(schema['properties'][key], sub_paths)
+            if narrowed is not None:
+                properties[key] = narrowed
+        if not properties:
+            return None
+        narrowed = dict(schema, properties=properties)
+        if 'required' in schema:
+            narrowed['required'] = [key for key in schema['required'] if key in properties]
+        return narrowed
+
+    if isinstance(schema.get('items'), dict):
+        items = narrow_schema(schema['items'], [path[1:] for path in paths if isinstance(path[0], int)])
+        return dict(schema, items=items) if items is not None else None
+    return None
+
+
+def _lookup(data, rerun, path):
+    """The rerun node at `path`, provided every list on the way has the same length in both results"""
+    for part in path:
+        if isinstance(part, int):
+            if not isinstance(data, list) or not isinstance(rerun, list) or len(data) != len(rerun):
+                return None
+        elif not isinstance(data, dict) or not isinstance(rerun, dict) or part not in rerun:
+            return None
+        data, rerun = data[part], rerun[part]
+    return rerun
+
+
+def merge(data, rerun, paths, ml_model=None):
+    """Merge re-extracted fields into a copy of `data`; returns (merged, field_sources).
+
+    A flagged field is replaced only when the re-extraction scored it higher.
+    `field_sources` maps every flagged path to the pass its value came from.
+    """
+    merged = copy.deepcopy(data)
+    sources = {}
+    for path in paths:
+        original = merged
+        for part in path:
+            original = original[part]
+        entry = {'source': SOURCE_EXTRACTION, 'confidence_score': _score(original)}
+
+        candidate = _lookup(data, rerun, path)
+        if _is_field(candidate):
+            score = _score(candidate)
+            if score is not None and score > (entry['confidence_score'] or 0.0):
+                parent = merged
+                for part in path[:-1]:
+                    parent = parent[part]
+                parent[path[-1]] = candidate
+                entry = {
+                    'source': SOURCE_REEXTRACTION,
+                    'confidence_score': score,
+                    'initial_confidence_score': entry['confidence_score'],
+                    'ml_model': ml_model
+                }
+        sources[format_path(path)] = entry
+    return merged, sources
+
+
+def resolve_threshold(threshold):
+    """Request threshold, or CONFIDENCE_THRESHOLD when none was sent"""
+    if threshold is None:
+        return CONFIDENCE_THRESHOLD
+    try:
+        return float(threshold)
+    except (TypeError, ValueError):
+        return CONFIDENCE_THRESHOLD
+
+
+def plan_review(data, schema, idp_config_name, threshold=None, reextract=None):
+    """Flag low-confidence fields and decide whether to re-extract them.
+
+    Returns (report, paths, narrowed_schema); `report` is None when flagging is
+    disabled (threshold <= 0) and `narrowed_schema` is None unless a
+    re-extraction should run. IDP configurations have no schema to narrow, so
+    their fields are flagged but never re-extracted.
+    """
+    threshold = resolve_threshold(threshold)
+    if threshold <= 0:
+        return None, [], None
+
+    paths = find_low_confidence(data, threshold)
+    report = {
+        'threshold': threshold,
+        'low_confidence_fields': [format_path(path) for path in paths],
+        'default_source': SOURCE_EXTRACTION
+    }
+    if not paths or not (CONFIDENCE_REEXTRACT if reextract is None else reextract):
+        return report, paths, None
+    if idp_config_name or not isinstance(schema, dict):
+        report['reextraction'] = {'skipped': 'IDP configurations cannot be narrowed to single fields'}
+        return report, paths, None
+    if len(paths) > CONFIDENCE_REEXTRACT_MAX_FIELDS:
+        report['reextraction'] = {'skipped': f'{len(paths)} fields flagged (limit {CONFIDENCE_REEXTRACT_MAX_FIELDS})'}
+        return report, paths, None
+
+    narrowed = narrow_schema(schema, paths)
+    if narrowed is None:
+        report['reextraction'] = {'skipped': 'Flagged fields are not in the schema'}
+    return report, paths, narrowed
+
+
+def reextract_model(ml_model):
+    """Model used for the re-extraction pass"""
+    return CONFIDENCE_REEXTRACT_MODEL or ml_model
+
+
+def apply_review(body, report, paths, rerun_status, rerun_body, ml_model, threshold, elapsed_ms):
+    """Fold a re-extraction outcome into a successful response body"""
+    reextraction = {'fields': len(paths), 'ml_model': ml_model, 'elapsed_ms': elapsed_ms}
+    if rerun_body['success']:
+        body['data'], report['field_sources'] = merge(body['data'], rerun_body['data'], paths, ml_model)
+        report['low_confidence_fields'] = [
+            format_path(path) for path in find_low_confidence(body['data'], resolve_threshold(threshold))
+        ]
+        reextraction['replaced'] = sum(
+            1 for entry in report['field_sources'].values() if entry['source'] == SOURCE_REEXTRACTION
+        )
+    else:
+        # The first-pass result stands; only the failure is reported
+        reextraction.update(error=rerun_body.get('error'), status_code=rerun_status)
+    report['reextraction'] = reextraction
+    body['confidence'] = report
+    return body
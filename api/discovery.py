@@ -0,0 +1,169 @@
+import os
+import time
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from api import salesforce_client
+
+SUPPORTED_VERSIONS = ['v65.0', 'v64.0', 'v63.0', 'v62.0', 'v61.0', 'v60.0']
+PROBE_TIMEOUT = 5
+DISCOVERY_CACHE_TTL = int(os.environ.get("DISCOVERY_CACHE_TTL", "600"))
+
+_cache = {}
+_cache_lock = threading.Lock()
+
+
+def _cache_key(instance_url, access_token):
+    """Key discovery results per instance, scoped to the token that proved access"""
+    token_hash = hashlib.sha256((access_token or '').encode('utf-8')).hexdigest()
+    return (instance_url.rstrip('/').lower(), token_hash)
+
+
+def _get_cached(key):
+    with _cache_lock:
+        entry = _cache.get(key)
+        if entry is None:
+            return None
+        expires_at, body = entry
+        if expires_at < time.monotonic():
+            del _cache[key]
+            return None
+        return body
+
+
+def _set_cached(key, body):
+    with _cache_lock:
+        _cache[key] = (time.monotonic() + DISCOVERY_CACHE_TTL, body)
+
+
+def clear_cache():
+    """Drop every cached discovery result"""
+    with _cache_lock:
+        _cache.clear()
+
+
+def versions_to_probe(current_version):
+    """Candidate versions in preference order, with the client's current version first"""
+    versions = list(SUPPORTED_VERSIONS)
+    if current_version in versions:
+        versions.remove(current_version)
+    versions.insert(0, current_version)
+    return versions
+
+
+def probe_version(instance_url, version, headers):
+    """Probe one API version. Returns (body, None) when Document AI works, else (None, reason)"""
+    # Imported on first use, with the pooled session (see salesforce_client)
+    import requests
+    try:
+        # 1. Check basic API access
+        api_url = f"{instance_url}/services/data/{version}"
+        resp = salesforce_client.get(api_url, headers=headers, timeout=PROBE_TIMEOUT)
+
+        if resp.status_code != 200:
+            return None, f"{version}: API not accessible ({resp.status_code})"
+
+        # 2. Check Document AI Configurations endpoint (confirms the IDP feature is enabled)
+        configs_url = f"{instance_url}/services/data/{version}/ssot/document-processing/configurations"
+        resp_conf = salesforce_client.get(configs_url, headers=headers, timeout=PROBE_TIMEOUT)
+
+        if resp_conf.status_code == 200:
+            return {
+                'success': True,
+                'message': f'Document AI is enabled and accessible on {version}',
+                'api_version': version,
+                'configurations': resp_conf.json()
+            }, None
+
+        if resp_conf.status_code == 404:
+            # 3. Try the Extract Data endpoint directly
+            extract_url = f"{instance_url}/services/data/{version}/ssot/document-processing/actions/extract-data"
+            resp_extract = salesforce_client.post(extract_url, headers=headers, json={}, timeout=PROBE_TIMEOUT)
+
+            # 400 Bad Request means it exists but payload was empty (GOOD)
+            # 405 Method Not Allowed means it exists (GOOD)
+            if resp_extract.status_code in [400, 405]:
+                return {
+                    'success': True,
+                    'message': f'Document AI Extract endpoint found on {version}',
+                    'api_version': version,
+                    'warning': 'Could not list configurations, but extraction endpoint exists.'
+                }, None
+
+            return None, f"{version}: IDP endpoints not found (404)"
+
+        return None, f"{version}: Error {resp_conf.status_code}"
+
+    except requests.exceptions.Timeout:
+        return None, f"{version}: Timeout"
+    except Exception as e:
+        return None, f"{version}: Error - {str(e)}"
+
+
+def discover(access_token, instance_url, current_version='v65.0', use_cache=True):
+    """Find the preferred working Document AI version, probing all candidates concurrently.
+
+    Returns (status_code, body). Successful discoveries are cached for DISCOVERY_CACHE_TTL seconds.
+    """
+    key = _cache_key(instance_url, access_token)
+    if use_cache:
+        cached = _get_cached(key)
+        if cached is not None:
+            body = dict(cached)
+            body['auto_updated'] = body['api_version'] != current_version
+            body['cached'] = True
+            return 200, body
+
+    headers = {
+        'Authorization': f'Bearer {access_token}',
+        'Content-Type': 'application/json'
+    }
+    versions = versions_to_probe(current_version)
+    outcomes = {}
+
+    executor = ThreadPoolExecutor(max_workers=len(versions))
+    try:
+        futures = {executor.submit(probe_version, instance_url, v, headers): v for v in versions}
+        pending = set(futures)
+        winner = None
+        while pending and winner is None:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                outcomes[futures[future]] = future.result()
+
+            # Early exit once the most preferred version with a known outcome works
+            # and every version ahead of it has already failed
+            for version in versions:
+                if version not in outcomes:
+                    break
+                body, _ = outcomes[version]
+                if body is not None:
+                    winner = body
+                    break
+    finally:
+        executor.shutdown(wait=False, cancel_futures=True)
+
+    if winner is not None:
+        _set_cached(key, winner)
+        body = dict(winner)
+        body['auto_updated'] = body['api_version'] != current_version
+        body['cached'] = False
+        return 200, body
+
+    # Every probe rejected the token: report it as such so callers can refresh and retry
+    reasons = [outcomes[v][1] for v in versions if v in outcomes]
+    if reasons and all(reason.endswith('(401)') for reason in reasons):
+        return 401, {
+            'success': False,
+            'error': 'Session expired or invalid. Please log in to Salesforce again.',
+            'details': reasons
+        }
+
+    # If we get here, no version worked
+    return 404, {
+        'success': False,
+        'error': 'Could not find working Document AI endpoint on any supported version.',
+        'details': reasons,
+        'suggestion': 'Ensure "Intelligent Document Processing" is enabled in Data Cloud Setup.'
+    }
@@ -0,0 +1,641 @@
+import os
+import json
+import time
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from api import salesforce_client
+from api import result_cache
+from api import schemas
+from api import pdf_split
+from api import image_preprocess
+from api import response_decoder
+from api import confidence
+from api import model_router
+from api import governor
+from api import circuit_breaker
+from api import metrics
+from api.streaming import ExtractDataBody
+
+# Batch packing limits (overridable via environment variables)
+BATCH_MAX_FILES = int(os.environ.get("BATCH_MAX_FILES", "10"))
+BATCH_MAX_PAYLOAD_BYTES = int(os.environ.get("BATCH_MAX_PAYLOAD_BYTES", str(20 * 1024 * 1024)))
+BATCH_CONCURRENCY = int(os.environ.get("BATCH_CONCURRENCY", "4"))
+EXTRACT_TIMEOUT = 160
+
+logger = logging.getLogger(__name__)
+
+# Rough JSON overhead of one {"mimeType": ..., "data": ...} entry in the files array
+_FILE_ENTRY_OVERHEAD = 64
+
+
+def build_extract_url(instance_url, api_version):
+    """Build the extract-data URL (confidence scores on, HTML encoding off)"""
+    return f"{instance_url}/services/data/{api_version}/ssot/document-processing/actions/extract-data?htmlEncode=false&extractDataWithConfidenceScore=true"
+
+
+def build_schema_config(schema):
+    """schemaConfig must be a JSON string (escaped), not an object"""
+    if isinstance(schema, dict):
+        # Registered schemas are serialized once at import
+        return schemas.registry.serialized(schema) or json.dumps(schema)
+    return schema or "{}"
+
+
+def build_extract_body(files, schema=None, ml_model=None, idp_config_name=None):
+    """Build a streamed extract-data body for one or more files"""
+    with metrics.span(metrics.PAYLOAD_BUILD):
+        return ExtractDataBody(
+            files,
+            schema_config=None if idp_config_name else build_schema_config(schema),
+            ml_model=ml_model,
+            idp_config_name=idp_config_name
+        )
+
+
+def post_extract(url, headers, body, timeout=EXTRACT_TIMEOUT):
+    """POST an extract-data body, recording time to first byte, download and base64 encode times"""
+    started = time.perf_counter()
+    response = salesforce_client.post(url, headers=headers, data=body.request_data(), timeout=timeout)
+    total = time.perf_counter() - started
+    # requests stops the elapsed clock once the response headers are parsed
+    first_byte = min(total, response.elapsed.total_seconds())
+    metrics.observe(metrics.TIME_TO_FIRST_BYTE, first_byte)
+    metrics.observe(metrics.DOWNLOAD, total - first_byte)
+    if body.encode_seconds:
+        metrics.observe(metrics.BASE64_ENCODE, body.encode_seconds)
+    return response
+
+
+def estimate_file_bytes(file_data):
+    """Approximate serialized size of a file entry in the files array"""
+    return len(file_data.get('base64_data') or '') + len(file_data.get('mime_type') or '') + _FILE_ENTRY_OVERHEAD
+
+
+def _batch_limit(name, value, cap):
+    if value is None:
+        return cap
+    if isinstance(value, bool) or not isinstance(value, (int, str)):
+        raise ValueError(f'{name} must be a positive integer')
+    try:
+        value = int(value)
+    except ValueError:
+        raise ValueError(f'{name} must be a positive integer')
+    if value < 1:
+        raise ValueError(f'{name} must be a positive integer')
+    return min(value, cap)
+
+
+def batch_limits(max_batch_size, max_payload_bytes):
+    """Client batch limits as integers capped at BATCH_MAX_FILES / BATCH_MAX_PAYLOAD_BYTES.
+
+    Raises ValueError (a 400 for the client) when either is not a positive integer.
+    """
+    return (_batch_limit('max_batch_size', max_batch_size, BATCH_MAX_FILES),
+            _batch_limit('max_payload_bytes', max_payload_bytes, BATCH_MAX_PAYLOAD_BYTES))
+
+
+def pack_batches(files, max_batch_size=None, max_payload_bytes=None, base_bytes=0):
+    """Group file indices into batches bounded by file count and payload bytes.
+
+    A single file larger than the byte budget is sent on its own rather than rejected.
+    """
+    max_batch_size, max_payload_bytes = batch_limits(max_batch_size, max_payload_bytes)
+
+    batches = []
+    current = []
+    current_bytes = base_bytes
+    for index, file_data in enumerate(files):
+        size = estimate_file_bytes(file_data)
+        if current and (len(current) >= max_batch_size or current_bytes + size > max_payload_bytes):
+            batches.append(current)
+            current = []
+            current_bytes = base_bytes
+        current.append(index)
+        current_bytes += size
+    if current:
+        batches.append(current)
+    return batches
+
+
+def error_message(text):
+    """Pull the most useful error message out of a failed Document AI response body"""
+    error_text = text
+    try:
+        error_json = json.loads(text)
+        if isinstance(error_json, list) and error_json:
+            error_json = error_json[0]
+        error_text = error_json.get('message', error_json.get('error', error_text))
+    except Exception:
+        pass
+    return error_text
+
+
+def _error_text(response):
+    return error_message(response.text)
+
+
+def _as_text(content):
+    # Successful bodies are decoded straight from bytes; only error paths need text
+    return content.decode('utf-8', 'replace') if isinstance(content, bytes) else content
+
+
+def interpret_response(status_code, content):
+    """Turn a single-file extract-data HTTP response (bytes or text) into (status_code, response body)"""
+    if status_code not in [200, 201]:
+        text = _as_text(content)
+        logger.error(f"API Error Response: {text[:500]}")
+        return status_code, {
+            'success': False,
+            'error': f'Document AI request failed: {error_message(text)}',
+            'status_code': status_code
+        }
+
+    try:
+        results = response_decoder.decode_response(content)
+    except ValueError as e:
+        logger.error(f"JSON Decode Error: {str(e)}")
+        return 500, {
+            'success': False,
+            'error': f'Error parsing response: {str(e)}',
+            'raw_response': _as_text(content[:500])
+        }
+
+    if not results:
+        raw_response = _as_text(content[:500])
+        logger.error(f"Unexpected response format (no data list): {raw_response}")
+        return 500, {
+            'success': False,
+            'error': 'Unexpected response format (no data list)',
+            'raw_response': raw_response
+        }
+
+    extracted_data, error = results[0]
+    if error:
+        logger.error(f"API returned error in data: {error}")
+        return 500, {
+            'success': False,
+            'error': error
+        }
+
+    return 200, {
+        'success': True,
+        'data': extracted_data
+    }
+
+
+def _run_batch(url, headers, files, indices, schema, ml_model, idp_config_name):
+    """Send one extract-data call and map every data[i] entry back to its source file"""
+    # Imported on first use, with the pooled session (see salesforce_client)
+    import requests
+    batch_files = [files[i] for i in indices]
+    body = build_extract_body(batch_files, schema, ml_model, idp_config_name)
+
+    try:
+        circuit_breaker.breaker.allow(url)
+    except circuit_breaker.CircuitOpen as e:
+        _, rejected = circuit_breaker.open_response(e)
+        return {i: dict(rejected) for i in indices}
+    try:
+        governor.governor.acquire(url)
+    except governor.GovernorTimeout as e:
+        circuit_breaker.breaker.record(url, None)
+        _, throttled = governor.throttled_response(e)
+        return {i: dict(throttled) for i in indices}
+
+    response = None
+    try:
+        response = post_extract(url, headers, body)
+    except requests.exceptions.RequestException as e:
+        return {i: {'success': False, 'error': f'Network error: {str(e)}'} for i in indices}
+    finally:
+        governor.governor.release(url, *((response.status_code, response.headers) if response is not None else ()))
+        circuit_breaker.breaker.record(url, circuit_breaker.outcome(response.status_code)
+                                       if response is not None else False)
+
+    if response.status_code not in [200, 201]:
+        error = f'Document AI request failed: {_error_text(response)}'
+        return {i: {'success': False, 'error': error, 'status_code': response.status_code} for i in indices}
+
+    try:
+        entries = response_decoder.decode_response(response.content)
+    except ValueError as e:
+        return {i: {'success': False, 'error': f'Error parsing response: {str(e)}'} for i in indices}
+
+    results = {}
+    for position, index in enumerate(indices):
+        if position >= len(entries):
+            results[index] = {'success': False, 'error': 'No result returned for this file'}
+            continue
+        data, error = entries[position]
+        if error:
+            results[index] = {'success': False, 'error': error}
+        else:
+            results[index] = {'success': True, 'data': data}
+    return results
+
+
+def should_retry_chunk(status_code, body):
+    """Page chunks are retried alone on timeouts, throttling and server errors (not local rejections)"""
+    return not body['success'] and not circuit_breaker.fails_fast(body) and (status_code >= 500 or status_code == 429)
+
+
+def _extract_chunk(access_token, instance_url, api_version, file_data, schema, ml_model, timeout, use_cache,
+                   deadline):
+    """Extract one page chunk, retrying it alone on timeouts and server errors"""
+    for attempt in range(pdf_split.PDF_SPLIT_RETRIES + 1):
+        # Chunks skip the confidence review; the merged result is reviewed once
+        status_code, body = _extract_document(access_token, instance_url, api_version, file_data, schema, ml_model,
+                                              None, timeout, use_cache, False, None, deadline)
+        if not should_retry_chunk(status_code, body):
+            break
+    return status_code, body
+
+
+def plan_split(file_data, schema, idp_config_name):
+    """Cut a large multi-invoice PDF into page chunks.
+
+    Returns (chunks, chunk_files, page_count), or None when the document should be sent whole.
+    """
+    if idp_config_name or not pdf_split.available() or not pdf_split.is_multi_invoice_schema(schema):
+        return None
+    stream = file_data.get('stream')
+    start = stream.tell() if stream is not None else None
+    try:
+        return _plan_split(file_data)
+    finally:
+        # The PDF reader moves the stream; a document sent whole must be read from its start
+        if stream is not None:
+            stream.seek(start)
+
+
+def _plan_split(file_data):
+    reader = pdf_split.open_pdf(file_data)
+    if reader is None or len(reader.pages) < pdf_split.PDF_SPLIT_MIN_PAGES:
+        return None
+
+    page_count = len(reader.pages)
+    chunks = pdf_split.plan_chunks(page_count, pdf_split.find_boundaries(reader))
+    if len(chunks) < 2:
+        return None
+
+    chunk_files = [
+        {'mime_type': 'application/pdf', 'base64_data': pdf_split.write_chunk(reader, start, end)}
+        for start, end in chunks
+    ]
+    logger.info(f"Splitting {page_count}-page document into {len(chunks)} chunks")
+    return chunks, chunk_files, page_count
+
+
+def merge_split(chunks, outcomes, page_count):
+    """Merge per-chunk (status_code, body) outcomes into (status_code, body, complete)"""
+    results = [body['data'] if body['success'] else None for _, body in outcomes]
+    chunk_errors = [
+        {'pages': f'{start + 1}-{end}', 'error': body.get('error'), 'status_code': status_code}
+        for (start, end), (status_code, body) in zip(chunks, outcomes) if not body['success']
+    ]
+    split_info = {'chunks': len(chunks), 'pages': page_count, 'failed_chunks': len(chunk_errors)}
+
+    if len(chunk_errors) == len(chunks):
+        status_code, body = outcomes[0]
+        return status_code, dict(body, split=split_info, chunk_errors=chunk_errors), False
+
+    body = {
+        'success': True,
+        'data': pdf_split.merge_results(chunks, results, page_count),
+        'split': split_info
+    }
+    if chunk_errors:
+        body['chunk_errors'] = chunk_errors
+    return 200, body, not chunk_errors
+
+
+def _extract_split(access_token, instance_url, api_version, plan, schema, ml_model, timeout, use_cache, deadline):
+    """Extract the page chunks of a split plan concurrently and merge the invoices"""
+    chunks, chunk_files, page_count = plan
+    workers = max(1, min(pdf_split.PDF_SPLIT_CONCURRENCY, len(chunks)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        outcomes = list(executor.map(
+            metrics.bind(lambda chunk_file: _extract_chunk(access_token, instance_url, api_version, chunk_file,
+                                                           schema, ml_model, timeout, use_cache, deadline)),
+            chunk_files
+        ))
+    return merge_split(chunks, outcomes, page_count)
+
+
+# Steps of one extraction shared by this module and the asyncio server (backend/app_async.py),
+# which awaits the network call and runs the blocking steps on its thread pool
+
+
+def lookup_cache(use_cache, instance_url, file_data, schema, ml_model, idp_config_name, api_version):
+    """(cache, cache_key, cached response or None); hashes the file and may read the disk cache"""
+    cache = result_cache.result_cache if use_cache else None
+    if cache is None:
+        return None, None, None
+    cache_key = result_cache.make_key(instance_url, file_data, schema, ml_model, idp_config_name, api_version)
+    cached = cache.get(cache_key)
+    if cached is None:
+        return cache, cache_key, None
+    logger.info("Document AI result served from cache")
+    return cache, cache_key, (200, {
+        'success': True,
+        'data': cached,
+        'cached': True
+    })
+
+
+def store_result(cache, cache_key, body, complete):
+    """Cache a finished extraction; partial merges are not cached so a retry re-runs the failed chunks"""
+    if complete and cache is not None:
+        cache.set(cache_key, body['data'])
+
+
+def prepare_call(access_token, instance_url, api_version, file_data, schema, ml_model, idp_config_name):
+    """(url, headers, body) of one extract-data call; building the body scans the file's base64 once"""
+    url = build_extract_url(instance_url, api_version)
+    headers = {
+        'Content-Type': 'application/json',
+        'Authorization': f'Bearer {access_token}'
+    }
+    # Stream the payload instead of building and serializing it in memory
+    body = build_extract_body([file_data], schema, ml_model, idp_config_name)
+    logger.info(f"Document AI request: {url} ({len(body)} bytes)")
+    return url, headers, body
+
+
+def admit(url, timeout, deadline):
+    """Deadline and circuit checks made before the governor: a response when the call must not go out, else None"""
+    if circuit_breaker.call_timeout(timeout, deadline) <= 0:
+        return circuit_breaker.deadline_response()
+    try:
+        circuit_breaker.breaker.allow(url)
+    except circuit_breaker.CircuitOpen as e:
+        logger.warning(str(e))
+        return circuit_breaker.open_response(e)
+    return None
+
+
+def governor_rejected(url, error, deadline):
+    """Response for a call the governor did not let through in time"""
+    circuit_breaker.breaker.record(url, None)
+    logger.warning(str(error))
+    if deadline is not None and time.monotonic() >= deadline:
+        return circuit_breaker.deadline_response()
+    return governor.throttled_response(error)
+
+
+def admitted_timeout(url, timeout, deadline):
+    """(timeout, None) for a call the governor let through, or (0, response) after giving its slot back.
+
+    The outbound timeout is whatever is left of the client's time budget.
+    """
+    remaining = circuit_breaker.call_timeout(timeout, deadline)
+    if remaining <= 0:
+        governor.governor.release(url)
+        circuit_breaker.breaker.record(url, None)
+        return 0, circuit_breaker.deadline_response()
+    return remaining, None
+
+
+def release_call(url, outcome, status_code=None, headers=None):
+    """Give the governor slot back and report the call's outcome to the circuit breaker"""
+    governor.governor.release(url, *((status_code, headers) if status_code is not None else ()))
+    circuit_breaker.breaker.record(url, outcome)
+
+
+def call_model(ml_model, idp_config_name):
+    """Name a call is recorded under in the model stats"""
+    return f'idp:{idp_config_name}' if idp_config_name else ml_model
+
+
+def network_error(model, elapsed_ms, error, timed_out):
+    """(status_code, body) for a call that got no response"""
+    model_router.stats.record(model, elapsed_ms, False, timeout=timed_out)
+    return 500, {
+        'success': False,
+        'error': f'Network error: {str(error) or type(error).__name__}'
+    }
+
+
+def call_result(model, elapsed_ms, status_code, content):
+    """(status_code, body) for a call that got a response"""
+    logger.info(f"API Response Status: {status_code}")
+    status_code, result = interpret_response(status_code, content)
+    model_router.stats.record(model, elapsed_ms, result['success'])
+    return status_code, result
+
+
+def plan_models(file_data, schema, ml_model, idp_config_name, model_fallback):
+    """(models to try in order, routing info or None); routing 'auto' classifies the document"""
+    routing = None
+    if not idp_config_name and model_router.is_auto(ml_model):
+        ml_model, routing = model_router.route(file_data, schema)
+        logger.info(f"Routed to {ml_model} ({routing['reason']})")
+    models = [ml_model] if idp_config_name else model_router.cascade(ml_model, model_fallback)
+    return models, routing
+
+
+def start_attempt(models, position):
+    """Record a move down the model chain before trying models[position]"""
+    if position:
+        model_router.stats.record_fallback(models[position - 1])
+        logger.warning(f"Falling back from {models[position - 1]} to {models[position]}")
+
+
+def attempt_entry(model, status_code, body, elapsed_ms):
+    """One entry of a response's model_routing attempts"""
+    return {'ml_model': model, 'status_code': status_code, 'success': body['success'],
+            'elapsed_ms': round(elapsed_ms, 1)}
+
+
+def finish_attempts(body, model, routing, attempts):
+    """Label the request with the model that produced its response and describe the routing"""
+    metrics.label(ml_model=model)
+    if routing is not None or len(attempts) > 1:
+        body['model_routing'] = dict(routing or {'routed': False}, ml_model=model, attempts=attempts)
+
+
+def plan_reextract(body, schema, ml_model, idp_config_name, confidence_threshold, reextract):
+    """(report, paths, narrowed schema, model) when low-confidence fields are to be re-extracted, else None.
+
+    When there is a report but nothing to re-extract it is attached to `body` here.
+    """
+    report, paths, narrowed = confidence.plan_review(body['data'], schema, idp_config_name,
+                                                     confidence_threshold, reextract)
+    if report is None:
+        return None
+    if narrowed is None:
+        body['confidence'] = report
+        return None
+    model = confidence.reextract_model(ml_model)
+    logger.info(f"Re-extracting {len(paths)} low-confidence fields with {model}")
+    return report, paths, narrowed, model
+
+
+def _extract_single(access_token, instance_url, api_version, file_data, schema, ml_model, idp_config_name, timeout,
+                    deadline):
+    """Send one extract-data call and return (status_code, response body)"""
+    import requests
+    url, headers, body = prepare_call(access_token, instance_url, api_version, file_data, schema, ml_model,
+                                      idp_config_name)
+    rejected = admit(url, timeout, deadline)
+    if rejected:
+        return rejected
+    try:
+        governor.governor.acquire(url, deadline)
+    except governor.GovernorTimeout as e:
+        return governor_rejected(url, e, deadline)
+    configured_timeout = timeout
+    timeout, rejected = admitted_timeout(url, timeout, deadline)
+    if rejected:
+        return rejected
+
+    model = call_model(ml_model, idp_config_name)
+    started = time.perf_counter()
+    response = None
+    outcome = False
+    try:
+        response = post_extract(url, headers, body, timeout)
+        outcome = circuit_breaker.outcome(response.status_code)
+    except requests.exceptions.RequestException as e:
+        timed_out = isinstance(e, requests.exceptions.Timeout)
+        if timed_out:
+            outcome = circuit_breaker.timeout_outcome(timeout, configured_timeout)
+        return network_error(model, (time.perf_counter() - started) * 1000, e, timed_out)
+    finally:
+        release_call(url, outcome, *((response.status_code, response.headers) if response is not None else ()))
+    return call_result(model, (time.perf_counter() - started) * 1000, response.status_code, response.content)
+
+
+def _review_confidence(body, access_token, instance_url, api_version, file_data, schema, ml_model, idp_config_name,
+                       timeout, use_cache, preprocess, confidence_threshold, reextract, deadline):
+    """Flag low-confidence fields and re-extract just those with a narrowed schema when enabled"""
+    plan = plan_reextract(body, schema, ml_model, idp_config_name, confidence_threshold, reextract)
+    if plan is None:
+        return body
+    report, paths, narrowed, model = plan
+    started = time.perf_counter()
+    with metrics.labels(ml_model=model):
+        status_code, rerun = extract_document(
+            access_token, instance_url, api_version, file_data,
+            schema=narrowed, ml_model=model, timeout=timeout, use_cache=use_cache, split=False,
+            preprocess=preprocess, confidence_threshold=0, deadline=deadline
+        )
+    elapsed_ms = round((time.perf_counter() - started) * 1000, 1)
+    return confidence.apply_review(body, report, paths, status_code, rerun, model, confidence_threshold, elapsed_ms)
+
+
+def _extract_with_fallback(access_token, instance_url, api_version, file_data, schema, ml_model, idp_config_name,
+                           timeout, use_cache, split, preprocess, model_fallback, deadline):
+    """Extract with `ml_model`, moving down the model chain on timeouts and server errors"""
+    models, routing = plan_models(file_data, schema, ml_model, idp_config_name, model_fallback)
+    attempts = []
+    for position, model in enumerate(models):
+        start_attempt(models, position)
+        started = time.perf_counter()
+        with metrics.labels(ml_model=model):
+            status_code, body = _extract_document(access_token, instance_url, api_version, file_data, schema, model,
+                                                  idp_config_name, timeout, use_cache, split, preprocess, deadline)
+        attempts.append(attempt_entry(model, status_code, body, (time.perf_counter() - started) * 1000))
+        if not model_router.should_fall_back(status_code, body):
+            break
+
+    # The request is recorded under the model that produced its response
+    finish_attempts(body, model, routing, attempts)
+    return status_code, body, model
+
+
+def extract_document(access_token, instance_url, api_version, file_data, schema=None, ml_model=None,
+                     idp_config_name=None, timeout=EXTRACT_TIMEOUT, use_cache=True, split=True, preprocess=None,
+                     confidence_threshold=None, reextract=None, model_fallback=None, deadline=None):
+    """Run one extract-data call for a single file and return (status_code, response body).
+
+    Successful results are cached by content hash; pass use_cache=False to bypass the cache.
+    Large multi-invoice PDFs are split into page chunks extracted concurrently unless split=False.
+    Images are shrunk first when preprocessing is enabled (IMAGE_PREPROCESS, or preprocess=True).
+    ml_model='auto' picks a model for the document; timeouts and server errors fall back to the
+    next model of MODEL_CHAIN unless model_fallback=False (MODEL_FALLBACK).
+    Fields scored below confidence_threshold (CONFIDENCE_THRESHOLD; 0 disables) are flagged and,
+    with reextract (CONFIDENCE_REEXTRACT), re-extracted on their own.
+    deadline (a time.monotonic() value) caps the timeout of every outbound call made on the way.
+    """
+    status_code, body, ml_model = _extract_with_fallback(access_token, instance_url, api_version, file_data, schema,
+                                                         ml_model, idp_config_name, timeout, use_cache, split,
+                                                         preprocess, model_fallback, deadline)
+    if body['success']:
+        body = _review_confidence(body, access_token, instance_url, api_version, file_data, schema, ml_model,
+                                  idp_config_name, timeout, use_cache, preprocess, confidence_threshold, reextract,
+                                  deadline)
+    return status_code, body
+
+
+def _extract_document(access_token, instance_url, api_version, file_data, schema, ml_model, idp_config_name,
+                      timeout, use_cache, split, preprocess, deadline):
+    started = time.perf_counter()
+    cache, cache_key, cached = lookup_cache(use_cache, instance_url, file_data, schema, ml_model, idp_config_name,
+                                            api_version)
+    if cached is not None:
+        return cached
+
+    # Cache keys use the original bytes, so a hit never pays for preprocessing
+    preprocessing = None
+    if image_preprocess.should_preprocess(file_data, preprocess):
+        file_data, preprocessing = image_preprocess.preprocess(file_data)
+
+    plan = plan_split(file_data, schema, idp_config_name) if split else None
+    if plan is not None:
+        status_code, body, complete = _extract_split(access_token, instance_url, api_version, plan, schema,
+                                                     ml_model, timeout, use_cache, deadline)
+    else:
+        status_code, body = _extract_single(access_token, instance_url, api_version, file_data, schema,
+                                            ml_model, idp_config_name, timeout, deadline)
+        complete = body['success']
+
+    store_result(cache, cache_key, body, complete)
+    if preprocessing is not None:
+        body['preprocessing'] = dict(preprocessing, total_ms=round((time.perf_counter() - started) * 1000, 1))
+    return status_code, body
+
+
+def extract_batch(access_token, instance_url, api_version, files, schema=None, ml_model=None,
+                  idp_config_name=None, max_batch_size=None, max_payload_bytes=None):
+    """Extract many files using as few extract-data calls as the batch limits allow"""
+    url = build_extract_url(instance_url, api_version)
+    headers = {
+        'Content-Type': 'application/json',
+        'Authorization': f'Bearer {access_token}'
+    }
+
+    if not idp_config_name and model_router.is_auto(ml_model):
+        # One model per batch call: routed on the schema alone
+        ml_model, _ = model_router.route(None, schema)
+
+    base_bytes = 0 if idp_config_name else len(build_schema_config(schema))
+    batches = pack_batches(files, max_batch_size, max_payload_bytes, base_bytes)
+
+    merged = {}
+    workers = max(1, min(BATCH_CONCURRENCY, len(batches)))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [
+            executor.submit(metrics.bind(_run_batch), url, headers, files, indices, schema, ml_model, idp_config_name)
+            for indices in batches
+        ]
+        for future in futures:
+            merged.update(future.result())
+
+    results = []
+    for index, file_data in enumerate(files):
+        result = {'index': index, 'filename': file_data.get('filename')}
+        result.update(merged[index])
+        results.append(result)
+
+    succeeded = sum(1 for r in results if r['success'])
+    return {
+        'results': results,
+        'summary': {
+            'total_files': len(files),
+            'succeeded': succeeded,
+            'failed': len(files) - succeeded,
+            'api_calls': len(batches)
+        }
+    }
@@ -0,0 +1,253 @@
+"""
+Per-org governor for outbound Document AI calls.
+
+Every extract-data call to a Salesforce instance takes a slot from that
+instance's governor: a token bucket bounds the call rate, a cap bounds the
+calls in flight, and callers queue for at most GOVERNOR_MAX_WAIT seconds
+before being turned away locally instead of adding to an org that is already
+over its limits. `Retry-After` on 429/503 responses pauses the org, and the
+`Sforce-Limit-Info` usage header slows the bucket down as the org approaches
+its API limit. Limits are per process.
+"""
+import os
+import time
+import threading
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlparse
+
+# Governor configuration (overridable via environment variables)
+GOVERNOR = os.environ.get("GOVERNOR", "true").lower() == "true"
+GOVERNOR_RATE = float(os.environ.get("GOVERNOR_RATE", "5"))
+GOVERNOR_BURST = int(os.environ.get("GOVERNOR_BURST", "10"))
+GOVERNOR_MAX_IN_FLIGHT = int(os.environ.get("GOVERNOR_MAX_IN_FLIGHT", "10"))
+GOVERNOR_MAX_WAIT = float(os.environ.get("GOVERNOR_MAX_WAIT", "30"))
+# Share of the org's API limit from which the call rate is scaled down
+GOVERNOR_USAGE_HIGH_WATER = float(os.environ.get("GOVERNOR_USAGE_HIGH_WATER", "0.9"))
+# Pause used for a 429/503 that carries no Retry-After
+GOVERNOR_DEFAULT_BACKOFF = float(os.environ.get("GOVERNOR_DEFAULT_BACKOFF", "5"))
+
+# Slowest the bucket is scaled to near the API limit (share of GOVERNOR_RATE)
+_MIN_RATE_FACTOR = 0.1
+# Async waiters poll at this interval while every slot is taken
+_ASYNC_POLL = 0.05
+
+
+class GovernorTimeout(Exception):
+    """Raised when no slot frees up for an org before the caller's deadline"""
+
+    def __init__(self, org, waited):
+        super().__init__(f'Salesforce org {org} is at its Document AI call limit (waited {waited:.1f}s)')
+        self.org = org
+        self.waited = waited
+
+
+def org_key(url):
+    """scheme://host of the Salesforce instance a URL targets"""
+    parsed = urlparse(url)
+    return f"{parsed.scheme or 'https'}://{parsed.netloc or parsed.path}".lower().rstrip('/')
+
+
+def parse_retry_after(value, now=None):
+    """Seconds to wait from a Retry-After header (delta-seconds or HTTP date), or None"""
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - (now or time.time()))
+    except (TypeError, ValueError, IndexError):
+        return None
+
+
+def parse_limit_info(value):
+    """(used, limit) from a Sforce-Limit-Info header such as 'api-usage=25/15000', or None"""
+    for part in (value or '').split(','):
+        name, _, usage = part.strip().partition('=')
+        if name.strip() == 'api-usage' and '/' in usage:
+            used, _, limit = usage.partition('/')
+            try:
+                return int(used), int(limit)
+            except ValueError:
+                return None
+    return None
+
+
+class _OrgState:
+    def __init__(self, rate, burst, max_in_flight):
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.tokens = float(burst)
+        self.refilled_at = time.monotonic()
+        self.in_flight = 0
+        self.waiting = 0
+        self.blocked_until = 0.0
+        self.api_usage = None
+        self.counters = {'admitted': 0, 'rejected': 0, 'throttled_responses': 0, 'wait_total_s': 0.0}
+
+    def effective_rate(self):
+        if not self.api_usage or not self.api_usage[1]:
+            return self.rate
+        ratio = self.api_usage[0] / self.api_usage[1]
+        if ratio < GOVERNOR_USAGE_HIGH_WATER:
+            return self.rate
+        headroom = max(0.0, 1.0 - ratio) / max(1e-9, 1.0 - GOVERNOR_USAGE_HIGH_WATER)
+        return self.rate * max(_MIN_RATE_FACTOR, headroom)
+
+    def try_acquire(self, now):
+        """Take a slot and return 0, or return how long to wait before trying again (None: until a release)"""
+        self.tokens = min(self.burst, self.tokens + (now - self.refilled_at) * self.effective_rate())
+        self.refilled_at = now
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.in_flight >= self.max_in_flight:
+            return None
+        if self.tokens < 1.0:
+            return (1.0 - self.tokens) / self.effective_rate()
+        self.tokens -= 1.0
+        self.in_flight += 1
+        return 0
+
+
+class Governor:
+    """Token bucket plus in-flight cap per Salesforce org, shared by threads and the event loop"""
+
+    def __init__(self, rate=GOVERNOR_RATE, burst=GOVERNOR_BURST, max_in_flight=GOVERNOR_MAX_IN_FLIGHT,
+                 max_wait=GOVERNOR_MAX_WAIT, enabled=GOVERNOR):
+        self.rate = rate
+        self.burst = burst
+        self.max_in_flight = max_in_flight
+        self.max_wait = max_wait
+        self.enabled = enabled
+        self._orgs = {}
+        self._lock = threading.Lock()
+        self._released = threading.Condition(self._lock)
+
+    def _state(self, org):
+        state = self._orgs.get(org)
+        if state is None:
+            state = self._orgs[org] = _OrgState(self.rate, self.burst, self.max_in_flight)
+        return state
+
+    def _deadline(self, deadline):
+        limit = time.monotonic() + self.max_wait
+        return limit if deadline is None else min(deadline, limit)
+
+    def acquire(self, url, deadline=None):
+        """Block until the org has a free slot; `deadline` is a time.monotonic() value"""
+        if not self.enabled:
+            return
+        org = org_key(url)
+        started = time.monotonic()
+        deadline = self._deadline(deadline)
+        with self._lock:
+            state = self._state(org)
+            state.waiting += 1
+            try:
+                while True:
+                    now = time.monotonic()
+                    wait = state.try_acquire(now)
+                    if wait == 0:
+                        state.counters['admitted'] += 1
+                        state.counters['wait_total_s'] += now - started
+                        return
+                    if now >= deadline:
+                        state.counters['rejected'] += 1
+                        raise GovernorTimeout(org, now - started)
+                    self._released.wait(deadline - now if wait is None else min(wait, deadline - now))
+            finally:
+                state.waiting -= 1
+
+    async def acquire_async(self, url, deadline=None):
+        """Event-loop counterpart of acquire (sleeps instead of blocking a thread)"""
+        # Imported here so the thread-based handlers never load asyncio
+        import asyncio
+        if not self.enabled:
+            return
+        org = org_key(url)
+        started = time.monotonic()
+        deadline = self._deadline(deadline)
+        with self._lock:
+            self._state(org).waiting += 1
+        try:
+            while True:
+                with self._lock:
+                    state = self._state(org)
+                    now = time.monotonic()
+                    wait = state.try_acquire(now)
+                    if wait == 0:
+                        state.counters['admitted'] += 1
+                        state.counters['wait_total_s'] += now - started
+                        return
+                    if now >= deadline:
+                        state.counters['rejected'] += 1
+                        raise GovernorTimeout(org, now - started)
+                await asyncio.sleep(min(_ASYNC_POLL if wait is None else wait, deadline - now))
+        finally:
+            with self._lock:
+                self._state(org).waiting -= 1
+
+    def release(self, url, status_code=None, headers=None):
+        """Free the slot taken for a call and learn from its response status and headers"""
+        if not self.enabled:
+            return
+        with self._lock:
+            state = self._state(org_key(url))
+            state.in_flight = max(0, state.in_flight - 1)
+            if headers is not None:
+                usage = parse_limit_info(headers.get('Sforce-Limit-Info'))
+                if usage is not None:
+                    state.api_usage = usage
+            if status_code in (429, 503):
+                state.counters['throttled_responses'] += 1
+                pause = parse_retry_after(headers.get('Retry-After') if headers is not None else None)
+                pause = GOVERNOR_DEFAULT_BACKOFF if pause is None else pause
+                state.blocked_until = max(state.blocked_until, time.monotonic() + pause)
+            self._released.notify_all()
+
+    def stats(self):
+        """Current usage per org"""
+        now = time.monotonic()
+        with self._lock:
+            orgs = {}
+            for org, state in self._orgs.items():
+                admitted = state.counters['admitted']
+                orgs[org] = dict(
+                    state.counters,
+                    wait_total_s=round(state.counters['wait_total_s'], 3),
+                    avg_wait_ms=round(state.counters['wait_total_s'] / admitted * 1000, 1) if admitted else 0.0,
+                    in_flight=state.in_flight,
+                    waiting=state.waiting,
+                    tokens=round(min(state.burst, state.tokens + (now - state.refilled_at) * state.effective_rate()), 2),
+                    rate=round(state.effective_rate(), 3),
+                    blocked_for_s=round(max(0.0, state.blocked_until - now), 1),
+                    api_usage={'used': state.api_usage[0], 'limit': state.api_usage[1]} if state.api_usage else None
+                )
+        return {
+            'enabled': self.enabled,
+            'rate': self.rate,
+            'burst': self.burst,
+            'max_in_flight': self.max_in_flight,
+            'max_wait': self.max_wait,
+            'orgs': orgs
+        }
+
+
+governor = Governor()
+
+
+def throttled_response(error):
+    """(status_code, body) for a call turned away locally; it is not retried or sent to another model"""
+    return 429, {
+        'success': False,
+        'error': str(error),
+        'throttled': True,
+        'status_code': 429
+    }
+
+
+def get_stats():
+    """Usage of the shared governor"""
+    return governor.stats()
@@ -0,0 +1,186 @@
+"""
+Optional image preprocessing before an extract-data request.
+
+Scanned images are usually sent at full resolution and in whatever format the
+scanner produced. This converts BMP/TIFF to compressed formats, downscales to
+a target DPI, drops colour from scans that are effectively grayscale and turns
+multi-page TIFFs into a single PDF. Requires the optional `Pillow` package;
+without it files are sent unchanged. Pillow is imported the first time an
+image is preprocessed, not when the module loads.
+"""
+import io
+import os
+import time
+import base64
+import logging
+import importlib.util
+
+from api import metrics
+
+# Preprocessing configuration (overridable via environment variables)
+IMAGE_PREPROCESS = os.environ.get("IMAGE_PREPROCESS", "false").lower() == "true"
+IMAGE_TARGET_DPI = int(os.environ.get("IMAGE_TARGET_DPI", "200"))
+IMAGE_GRAYSCALE = os.environ.get("IMAGE_GRAYSCALE", "auto")
+IMAGE_JPEG_QUALITY = int(os.environ.get("IMAGE_JPEG_QUALITY", "85"))
+# Long side of a page, used when an image carries no DPI metadata
+IMAGE_PAGE_INCHES = float(os.environ.get("IMAGE_PAGE_INCHES", "11"))
+
+PREPROCESS_MIME_TYPES = {'image/tiff', 'image/bmp', 'image/png', 'image/jpeg'}
+# Formats the API accepts as-is; these are only replaced when the result is smaller
+PASSTHROUGH_MIME_TYPES = {'image/png', 'image/jpeg'}
+# Maximum per-channel difference for a colour image to count as grayscale
+GRAYSCALE_TOLERANCE = 24
+
+logger = logging.getLogger(__name__)
+
+# Looked up without importing the package
+_PIL_INSTALLED = importlib.util.find_spec('PIL') is not None
+Image = ImageChops = ImageSequence = None
+
+
+def _load_pil():
+    """Import the Pillow modules used here into module globals on first use"""
+    global Image, ImageChops, ImageSequence
+    if Image is None:
+        from PIL import Image, ImageChops, ImageSequence
+
+
+def available():
+    """Whether the imaging library is installed"""
+    return _PIL_INSTALLED
+
+
+def should_preprocess(file_data, enabled=None):
+    """Whether a file entry is an image that preprocessing applies to"""
+    enabled = IMAGE_PREPROCESS if enabled is None else enabled
+    return bool(enabled) and available() and file_data.get('mime_type') in PREPROCESS_MIME_TYPES
+
+
+def _read_bytes(file_data):
+    stream = file_data.get('stream')
+    if stream is not None:
+        start = stream.tell()
+        raw = stream.read()
+        stream.seek(start)
+        return raw
+    with metrics.span(metrics.BASE64_DECODE):
+        return base64.b64decode(file_data.get('base64_data') or '')
+
+
+def _scale(image):
+    """Resize factor that brings the image down to IMAGE_TARGET_DPI (never upscales)"""
+    dpi = image.info.get('dpi')
+    if dpi and max(dpi) > 0:
+        ratio = IMAGE_TARGET_DPI / float(max(dpi))
+    else:
+        ratio = IMAGE_TARGET_DPI * IMAGE_PAGE_INCHES / float(max(image.size))
+    return min(1.0, ratio)
+
+
+def _is_grayscale(image):
+    """True when the colour channels of a sampled grid of pixels are nearly identical"""
+    sample = image.resize((256, 256), Image.NEAREST).convert('RGB')
+    red, green, blue = sample.split()
+    return max(
+        ImageChops.difference(red, green).getextrema()[1],
+        ImageChops.difference(green, blue).getextrema()[1]
+    ) <= GRAYSCALE_TOLERANCE
+
+
+def _prepare(image, actions):
+    """Normalize mode, drop colour where possible and downscale one frame"""
+    if image.mode in ('RGBA', 'LA') or (image.mode == 'P' and 'transparency' in image.info):
+        background = Image.new('RGB', image.size, 'white')
+        background.paste(image.convert('RGBA'), mask=image.convert('RGBA').split()[-1])
+        image = background
+    elif image.mode not in ('1', 'L', 'RGB'):
+        image = image.convert('RGB')
+
+    if image.mode == 'RGB' and IMAGE_GRAYSCALE != 'never':
+        if IMAGE_GRAYSCALE == 'always' or _is_grayscale(image):
+            image = image.convert('L')
+            actions.add('grayscale')
+
+    scale = _scale(image)
+    if scale < 1.0:
+        size = (max(1, round(image.width * scale)), max(1, round(image.height * scale)))
+        # Bilevel scans keep hard edges; everything else is resampled smoothly
+        if image.mode == '1':
+            image = image.resize(size, Image.NEAREST)
+        else:
+            image = image.resize(size, Image.BICUBIC, reducing_gap=3.0)
+        actions.add('downscale')
+    return image
+
+
+def _encode(image):
+    """Compress one frame: PNG for bilevel scans, JPEG otherwise"""
+    buffer = io.BytesIO()
+    dpi = (IMAGE_TARGET_DPI, IMAGE_TARGET_DPI)
+    if image.mode == '1':
+        image.save(buffer, 'PNG', dpi=dpi)
+        return buffer.getvalue(), 'image/png'
+    image.save(buffer, 'JPEG', quality=IMAGE_JPEG_QUALITY, optimize=True, dpi=dpi)
+    return buffer.getvalue(), 'image/jpeg'
+
+
+def preprocess(file_data):
+    """Shrink an image file entry before it is sent.
+
+    Returns (file_data, report): the replacement entry (the original one when
+    nothing was gained or the image could not be read) and a report with the
+    original and processed sizes, the reduction and the time spent.
+    """
+    started = time.perf_counter()
+    _load_pil()
+    raw = _read_bytes(file_data)
+    original_mime_type = file_data.get('mime_type')
+    actions = set()
+    output, mime_type, pages = raw, original_mime_type, 1
+
+    try:
+        image = Image.open(io.BytesIO(raw))
+        if image.format == 'JPEG':
+            # Let the decoder skip detail that would be thrown away by the resize
+            width, scale = image.width, _scale(image)
+            image.draft(image.mode, (int(image.width * scale), int(image.height * scale)))
+            if image.info.get('dpi') and image.width != width:
+                image.info['dpi'] = tuple(value * image.width / width for value in image.info['dpi'])
+        pages = getattr(image, 'n_frames', 1)
+        if pages > 1:
+            frames = [_prepare(frame.copy(), actions) for frame in ImageSequence.Iterator(image)]
+            buffer = io.BytesIO()
+            frames[0].save(buffer, 'PDF', save_all=True, append_images=frames[1:], resolution=IMAGE_TARGET_DPI)
+            output, mime_type = buffer.getvalue(), 'application/pdf'
+            actions.add('pdf')
+        else:
+            output, mime_type = _encode(_prepare(image, actions))
+            if mime_type != original_mime_type:
+                actions.add('convert')
+    except (OSError, ValueError, Image.DecompressionBombError) as e:
+        logger.warning(f"Image preprocessing skipped: {str(e)}")
+        actions = {'skipped'}
+        output, mime_type = raw, original_mime_type
+
+    if 'skipped' not in actions and len(output) >= len(raw) and original_mime_type in PASSTHROUGH_MIME_TYPES:
+        actions = {'kept_original'}
+        output, mime_type = raw, original_mime_type
+
+    report = {
+        'original_mime_type': original_mime_type,
+        'mime_type': mime_type,
+        'pages': pages,
+        'original_bytes': len(raw),
+        'processed_bytes': len(output),
+        'reduction_pct': round(100.0 * (len(raw) - len(output)) / len(raw), 1) if raw else 0.0,
+        'actions': sorted(actions),
+        'preprocess_ms': round((time.perf_counter() - started) * 1000, 1)
+    }
+    logger.info(f"Image preprocessing: {report['original_bytes']} -> {report['processed_bytes']} bytes "
+                f"({report['reduction_pct']}%) in {report['preprocess_ms']} ms {report['actions']}")
+
+    if output is raw:
+        return file_data, report
+    processed = {key: value for key, value in file_data.items() if key not in ('base64_data', 'stream', 'sha256')}
+    processed.update({'mime_type': mime_type, 'stream': io.BytesIO(output)})
+    return processed, report
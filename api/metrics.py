@@ -0,0 +1,225 @@
+"""
+Request phase timings, exposed in the Prometheus text format on `/metrics`.
+
+A handler opens a timed request with `start(route)` and tags it with `label`
+(mlModel, API version, schema family) once it has parsed the body; code on
+the request's path wraps each phase in `span(phase)`, or reports a duration
+it measured itself with `observe`. Every phase lands in a histogram labelled
+by route, phase, mlModel, API version and schema family, and the whole
+request in a second one that also carries the response status. Phases are
+recorded when the request finishes, so those that ran before the labels were
+known (body read, JSON parse) carry them too. Spans outside a timed request
+(startup, background jobs) are not recorded. Histograms are per process.
+mlModel and API version come from the client, so values outside the
+configured models and supported versions are recorded as "other".
+"""
+import os
+import json
+import time
+import bisect
+import threading
+import contextvars
+from contextlib import contextmanager
+
+from api import schemas
+
+# Set METRICS=false to stop recording (the endpoint then serves no series)
+METRICS = os.environ.get("METRICS", "true").lower() == "true"
+
+# Upper bounds (seconds) of the histogram buckets; a final +Inf bucket is implied
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 80, 160)
+
+LABELS = ('route', 'ml_model', 'api_version', 'schema_family')
+
+# Phases recorded by the extract-data path
+BODY_READ = 'body_read'
+JSON_PARSE = 'json_parse'
+BASE64_DECODE = 'base64_decode'
+BASE64_ENCODE = 'base64_encode'
+PAYLOAD_BUILD = 'payload_build'
+CONNECT = 'connect'
+TIME_TO_FIRST_BYTE = 'time_to_first_byte'
+DOWNLOAD = 'download'
+RESPONSE_PARSE = 'response_parse'
+INNER_DECODE = 'inner_decode'
+
+CONTENT_TYPE = 'text/plain; version=0.0.4; charset=utf-8'
+
+# Label value for client-supplied mlModel / API version values that are not known here
+OTHER = 'other'
+_known = None
+
+# Labels of the current request, shared with the worker threads it fans out to (see bind)
+_request = contextvars.ContextVar('metrics_request', default=None)
+
+
+def _pair(name, value):
+    """name="value" with the value escaped as the text format requires"""
+    value = value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return f'{name}="{value}"'
+
+
+class Histogram:
+    """Cumulative-bucket histogram keyed by label values"""
+
+    def __init__(self, name, description, label_names, buckets=DURATION_BUCKETS):
+        self.name = name
+        self.description = description
+        self.label_names = tuple(label_names)
+        self.buckets = tuple(buckets)
+        self._series = {}
+        self._lock = threading.Lock()
+
+    def observe(self, labels, value):
+        key = tuple(str(labels.get(name) or '') for name in self.label_names)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = {'counts': [0] * (len(self.buckets) + 1), 'sum': 0.0, 'count': 0}
+            series['counts'][bisect.bisect_left(self.buckets, value)] += 1
+            series['sum'] += value
+            series['count'] += 1
+
+    def render(self):
+        """Exposition lines for every series"""
+        with self._lock:
+            series = {key: dict(entry, counts=list(entry['counts'])) for key, entry in self._series.items()}
+        lines = [f'# HELP {self.name} {self.description}', f'# TYPE {self.name} histogram']
+        for key in sorted(series):
+            entry = series[key]
+            labels = [_pair(name, value) for name, value in zip(self.label_names, key)]
+            cumulative = 0
+            for bound, count in zip([repr(float(b)) for b in self.buckets] + ['+Inf'], entry['counts']):
+                cumulative += count
+                lines.append(f'{self.name}_bucket{{{",".join(labels + [_pair("le", bound)])}}} {cumulative}')
+            lines.append(f'{self.name}_sum{{{",".join(labels)}}} {entry["sum"]!r}')
+            lines.append(f'{self.name}_count{{{",".join(labels)}}} {entry["count"]}')
+        return lines
+
+
+phase_seconds = Histogram(
+    'docai_phase_duration_seconds', 'Time spent in one phase of a request.', LABELS[:1] + ('phase',) + LABELS[1:]
+)
+request_seconds = Histogram(
+    'docai_request_duration_seconds', 'Time from the start of a request to its response.', LABELS + ('status',)
+)
+
+
+def start(route):
+    """Open a timed request in the current context; returns the handle to pass to finish()"""
+    if not METRICS:
+        return None
+    state = {'route': route, 'started': time.perf_counter(), 'spans': []}
+    return state, _request.set(state)
+
+
+def set_status(handle, status_code):
+    """Response status to record the request under"""
+    if handle is not None:
+        handle[0]['status'] = status_code
+
+
+def finish(handle):
+    """Close a timed request and record its phases and total duration"""
+    if handle is None:
+        return
+    state, token = handle
+    _request.reset(token)
+    request_seconds.observe(state, time.perf_counter() - state['started'])
+    # Labels set while the span ran win; the rest (e.g. for the body read) come from the finished request
+    for phase, seconds, labels in state['spans']:
+        phase_seconds.observe(dict(state, phase=phase, **{k: v for k, v in labels.items() if v}), seconds)
+
+
+def _known_values():
+    """Accepted ml_model and api_version label values (imported late: those modules record metrics)"""
+    global _known
+    if _known is None:
+        from api import confidence, discovery, model_router, utils
+        models = set(model_router.MODEL_CHAIN) | {model_router.AUTO_MODEL, utils.DEFAULT_ML_MODEL}
+        if confidence.CONFIDENCE_REEXTRACT_MODEL:
+            models.add(confidence.CONFIDENCE_REEXTRACT_MODEL)
+        _known = {'ml_model': models, 'api_version': set(discovery.SUPPORTED_VERSIONS) | {utils.API_VERSION}}
+    return _known
+
+
+def _bounded(values):
+    """`values` with unknown ml_model / api_version values replaced by OTHER, so clients cannot add series"""
+    known = _known_values()
+    return {name: OTHER if value and name in known and value not in known[name] else value
+            for name, value in values.items()}
+
+
+def label(**values):
+    """Set labels (ml_model, api_version, schema_family) on the current request"""
+    state = _request.get()
+    if state is not None:
+        state.update(_bounded(values))
+
+
+@contextmanager
+def labels(**values):
+    """Override labels for the spans recorded inside the block, restoring them afterwards"""
+    state = _request.get()
+    if state is None:
+        yield
+        return
+    previous = {name: state.get(name) for name in values}
+    state.update(_bounded(values))
+    try:
+        yield
+    finally:
+        state.update(previous)
+
+
+def observe(phase, seconds):
+    """Record a phase duration measured by the caller"""
+    state = _request.get()
+    if state is not None:
+        state['spans'].append((phase, seconds, {name: state.get(name) for name in LABELS[1:]}))
+
+
+@contextmanager
+def span(phase):
+    """Time the block as one occurrence of `phase`"""
+    if _request.get() is None:
+        yield
+        return
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(phase, time.perf_counter() - started)
+
+
+def bind(fn):
+    """Wrap `fn` so spans it records in another thread count towards the current request"""
+    state = _request.get()
+
+    def run(*args, **kwargs):
+        token = _request.set(state)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _request.reset(token)
+    return run
+
+
+def schema_family(schema, idp_config_name=None):
+    """Label for the schema a request extracts with: a registered schema's name, 'custom' or 'idp'"""
+    if idp_config_name:
+        return 'idp'
+    if not schema:
+        return ''
+    if isinstance(schema, str):
+        try:
+            schema = json.loads(schema)
+        except ValueError:
+            return 'custom'
+    entry = schemas.registry.get(schemas.schema_hash(schema))
+    return entry.name if entry else 'custom'
+
+
+def render():
+    """Prometheus text exposition of every histogram"""
+    return '\n'.join(phase_seconds.render() + request_seconds.render()) + '\n'
@@ -0,0 +1,208 @@
+"""
+mlModel routing and fallback for extract-data calls.
+
+Requests sent with `"mlModel": "auto"` (or without a model when
+MODEL_ROUTING=true) get a model picked per document: large documents, long
+documents and schema families listed in MODEL_ROUTE_FAMILIES go to the first
+(most capable) model of MODEL_CHAIN, everything else to the last (fastest,
+cheapest) one, and models whose recent error rate or latency is out of bounds
+are skipped. When a call times out or fails with a server error, it is
+retried with the models after it in MODEL_CHAIN. Every call is recorded in
+per-model latency histograms (`/api/model-stats`).
+"""
+import os
+import time
+import bisect
+import threading
+from collections import deque
+
+from api import classifier
+from api import schemas
+from api import circuit_breaker
+from api.utils import DEFAULT_ML_MODEL
+
+AUTO_MODEL = 'auto'
+
+# Routing configuration (overridable via environment variables)
+MODEL_ROUTING = os.environ.get("MODEL_ROUTING", "false").lower() == "true"
+MODEL_FALLBACK = os.environ.get("MODEL_FALLBACK", "true").lower() == "true"
+# Models ordered from most capable to cheapest/fastest
+MODEL_CHAIN = [model.strip() for model in os.environ.get(
+    "MODEL_CHAIN", f"llmgateway__OpenAIGPT4Omni_08_06,{DEFAULT_ML_MODEL}"
+).split(',') if model.strip()]
+# Documents matching any of these go to the first model of the chain
+MODEL_ROUTE_FAMILIES = set(family.strip() for family in os.environ.get(
+    "MODEL_ROUTE_FAMILIES", "multi_invoice,contract"
+).split(',') if family.strip())
+MODEL_ROUTE_MIN_PAGES = int(os.environ.get("MODEL_ROUTE_MIN_PAGES", "10"))
+MODEL_ROUTE_MIN_BYTES = int(os.environ.get("MODEL_ROUTE_MIN_BYTES", str(10 * 1024 * 1024)))
+# Health limits over the last MODEL_STATS_WINDOW calls of each model
+MODEL_STATS_WINDOW = int(os.environ.get("MODEL_STATS_WINDOW", "50"))
+MODEL_MIN_SAMPLES = int(os.environ.get("MODEL_MIN_SAMPLES", "5"))
+MODEL_MAX_ERROR_RATE = float(os.environ.get("MODEL_MAX_ERROR_RATE", "0.5"))
+MODEL_MAX_P90_MS = float(os.environ.get("MODEL_MAX_P90_MS", "90000"))
+
+# Upper bounds (ms) of the latency histogram buckets; a final +Inf bucket is implied
+LATENCY_BUCKETS_MS = (250, 500, 1000, 2500, 5000, 10000, 20000, 40000, 80000, 160000)
+
+
+class ModelStats:
+    """Per-model call counters, latency histograms and a sliding window for health checks"""
+
+    def __init__(self, window=MODEL_STATS_WINDOW, buckets=LATENCY_BUCKETS_MS):
+        self.window = window
+        self.buckets = tuple(buckets)
+        self._models = {}
+        self._lock = threading.Lock()
+
+    def _entry(self, model):
+        entry = self._models.get(model)
+        if entry is None:
+            entry = self._models[model] = {
+                'calls': 0, 'errors': 0, 'timeouts': 0, 'fallbacks': 0, 'latency_sum_ms': 0.0,
+                'bucket_counts': [0] * (len(self.buckets) + 1),
+                'recent': deque(maxlen=self.window)
+            }
+        return entry
+
+    def record(self, model, elapsed_ms, success, timeout=False):
+        """Record one extract-data call made with `model`"""
+        with self._lock:
+            entry = self._entry(model)
+            entry['calls'] += 1
+            entry['errors'] += 0 if success else 1
+            entry['timeouts'] += 1 if timeout else 0
+            entry['latency_sum_ms'] += elapsed_ms
+            entry['bucket_counts'][bisect.bisect_left(self.buckets, elapsed_ms)] += 1
+            entry['recent'].append((elapsed_ms, success))
+
+    def record_fallback(self, model):
+        """Count a request that gave up on `model` and moved down the chain"""
+        with self._lock:
+            self._entry(model)['fallbacks'] += 1
+
+    def health(self, model):
+        """Error rate and p90 latency over the recent window, and whether the model is within limits"""
+        with self._lock:
+            recent = list(self._models[model]['recent']) if model in self._models else []
+        if len(recent) < MODEL_MIN_SAMPLES:
+            return {'samples': len(recent), 'error_rate': None, 'p90_ms': None, 'healthy': True}
+        latencies = sorted(elapsed for elapsed, _ in recent)
+        error_rate = sum(1 for _, success in recent if not success) / len(recent)
+        p90 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.9))]
+        return {
+            'samples': len(recent),
+            'error_rate': round(error_rate, 4),
+            'p90_ms': round(p90, 1),
+            'healthy': error_rate <= MODEL_MAX_ERROR_RATE and p90 <= MODEL_MAX_P90_MS
+        }
+
+    def snapshot(self):
+        """Counters and cumulative histogram buckets per model"""
+        with self._lock:
+            models = {
+                model: dict({k: v for k, v in entry.items() if k not in ('recent', 'bucket_counts')},
+                            bucket_counts=list(entry['bucket_counts']))
+                for model, entry in self._models.items()
+            }
+        result = {}
+        for model, entry in models.items():
+            cumulative, buckets = 0, {}
+            for bound, count in zip(list(self.buckets) + ['+Inf'], entry.pop('bucket_counts')):
+                cumulative += count
+                buckets[str(bound)] = cumulative
+            entry['latency_sum_ms'] = round(entry['latency_sum_ms'], 1)
+            entry['latency_buckets_ms'] = buckets
+            entry['health'] = self.health(model)
+            result[model] = entry
+        return result
+
+
+stats = ModelStats()
+
+
+def default_model():
+    """mlModel used when a request names none"""
+    return AUTO_MODEL if MODEL_ROUTING else DEFAULT_ML_MODEL
+
+
+def is_auto(ml_model):
+    return ml_model == AUTO_MODEL
+
+
+def _file_size(file_data):
+    stream = file_data.get('stream')
+    if stream is not None:
+        start = stream.tell()
+        stream.seek(0, os.SEEK_END)
+        size = stream.tell() - start
+        stream.seek(start)
+        return size
+    return len(file_data.get('base64_data') or '') * 3 // 4
+
+
+def _classify(file_data):
+    mime_type = file_data.get('mime_type', 'application/pdf')
+    if file_data.get('stream') is not None:
+        return classifier.classify_stream(file_data['stream'], mime_type)
+    return classifier.classify_base64(file_data.get('base64_data') or '', mime_type)
+
+
+def route(file_data=None, schema=None):
+    """Pick a model for a document; returns (ml_model, routing info)"""
+    started = time.perf_counter()
+    entry = schemas.registry.get(schemas.schema_hash(schema)) if isinstance(schema, dict) else None
+    info = {'family': entry.name if entry else None, 'page_count': None, 'size_bytes': None}
+
+    if file_data:
+        info['size_bytes'] = _file_size(file_data)
+        classification = _classify(file_data)
+        info['page_count'] = classification['page_count']
+        info['family'] = info['family'] or classification['family']
+
+    reasons = []
+    if info['family'] in MODEL_ROUTE_FAMILIES:
+        reasons.append(f"family {info['family']}")
+    if (info['page_count'] or 0) >= MODEL_ROUTE_MIN_PAGES:
+        reasons.append(f"{info['page_count']} pages")
+    if (info['size_bytes'] or 0) >= MODEL_ROUTE_MIN_BYTES:
+        reasons.append(f"{info['size_bytes']} bytes")
+    preferred = MODEL_CHAIN[0] if reasons else MODEL_CHAIN[-1]
+
+    # Skip models that are currently failing or slow, preferring cheaper ones
+    position = MODEL_CHAIN.index(preferred)
+    model = preferred
+    for candidate in MODEL_CHAIN[position:] + MODEL_CHAIN[:position][::-1]:
+        if stats.health(candidate)['healthy']:
+            model = candidate
+            break
+    if model != preferred:
+        reasons.append(f'{preferred} unhealthy')
+
+    info.update(routed=True, reason=', '.join(reasons) or 'default',
+                route_ms=round((time.perf_counter() - started) * 1000, 2))
+    return model, info
+
+
+def cascade(ml_model, fallback=None):
+    """Models to try in order: `ml_model`, then the cheaper ones after it in MODEL_CHAIN"""
+    if not (MODEL_FALLBACK if fallback is None else fallback):
+        return [ml_model]
+    if ml_model in MODEL_CHAIN:
+        return MODEL_CHAIN[MODEL_CHAIN.index(ml_model):]
+    return [ml_model] + [model for model in MODEL_CHAIN[-1:] if model != ml_model]
+
+
+def should_fall_back(status_code, body):
+    """Timeouts and server errors move to the next model; other failures do not.
+
+    Throttling (429) and local rejections (governor, open circuit, spent deadline) are not
+    retried either: every model goes to the same org and shares its limits.
+    """
+    return (not body['success'] and not circuit_breaker.fails_fast(body)
+            and (status_code >= 500 or status_code == 408))
+
+
+def get_stats():
+    """Per-model latency histograms, error counts and health"""
+    return {'chain': MODEL_CHAIN, 'routing': MODEL_ROUTING, 'fallback': MODEL_FALLBACK, 'models': stats.snapshot()}
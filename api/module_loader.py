@@ -0,0 +1,50 @@
+import os
+import sys
+import threading
+import importlib.util
+
+# Re-import handler modules when their source file changes (development only)
+MODULE_HOT_RELOAD = os.environ.get("MODULE_HOT_RELOAD", "false").lower() == "true"
+
+API_DIR = os.path.dirname(os.path.abspath(__file__))
+
+_modules = {}
+_lock = threading.Lock()
+
+
+def module_name(filename):
+    """Importable name for an api/ file, e.g. generate-schema.py -> api.generate_schema"""
+    stem = os.path.splitext(os.path.basename(filename))[0]
+    return 'api.' + stem.replace('-', '_')
+
+
+def load_api_module(filename, hot_reload=None):
+    """Import an api/ handler file once (file names may contain hyphens) and reuse it.
+
+    With hot reload enabled the file's mtime is checked on every call and the
+    module is re-executed only when it changed.
+    """
+    hot_reload = MODULE_HOT_RELOAD if hot_reload is None else hot_reload
+    path = os.path.join(API_DIR, filename)
+
+    cached = _modules.get(path)
+    if cached is not None and not hot_reload:
+        return cached[1]
+
+    mtime = os.path.getmtime(path)
+    if cached is not None and cached[0] == mtime:
+        return cached[1]
+
+    with _lock:
+        cached = _modules.get(path)
+        if cached is not None and cached[0] == mtime:
+            return cached[1]
+
+        name = module_name(filename)
+        spec = importlib.util.spec_from_file_location(name, path)
+        module = importlib.util.module_from_spec(spec)
+        spec.loader.exec_module(module)
+        # Register it so `import api.generate_schema` elsewhere gets the same instance
+        sys.modules[name] = module
+        _modules[path] = (mtime, module)
+        return module
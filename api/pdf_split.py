@@ -0,0 +1,235 @@
+"""
+Page-range splitting for large multi-invoice PDFs.
+
+Plans page chunks at detected invoice boundaries (falling back to fixed
+windows when the pages carry no text layer), writes each chunk as its own
+PDF and merges the per-chunk `invoices` arrays back into one result with a
+locally recomputed `document_summary`. Requires the optional `pypdf`
+package; without it documents are always sent whole. pypdf is imported on
+first use, so cold starts that never split a document do not pay for it.
+"""
+import io
+import os
+import re
+import json
+import base64
+import binascii
+import importlib
+import importlib.util
+
+from api import classifier
+from api import metrics
+
+# Splitting configuration (overridable via environment variables)
+PDF_SPLIT = os.environ.get("PDF_SPLIT", "true").lower() == "true"
+PDF_SPLIT_MIN_PAGES = int(os.environ.get("PDF_SPLIT_MIN_PAGES", "20"))
+PDF_SPLIT_WINDOW = int(os.environ.get("PDF_SPLIT_WINDOW", "10"))
+PDF_SPLIT_CONCURRENCY = int(os.environ.get("PDF_SPLIT_CONCURRENCY", "4"))
+PDF_SPLIT_RETRIES = int(os.environ.get("PDF_SPLIT_RETRIES", "1"))
+
+_AMOUNT = re.compile(r'-?\d+(?:\.\d+)?')
+_PAGE_RANGE = re.compile(r'^[\d\s,\-–]+$')
+_PAGE_NUMBER = re.compile(r'\d+')
+
+# Looked up without importing the package
+_PYPDF_INSTALLED = importlib.util.find_spec('pypdf') is not None
+_pypdf_module = None
+
+
+def _pypdf():
+    """The pypdf module, imported on first use"""
+    global _pypdf_module
+    if _pypdf_module is None:
+        _pypdf_module = importlib.import_module('pypdf')
+    return _pypdf_module
+
+
+def available():
+    """Whether splitting is enabled and the PDF library is installed"""
+    return PDF_SPLIT and _PYPDF_INSTALLED
+
+
+def is_multi_invoice_schema(schema):
+    """True for schemas shaped like the multi-invoice schema (an `invoices` array at the root)"""
+    if isinstance(schema, str):
+        try:
+            schema = json.loads(schema)
+        except ValueError:
+            return False
+    if not isinstance(schema, dict):
+        return False
+    properties = schema.get('properties')
+    invoices = properties.get('invoices') if isinstance(properties, dict) else None
+    return isinstance(invoices, dict) and invoices.get('type') == 'array'
+
+
+def open_pdf(file_data):
+    """Open a PDF file entry (base64 or stream) as a reader, or None when it cannot be split"""
+    if file_data.get('mime_type', 'application/pdf') != 'application/pdf':
+        return None
+    pypdf = _pypdf()
+    try:
+        if file_data.get('stream') is not None:
+            return pypdf.PdfReader(file_data['stream'])
+        if not file_data.get('base64_data'):
+            return None
+        with metrics.span(metrics.BASE64_DECODE):
+            raw = base64.b64decode(file_data['base64_data'])
+        return pypdf.PdfReader(io.BytesIO(raw))
+    except (binascii.Error, ValueError, pypdf.errors.PdfReadError):
+        return None
+
+
+def _page_text(page):
+    try:
+        contents = page.get_contents()
+        return classifier.content_text(contents.get_data(), classifier.HEADER_CHARS) if contents is not None else ''
+    except Exception:
+        return ''
+
+
+def find_boundaries(reader):
+    """Indices of pages that start a new invoice (always includes page 0)"""
+    boundaries = [0]
+    current = None
+    for index, page in enumerate(reader.pages):
+        number = classifier.invoice_header(_page_text(page))
+        if number is None:
+            continue
+        # A repeated invoice number in the header is a continuation page
+        if index and (number == '' or number != current):
+            boundaries.append(index)
+        current = number
+    return boundaries
+
+
+def plan_chunks(page_count, boundaries=None, window=None):
+    """Group pages into (start, end) chunks of at most `window` pages, cutting only at boundaries.
+
+    An invoice longer than the window gets a chunk of its own. Without usable
+    boundaries the pages are cut into fixed windows.
+    """
+    window = max(1, window or PDF_SPLIT_WINDOW)
+    if not boundaries or len(boundaries) < 2:
+        return [(start, min(start + window, page_count)) for start in range(0, page_count, window)]
+
+    segments = list(zip(boundaries, boundaries[1:] + [page_count]))
+    chunks = []
+    start, end = segments[0]
+    for seg_start, seg_end in segments[1:]:
+        if seg_end - start > window:
+            chunks.append((start, end))
+            start = seg_start
+        end = seg_end
+    chunks.append((start, end))
+    return chunks
+
+
+def write_chunk(reader, start, end):
+    """Base64 of a new PDF holding pages [start, end) of the reader"""
+    writer = _pypdf().PdfWriter()
+    for index in range(start, end):
+        writer.add_page(reader.pages[index])
+    buffer = io.BytesIO()
+    writer.write(buffer)
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def _value(field):
+    """Plain value of a field that may arrive as {"value": ..., "confidence_score": ...}"""
+    if isinstance(field, dict) and 'value' in field:
+        return field['value']
+    return field
+
+
+def _with_value(field, value):
+    """`value` in the shape `field` arrived in (keeping its confidence score)"""
+    if isinstance(field, dict) and 'value' in field:
+        return dict(field, value=value)
+    return value
+
+
+def _summary_field(fields, value):
+    """A recomputed summary value, wrapped with the lowest chunk score when the chunks reported scores"""
+    scores = [field.get('confidence_score') for field in fields if isinstance(field, dict) and 'value' in field]
+    if not scores:
+        return value
+    known = [score for score in scores if isinstance(score, (int, float))]
+    return {'value': value, 'confidence_score': min(known) if known else None}
+
+
+def _amount(value):
+    """Numeric value of an amount that may arrive as a formatted string"""
+    value = _value(value)
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return value
+    if isinstance(value, str):
+        match = _AMOUNT.search(value.replace(',', ''))
+        if match:
+            return float(match.group(0))
+    return None
+
+
+def _offset_page_range(field, offset):
+    """Shift chunk-relative page numbers ("1-2") to source document page numbers"""
+    value = _value(field)
+    if not offset or not isinstance(value, str) or not _PAGE_RANGE.match(value):
+        return field
+    return _with_value(field, _PAGE_NUMBER.sub(lambda m: str(int(m.group(0)) + offset), value))
+
+
+def _merge_continuation(previous, invoice):
+    """Fold an invoice continued across a chunk cut into the entry already collected"""
+    for key, field in invoice.items():
+        value = _value(field)
+        if key == 'line_items' and isinstance(value, list):
+            prior = previous.get('line_items')
+            previous['line_items'] = _with_value(prior if prior is not None else field, (_value(prior) or []) + value)
+        elif key == 'page_range' and isinstance(value, str) and isinstance(_value(previous.get('page_range')), str):
+            first = _value(previous['page_range']).split('-')[0].strip()
+            last = value.split('-')[-1].strip()
+            previous['page_range'] = _with_value(previous['page_range'], f'{first}-{last}')
+        elif _value(previous.get(key)) in (None, '') and value not in (None, ''):
+            previous[key] = field
+
+
+def merge_results(chunks, results, page_count):
+    """Merge per-chunk extraction results into one multi-invoice result.
+
+    `results` are the extracted data dicts in chunk order (None for failed
+    chunks). The document summary is recomputed from the merged invoices.
+    """
+    invoices = []
+    summaries = []
+    for (start, _), data in zip(chunks, results):
+        if not isinstance(data, dict):
+            continue
+        if isinstance(data.get('document_summary'), dict):
+            summaries.append(data['document_summary'])
+        for position, invoice in enumerate(data.get('invoices') or []):
+            if not isinstance(invoice, dict):
+                continue
+            invoice = dict(invoice)
+            if 'page_range' in invoice:
+                invoice['page_range'] = _offset_page_range(invoice['page_range'], start)
+            previous = invoices[-1] if invoices else None
+            number = _value(invoice.get('invoice_number'))
+            if position == 0 and previous is not None and number and number == _value(previous.get('invoice_number')):
+                _merge_continuation(previous, invoice)
+            else:
+                invoices.append(invoice)
+
+    totals = [_amount(invoice.get('total_amount')) for invoice in invoices]
+    summary = {
+        'total_invoices_found': len(invoices),
+        'total_pages_processed': page_count,
+        'grand_total_amount': round(sum(total for total in totals if total is not None), 2)
+    }
+    return {
+        'invoices': invoices,
+        # Same shape as the chunks' own summaries (scored when extracted with confidence scores)
+        'document_summary': {key: _summary_field([chunk.get(key) for chunk in summaries], value)
+                             for key, value in summary.items()}
+    }
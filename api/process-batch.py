@@ -0,0 +1,103 @@
+from http.server import BaseHTTPRequestHandler
+import json
+import sys
+import os
+
+# Add parent directory to path to import utils (once; warm invocations and reloads re-run this)
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
+from api.utils import create_response, API_VERSION
+from api import document_ai
+from api import model_router
+from api import schemas
+
+class handler(BaseHTTPRequestHandler):
+    def do_OPTIONS(self):
+        """Handle CORS preflight requests"""
+        self.send_response(200)
+        self.send_header('Access-Control-Allow-Origin', '*')
+        self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+        self.end_headers()
+
+    def do_POST(self):
+        """Process many documents with as few Document AI calls as possible"""
+        try:
+            content_length = int(self.headers.get('Content-Length', 0))
+            post_data = self.rfile.read(content_length)
+            data = json.loads(post_data.decode('utf-8'))
+
+            access_token = data.get('access_token')
+            instance_url = data.get('instance_url')
+            # A registered schema can be referenced by name or hash instead of sent inline
+            schema = data.get('schema') or schemas.resolve_schema(data.get('schema_id'))
+            ml_model = data.get('mlModel') or model_router.default_model()
+            api_version = data.get('api_version', API_VERSION)
+
+            # AUTO-FIX: v60.0 is too old for Document AI. Force upgrade to v65.0.
+            if api_version == 'v60.0':
+                api_version = 'v65.0'
+
+            files = data.get('files')
+            idp_config_name = data.get('idpConfigurationIdOrName')
+
+            if not access_token or not instance_url:
+                self._send_response(create_response(401, {
+                    'success': False,
+                    'error': 'Authentication required. Please authenticate with Salesforce first.'
+                }))
+                return
+
+            if not idp_config_name and not schema:
+                self._send_response(create_response(400, {
+                    'success': False,
+                    'error': 'Schema is required when not using a pre-configured IDP'
+                }))
+                return
+
+            if not files or not isinstance(files, list) or not all(isinstance(f, dict) and f.get('base64_data') for f in files):
+                self._send_response(create_response(400, {
+                    'success': False,
+                    'error': 'A non-empty files list with base64_data for every file is required'
+                }))
+                return
+
+            try:
+                max_batch_size, max_payload_bytes = document_ai.batch_limits(data.get('max_batch_size'),
+                                                                             data.get('max_payload_bytes'))
+            except ValueError as e:
+                self._send_response(create_response(400, {
+                    'success': False,
+                    'error': str(e)
+                }))
+                return
+
+            batch_result = document_ai.extract_batch(
+                access_token, instance_url, api_version, files,
+                schema=schema,
+                ml_model=ml_model,
+                idp_config_name=idp_config_name,
+                max_batch_size=max_batch_size,
+                max_payload_bytes=max_payload_bytes
+            )
+
+            self._send_response(create_response(200, {
+                'success': batch_result['summary']['succeeded'] > 0,
+                'results': batch_result['results'],
+                'summary': batch_result['summary']
+            }))
+
+        except Exception as e:
+            self._send_response(create_response(500, {
+                'success': False,
+                'error': f'Server error: {str(e)}'
+            }))
+
+    def _send_response(self, response):
+        """Helper to send response"""
+        self.send_response(response['statusCode'])
+        for key, value in response['headers'].items():
+            self.send_header(key, value)
+        self.end_headers()
+        self.wfile.write(response['body'].encode('utf-8'))
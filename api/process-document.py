@@ -1,12 +1,19 @@
 from http.server import BaseHTTPRequestHandler
 import json
-import requests
 import sys
 import os
+from urllib.parse import urlparse, parse_qsl
 
-# Add parent directory to path to import utils
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from api.utils import create_response, API_VERSION, DEFAULT_ML_MODEL
+# Add parent directory to path to import utils (once; warm invocations and reloads re-run this)
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
+from api.utils import create_response, API_VERSION
+from api import document_ai
+from api import model_router
+from api import schemas
+from api import uploads
+from api import circuit_breaker
 
 class handler(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
@@ -14,20 +21,30 @@ class handler(BaseHTTPRequestHandler):
         self.send_response(200)
         self.send_header('Access-Control-Allow-Origin', '*')
         self.send_header('Access-Control-Allow-Methods', 'POST, OPTIONS')
-        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization')
+        self.send_header('Access-Control-Allow-Headers', 'Content-Type, Authorization, X-Request-Timeout')
         self.end_headers()
     
     def do_POST(self):
         """Handle document processing requests"""
+        # Imported per request rather than at cold start; already loaded once a call has been made
+        import requests
         try:
             content_length = int(self.headers.get('Content-Length', 0))
-            post_data = self.rfile.read(content_length)
-            data = json.loads(post_data.decode('utf-8'))
+            content_type = self.headers.get('Content-Type', '')
+            if uploads.is_binary_upload(content_type):
+                # Multipart or raw binary upload: the file stays binary until the extract-data body encodes it
+                data = uploads.parse_request(content_type, self.rfile, content_length,
+                                             dict(parse_qsl(urlparse(self.path).query)),
+                                             self.headers.get('Authorization'))
+            else:
+                post_data = self.rfile.read(content_length)
+                data = json.loads(post_data.decode('utf-8'))
             
             access_token = data.get('access_token')
             instance_url = data.get('instance_url')
-            schema = data.get('schema')
-            ml_model = data.get('mlModel', DEFAULT_ML_MODEL)
+            # A registered schema can be referenced by name or hash instead of sent inline
+            schema = data.get('schema') or schemas.resolve_schema(data.get('schema_id'))
+            ml_model = data.get('mlModel') or model_router.default_model()
             api_version = data.get('api_version', API_VERSION)
             
             # AUTO-FIX: v60.0 is too old for Document AI. Force upgrade to v65.0.
@@ -74,108 +91,21 @@ class handler(BaseHTTPRequestHandler):
                 self.wfile.write(response['body'].encode('utf-8'))
                 return
             
-            # Prepare Document AI request
-            # Include query params for confidence scores and disable HTML encoding
-            url = f"{instance_url}/services/data/{api_version}/ssot/document-processing/actions/extract-data?htmlEncode=false&extractDataWithConfidenceScore=true"
-            
-            # Check if idpConfigurationIdOrName is provided
-            idp_config = idp_config_name
-            
-            # schemaConfig must be a JSON string (escaped), not an object
-            schema_config_str = json.dumps(schema) if isinstance(schema, dict) else schema
-            if not schema_config_str:
-                 schema_config_str = "{}"
-            
-            if idp_config:
-                payload = {
-                    "idpConfigurationIdOrName": idp_config,
-                    "files": [
-                        {
-                            "mimeType": file_data.get('mime_type', 'application/pdf'),
-                            "data": file_data.get('base64_data')
-                        }
-                    ]
-                }
-            else:
-                payload = {
-                    "mlModel": ml_model,
-                    "schemaConfig": schema_config_str,
-                    "files": [
-                        {
-                            "mimeType": file_data.get('mime_type', 'application/pdf'),
-                            "data": file_data.get('base64_data')
-                        }
-                    ]
-                }
-            
-            headers = {
-                'Content-Type': 'application/json',
-                'Authorization': f'Bearer {access_token}'
-            }
-            
-            # Make request to Document AI API
-            api_response = requests.post(url, headers=headers, json=payload, timeout=160)
-            
-            if api_response.status_code in [200, 201]:
-                try:
-                    json_response = api_response.json()
-                    
-                    if 'data' in json_response and len(json_response['data']) > 0:
-                        result_data = json_response['data'][0]
-                        
-                        # Check for error (ignore if None)
-                        if result_data.get('error'):
-                            response = create_response(500, {
-                                'success': False,
-                                'error': result_data['error']
-                            })
-                        # Check for data
-                        elif 'data' in result_data and result_data['data']:
-                            # Parse the nested JSON string
-                            extracted_data_str = result_data['data']
-                            # Replace HTML entities
-                            extracted_data_str = extracted_data_str.replace('&quot;', '"').replace('&#92;', '\\')
-                            try:
-                                extracted_data = json.loads(extracted_data_str)
-                                response = create_response(200, {
-                                    'success': True,
-                                    'data': extracted_data
-                                })
-                            except Exception as e:
-                                response = create_response(500, {
-                                    'success': False,
-                                    'error': f'Failed to parse extracted data: {str(e)}'
-                                })
-                        else:
-                            response = create_response(500, {
-                                'success': False,
-                                'error': 'No extracted data in response'
-                            })
-                    else:
-                        response = create_response(500, {
-                            'success': False,
-                            'error': 'Unexpected response format'
-                        })
-                        
-                except json.JSONDecodeError as e:
-                    response = create_response(500, {
-                        'success': False,
-                        'error': f'Error parsing response: {str(e)}',
-                        'raw_response': api_response.text[:500]
-                    })
-            else:
-                error_text = api_response.text
-                try:
-                    error_json = api_response.json()
-                    error_text = error_json.get('message', error_json.get('error', error_text))
-                except:
-                    pass
-                
-                response = create_response(api_response.status_code, {
-                    'success': False,
-                    'error': f'Document AI request failed: {error_text}',
-                    'status_code': api_response.status_code
-                })
+            status_code, body = document_ai.extract_document(
+                access_token, instance_url, api_version, file_data,
+                schema=schema,
+                ml_model=ml_model,
+                idp_config_name=idp_config_name,
+                use_cache=not data.get('bypass_cache', False),
+                split=data.get('split_pages', True),
+                preprocess=data.get('preprocess'),
+                confidence_threshold=data.get('confidence_threshold'),
+                reextract=data.get('reextract_low_confidence'),
+                model_fallback=data.get('model_fallback'),
+                # A client time budget caps the outbound timeouts instead of the fixed 160 s
+                deadline=circuit_breaker.deadline_from(data.get('timeout') or self.headers.get('X-Request-Timeout'))
+            )
+            response = create_response(status_code, body)
             
             self.send_response(response['statusCode'])
             for key, value in response['headers'].items():
@@ -183,6 +113,16 @@ class handler(BaseHTTPRequestHandler):
             self.end_headers()
             self.wfile.write(response['body'].encode('utf-8'))
             
+        except uploads.UploadError as e:
+            response = create_response(e.status_code, {
+                'success': False,
+                'error': str(e)
+            })
+            self.send_response(response['statusCode'])
+            for key, value in response['headers'].items():
+                self.send_header(key, value)
+            self.end_headers()
+            self.wfile.write(response['body'].encode('utf-8'))
         except requests.exceptions.RequestException as e:
             response = create_response(500, {
                 'success': False,
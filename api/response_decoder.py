@@ -0,0 +1,85 @@
+"""
+Decoding of extract-data responses.
+
+Every `data[i]` entry of an extract-data response carries the extracted fields
+as a JSON string, which some orgs HTML-encode (`&quot;`, `&#92;`) even with
+`htmlEncode=false`. The outer body and every inner string go through one JSON
+backend: `orjson` when it is installed, the standard library otherwise (set
+RESPONSE_JSON_BACKEND=json to force it). Entity unescaping is skipped entirely
+for strings without an `&`, which is the common case.
+"""
+import os
+import json
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from api import metrics
+
+RESPONSE_JSON_BACKEND = os.environ.get("RESPONSE_JSON_BACKEND", "auto").lower()
+
+# Entities Document AI uses inside data[i].data, in replacement order
+_ENTITIES = (('&quot;', '"'), ('&#92;', '\\'))
+
+
+def backend():
+    """Name of the JSON library used to decode responses"""
+    if orjson is not None and RESPONSE_JSON_BACKEND != 'json':
+        return 'orjson'
+    return 'json'
+
+
+def loads(content):
+    """Parse JSON text or UTF-8 bytes with the configured backend (raises ValueError)"""
+    if backend() == 'orjson':
+        return orjson.loads(content)
+    return json.loads(content)
+
+
+def unescape(text):
+    """Undo the HTML entities in an extracted data string"""
+    if '&' not in text:
+        return text
+    for entity, char in _ENTITIES:
+        text = text.replace(entity, char)
+    return text
+
+
+def decode_entry(result_data):
+    """Decode one data[i] entry of an extract-data response into (data, error)"""
+    if not isinstance(result_data, dict):
+        return None, 'Unexpected result entry format'
+
+    # Check for error (ignore if None)
+    if result_data.get('error'):
+        return None, result_data['error']
+
+    extracted = result_data.get('data')
+    if not extracted:
+        return None, 'No extracted data in response'
+    if not isinstance(extracted, str):
+        # Already structured (e.g. a proxy that decoded it); nothing left to parse
+        return extracted, None
+
+    try:
+        return loads(unescape(extracted)), None
+    except ValueError as e:
+        return None, f'Failed to parse extracted data: {str(e)}'
+
+
+def decode_response(content):
+    """Decode a successful extract-data body into one (data, error) pair per data[i] entry.
+
+    Accepts the raw response bytes (preferred: no intermediate str copy) or text.
+    Returns an empty list when the body has no `data` list; raises ValueError
+    when the body is not JSON.
+    """
+    with metrics.span(metrics.RESPONSE_PARSE):
+        payload = loads(content)
+    entries = payload.get('data') if isinstance(payload, dict) else None
+    if not isinstance(entries, list):
+        return []
+    with metrics.span(metrics.INNER_DECODE):
+        return [decode_entry(entry) for entry in entries]
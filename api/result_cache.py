@@ -0,0 +1,245 @@
+import os
+import json
+import time
+import base64
+import binascii
+import hashlib
+import tempfile
+import threading
+from collections import OrderedDict
+
+from api import metrics
+from api.governor import org_key
+
+# Result cache configuration (overridable via environment variables)
+RESULT_CACHE = os.environ.get("RESULT_CACHE", "memory")
+RESULT_CACHE_DIR = os.environ.get("RESULT_CACHE_DIR", os.path.join(tempfile.gettempdir(), "docai-mini-results"))
+RESULT_CACHE_TTL = int(os.environ.get("RESULT_CACHE_TTL", "86400"))
+RESULT_CACHE_MAX_ENTRIES = int(os.environ.get("RESULT_CACHE_MAX_ENTRIES", "1000"))
+RESULT_CACHE_MAX_BYTES = int(os.environ.get("RESULT_CACHE_MAX_BYTES", str(100 * 1024 * 1024)))
+
+# Base64 characters decoded per hashing step (multiple of 4)
+_DECODE_STEP = 4 * 64 * 1024
+
+
+def file_digest(file_data):
+    """SHA-256 of a file's raw bytes, whether it arrives as base64 text or a stream"""
+    if file_data.get('sha256'):
+        return file_data['sha256']
+
+    digest = hashlib.sha256()
+    stream = file_data.get('stream')
+    if stream is not None:
+        start = stream.tell()
+        for chunk in iter(lambda: stream.read(_DECODE_STEP), b''):
+            digest.update(chunk)
+        stream.seek(start)
+    else:
+        base64_data = file_data.get('base64_data') or ''
+        try:
+            with metrics.span(metrics.BASE64_DECODE):
+                for offset in range(0, len(base64_data), _DECODE_STEP):
+                    digest.update(base64.b64decode(base64_data[offset:offset + _DECODE_STEP]))
+        except binascii.Error:
+            # Non-canonical base64 (e.g. embedded whitespace): fall back to hashing the text
+            digest = hashlib.sha256(base64_data.encode('utf-8'))
+    return digest.hexdigest()
+
+
+def normalize_schema(schema):
+    """Canonical JSON for a schema given as a dict or a JSON string"""
+    if isinstance(schema, str):
+        try:
+            schema = json.loads(schema)
+        except ValueError:
+            return schema
+    return json.dumps(schema, sort_keys=True, separators=(',', ':'))
+
+
+def make_key(instance_url, file_data, schema, ml_model, idp_config_name, api_version):
+    """Cache key over (org, file bytes, schemaConfig, model or IDP config, API version).
+
+    The org is part of every key: results of one org are never served to
+    callers of another, and IDP configuration names only mean something within
+    their org.
+    """
+    if idp_config_name:
+        target = f'idp:{idp_config_name}'
+    else:
+        target = f'model:{ml_model}|schema:{normalize_schema(schema)}'
+    material = (f'{org_key(instance_url)}|{file_digest(file_data)}|{file_data.get("mime_type", "application/pdf")}'
+                f'|{target}|{api_version}')
+    return hashlib.sha256(material.encode('utf-8')).hexdigest()
+
+
+class _StatsMixin:
+    def _init_stats(self):
+        self._stats = {'hits': 0, 'misses': 0, 'sets': 0, 'evictions': 0}
+        self._stats_lock = threading.Lock()
+
+    def _count(self, name, amount=1):
+        with self._stats_lock:
+            self._stats[name] += amount
+
+    def stats(self):
+        with self._stats_lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_rate'] = round(stats['hits'] / lookups, 4) if lookups else 0.0
+        stats.update(self._usage())
+        return stats
+
+
+class MemoryResultCache(_StatsMixin):
+    """In-process LRU cache bounded by entry count and serialized size"""
+
+    def __init__(self, ttl=RESULT_CACHE_TTL, max_entries=RESULT_CACHE_MAX_ENTRIES, max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self._init_stats()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry and entry[0] < time.time():
+                self._drop(key)
+                entry = None
+            if entry is None:
+                self._count('misses')
+                return None
+            self._entries.move_to_end(key)
+        self._count('hits')
+        return json.loads(entry[1])
+
+    def set(self, key, value):
+        serialized = json.dumps(value)
+        if len(serialized) > self.max_bytes:
+            return
+        with self._lock:
+            if key in self._entries:
+                self._drop(key)
+            self._entries[key] = (time.time() + self.ttl, serialized)
+            self._bytes += len(serialized)
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                self._drop(next(iter(self._entries)))
+                self._count('evictions')
+        self._count('sets')
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _drop(self, key):
+        _, serialized = self._entries.pop(key)
+        self._bytes -= len(serialized)
+
+    def _usage(self):
+        with self._lock:
+            return {'backend': 'memory', 'entries': len(self._entries), 'bytes': self._bytes}
+
+
+class DiskResultCache(_StatsMixin):
+    """On-disk cache (one JSON file per key) shared by every process on the host"""
+
+    def __init__(self, directory=RESULT_CACHE_DIR, ttl=RESULT_CACHE_TTL, max_entries=RESULT_CACHE_MAX_ENTRIES,
+                 max_bytes=RESULT_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        os.makedirs(self.directory, exist_ok=True)
+        self._init_stats()
+
+    def _path(self, key):
+        return os.path.join(self.directory, f'{key}.json')
+
+    def get(self, key):
+        path = self._path(key)
+        try:
+            if os.path.getmtime(path) + self.ttl < time.time():
+                os.remove(path)
+                raise FileNotFoundError(path)
+            with open(path) as f:
+                value = json.load(f)
+            # Touch the file so eviction is least-recently-used
+            os.utime(path)
+        except (OSError, ValueError):
+            self._count('misses')
+            return None
+        self._count('hits')
+        return value
+
+    def set(self, key, value):
+        serialized = json.dumps(value)
+        if len(serialized) > self.max_bytes:
+            return
+        with tempfile.NamedTemporaryFile('w', dir=self.directory, delete=False, suffix='.part') as f:
+            f.write(serialized)
+        os.replace(f.name, self._path(key))
+        self._count('sets')
+        self._evict()
+
+    def clear(self):
+        for name in os.listdir(self.directory):
+            if name.endswith('.json'):
+                os.remove(os.path.join(self.directory, name))
+
+    def _entries(self):
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith('.json'):
+                continue
+            try:
+                stat = os.stat(os.path.join(self.directory, name))
+            except OSError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, name))
+        return entries
+
+    def _evict(self):
+        with self._lock:
+            entries = sorted(self._entries())
+            now = time.time()
+            total = sum(size for _, size, _ in entries)
+            count = len(entries)
+            for mtime, size, name in entries:
+                expired = mtime + self.ttl < now
+                if not expired and count <= self.max_entries and total <= self.max_bytes:
+                    continue
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                total -= size
+                count -= 1
+                if not expired:
+                    self._count('evictions')
+
+    def _usage(self):
+        entries = self._entries()
+        return {'backend': 'disk', 'entries': len(entries), 'bytes': sum(size for _, size, _ in entries)}
+
+
+def create_result_cache():
+    """Create the result cache selected by RESULT_CACHE (memory, disk or off)"""
+    if RESULT_CACHE == 'off':
+        return None
+    if RESULT_CACHE == 'disk':
+        return DiskResultCache()
+    return MemoryResultCache()
+
+
+result_cache = create_result_cache()
+
+
+def get_stats():
+    """Hit/miss statistics of the configured cache"""
+    if result_cache is None:
+        return {'backend': 'off'}
+    return result_cache.stats()
@@ -0,0 +1,210 @@
+import os
+import threading
+from urllib.parse import urlparse
+
+from api import metrics
+
+# Pool / retry tuning (overridable via environment variables)
+POOL_CONNECTIONS = int(os.environ.get("SF_POOL_CONNECTIONS", "10"))
+POOL_MAXSIZE = int(os.environ.get("SF_POOL_MAXSIZE", "20"))
+POOL_BLOCK = os.environ.get("SF_POOL_BLOCK", "false").lower() == "true"
+MAX_RETRIES = int(os.environ.get("SF_MAX_RETRIES", "2"))
+BACKOFF_FACTOR = float(os.environ.get("SF_BACKOFF_FACTOR", "0.5"))
+RETRY_STATUS_CODES = (429, 502, 503, 504)
+
+_sessions = {}
+_sessions_lock = threading.Lock()
+_stats = {
+    "session_hits": 0,
+    "session_misses": 0,
+    "requests": 0
+}
+_stats_lock = threading.Lock()
+# requests / urllib3 are imported with the first session, not at module import (serverless cold starts)
+_adapter_class = None
+
+
+def _pool_key(url):
+    """Return the scheme://host[:port] origin a URL belongs to"""
+    parsed = urlparse(url)
+    scheme = parsed.scheme or "https"
+    return f"{scheme}://{parsed.netloc}".lower()
+
+
+def _build_retry():
+    """Retry policy shared by every pooled session.
+
+    Connection errors are always retried (the request never left this host).
+    Status-code and read retries only apply to idempotent methods, so a slow
+    extract-data POST is never silently replayed.
+    """
+    from urllib3.util.retry import Retry
+    return Retry(
+        total=MAX_RETRIES,
+        connect=MAX_RETRIES,
+        read=MAX_RETRIES,
+        status=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUS_CODES,
+        respect_retry_after_header=True,
+        raise_on_status=False
+    )
+
+
+def _timed_adapter():
+    """HTTPAdapter class whose new connections report their connect time to the current request"""
+    global _adapter_class
+    if _adapter_class is not None:
+        return _adapter_class
+
+    from requests.adapters import HTTPAdapter
+    from urllib3.connection import HTTPConnection, HTTPSConnection
+    from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+    class _TimedHTTPConnection(HTTPConnection):
+        def connect(self):
+            with metrics.span(metrics.CONNECT):
+                super().connect()
+
+    class _TimedHTTPSConnection(HTTPSConnection):
+        def connect(self):
+            # TCP connect plus the TLS handshake
+            with metrics.span(metrics.CONNECT):
+                super().connect()
+
+    class _TimedHTTPConnectionPool(HTTPConnectionPool):
+        ConnectionCls = _TimedHTTPConnection
+
+    class _TimedHTTPSConnectionPool(HTTPSConnectionPool):
+        ConnectionCls = _TimedHTTPSConnection
+
+    class _TimedAdapter(HTTPAdapter):
+        def init_poolmanager(self, *args, **kwargs):
+            super().init_poolmanager(*args, **kwargs)
+            self.poolmanager.pool_classes_by_scheme = {
+                "http": _TimedHTTPConnectionPool,
+                "https": _TimedHTTPSConnectionPool
+            }
+
+    _adapter_class = _TimedAdapter
+    return _adapter_class
+
+
+def _create_session():
+    """Create a keep-alive session with a tuned connection pool"""
+    import requests
+    session = requests.Session()
+    adapter = _timed_adapter()(
+        pool_connections=POOL_CONNECTIONS,
+        pool_maxsize=POOL_MAXSIZE,
+        pool_block=POOL_BLOCK,
+        max_retries=_build_retry()
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    session.headers.update({"Connection": "keep-alive"})
+    return session
+
+
+def get_session(url):
+    """Return the pooled session for the instance (or login host) a URL targets"""
+    key = _pool_key(url)
+    session = _sessions.get(key)
+    if session is not None:
+        with _stats_lock:
+            _stats["session_hits"] += 1
+        return session
+
+    with _sessions_lock:
+        session = _sessions.get(key)
+        if session is None:
+            session = _create_session()
+            _sessions[key] = session
+            hit = False
+        else:
+            hit = True
+
+    with _stats_lock:
+        _stats["session_hits" if hit else "session_misses"] += 1
+    return session
+
+
+def request(method, url, **kwargs):
+    """Send a request through the pooled session for the target instance"""
+    session = get_session(url)
+    with _stats_lock:
+        _stats["requests"] += 1
+    return session.request(method, url, **kwargs)
+
+
+def get(url, **kwargs):
+    """Pooled equivalent of requests.get"""
+    return request("GET", url, **kwargs)
+
+
+def post(url, **kwargs):
+    """Pooled equivalent of requests.post"""
+    return request("POST", url, **kwargs)
+
+
+def _connection_counts(session):
+    """Sum opened connections and requests over every live urllib3 pool of a session"""
+    opened = 0
+    sent = 0
+    seen = set()
+    for adapter in session.adapters.values():
+        if id(adapter) in seen:
+            continue
+        seen.add(id(adapter))
+        pools = adapter.poolmanager.pools
+        for key in pools.keys():
+            pool = pools.get(key)
+            if pool is None:
+                continue
+            opened += pool.num_connections
+            sent += pool.num_requests
+    return opened, sent
+
+
+def get_pool_stats():
+    """Report session pool-hit and connection-reuse counters"""
+    with _sessions_lock:
+        sessions = dict(_sessions)
+
+    instances = {}
+    total_opened = 0
+    total_sent = 0
+    for key, session in sessions.items():
+        opened, sent = _connection_counts(session)
+        instances[key] = {
+            "connections_opened": opened,
+            "requests_sent": sent,
+            "connections_reused": max(sent - opened, 0)
+        }
+        total_opened += opened
+        total_sent += sent
+
+    with _stats_lock:
+        stats = dict(_stats)
+
+    lookups = stats["session_hits"] + stats["session_misses"]
+    stats.update({
+        "pools": len(sessions),
+        "session_hit_rate": round(stats["session_hits"] / lookups, 4) if lookups else 0.0,
+        "connections_opened": total_opened,
+        "connections_reused": max(total_sent - total_opened, 0),
+        "pool_connections": POOL_CONNECTIONS,
+        "pool_maxsize": POOL_MAXSIZE,
+        "max_retries": MAX_RETRIES,
+        "instances": instances
+    })
+    return stats
+
+
+def close_all():
+    """Close every pooled session (e.g. on worker shutdown)"""
+    with _sessions_lock:
+        sessions = list(_sessions.values())
+        _sessions.clear()
+    for session in sessions:
+        session.close()
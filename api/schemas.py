@@ -0,0 +1,443 @@
+import os
+import re
+import json
+import hashlib
+import logging
+import threading
+from collections import namedtuple
+
+# Directory of user-registered *.json schemas (optional)
+SCHEMA_DIR = os.environ.get("SCHEMA_DIR")
+
+logger = logging.getLogger(__name__)
+
+# Combined/Multi-document schema (for fax batches, combined invoices, etc.)
+# Salesforce Document AI requires standard JSON Schema with type: "object" at root
+MULTI_INVOICE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "invoices": {
+            "type": "array",
+            "description": "Array of invoices extracted from the combined document",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "document_type": {"type": "string", "description": "Type of document"},
+                    "page_range": {"type": "string", "description": "Page numbers in source document"},
+                    "invoice_number": {"type": "string", "description": "Invoice number"},
+                    "invoice_date": {"type": "string", "description": "Invoice date"},
+                    "due_date": {"type": "string", "description": "Payment due date"},
+                    "purchase_order_number": {"type": "string", "description": "PO number"},
+                    "account_number": {"type": "string", "description": "Account number"},
+                    "vendor_name": {"type": "string", "description": "Vendor/Seller name"},
+                    "vendor_address": {"type": "string", "description": "Vendor address"},
+                    "vendor_city": {"type": "string", "description": "Vendor city"},
+                    "vendor_state": {"type": "string", "description": "Vendor state"},
+                    "vendor_zip_code": {"type": "string", "description": "Vendor ZIP code"},
+                    "vendor_phone": {"type": "string", "description": "Vendor phone"},
+                    "vendor_email": {"type": "string", "description": "Vendor email"},
+                    "customer_name": {"type": "string", "description": "Customer name"},
+                    "customer_address": {"type": "string", "description": "Customer address"},
+                    "customer_city": {"type": "string", "description": "Customer city"},
+                    "customer_state": {"type": "string", "description": "Customer state"},
+                    "customer_zip_code": {"type": "string", "description": "Customer ZIP"},
+                    "bill_to_name": {"type": "string", "description": "Bill to name"},
+                    "bill_to_address": {"type": "string", "description": "Bill to address"},
+                    "ship_to_name": {"type": "string", "description": "Ship to name"},
+                    "ship_to_address": {"type": "string", "description": "Ship to address"},
+                    "line_items": {
+                        "type": "array",
+                        "description": "Line items on the invoice",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "line_number": {"type": "number", "description": "Line number"},
+                                "item_code": {"type": "string", "description": "Item code/SKU"},
+                                "item_description": {"type": "string", "description": "Item description"},
+                                "quantity": {"type": "number", "description": "Quantity"},
+                                "unit_price": {"type": "number", "description": "Unit price"},
+                                "line_total": {"type": "number", "description": "Line total"}
+                            }
+                        }
+                    },
+                    "currency_code": {"type": "string", "description": "Currency code"},
+                    "subtotal": {"type": "number", "description": "Subtotal amount"},
+                    "tax_total": {"type": "number", "description": "Tax amount"},
+                    "shipping_cost": {"type": "number", "description": "Shipping cost"},
+                    "total_amount": {"type": "number", "description": "Total amount"},
+                    "amount_paid": {"type": "number", "description": "Amount paid"},
+                    "balance_due": {"type": "number", "description": "Balance due"},
+                    "payment_terms": {"type": "string", "description": "Payment terms"},
+                    "notes": {"type": "string", "description": "Notes or comments"}
+                }
+            }
+        },
+        "document_summary": {
+            "type": "object",
+            "description": "Summary of extracted documents",
+            "properties": {
+                "total_invoices_found": {"type": "number", "description": "Number of invoices found"},
+                "total_pages_processed": {"type": "number", "description": "Total pages processed"},
+                "grand_total_amount": {"type": "number", "description": "Sum of all invoice totals"}
+            }
+        }
+    }
+}
+
+# Resume/CV schema
+RESUME_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "name": {
+            "type": "string",
+            "description": "Full name of the candidate"
+        },
+        "email": {
+            "type": "string",
+            "description": "Email address"
+        },
+        "phone": {
+            "type": "string",
+            "description": "Phone number"
+        },
+        "address": {
+            "type": "string",
+            "description": "Address or location"
+        },
+        "summary": {
+            "type": "string",
+            "description": "Professional summary or objective"
+        },
+        "skills": {
+            "type": "array",
+            "items": {"type": "string"},
+            "description": "List of skills"
+        },
+        "experience": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "company": {"type": "string"},
+                    "title": {"type": "string"},
+                    "duration": {"type": "string"},
+                    "description": {"type": "string"}
+                }
+            },
+            "description": "Work experience"
+        },
+        "education": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "institution": {"type": "string"},
+                    "degree": {"type": "string"},
+                    "year": {"type": "string"}
+                }
+            },
+            "description": "Educational background"
+        }
+    },
+    "required": ["name"]
+}
+
+# Invoice schema (comprehensive)
+INVOICE_SCHEMA = {
+    "type": "object",
+    "properties": {
+        # Invoice Header
+        "invoice_number": {"type": "string", "description": "Unique invoice number/ID"},
+        "invoice_date": {"type": "string", "description": "Date the invoice was issued"},
+        "due_date": {"type": "string", "description": "Payment due date"},
+        "purchase_order_number": {"type": "string", "description": "Associated PO number"},
+        "account_number": {"type": "string", "description": "Customer account number"},
+
+        # Vendor Information
+        "vendor_name": {"type": "string", "description": "Seller/Vendor company name"},
+        "vendor_address": {"type": "string", "description": "Complete vendor address"},
+        "vendor_city": {"type": "string", "description": "Vendor city"},
+        "vendor_state": {"type": "string", "description": "Vendor state/province"},
+        "vendor_zip_code": {"type": "string", "description": "Vendor postal/ZIP code"},
+        "vendor_country": {"type": "string", "description": "Vendor country"},
+        "vendor_phone": {"type": "string", "description": "Vendor phone number"},
+        "vendor_email": {"type": "string", "description": "Vendor email address"},
+        "vendor_tax_id": {"type": "string", "description": "Vendor Tax ID/VAT"},
+
+        # Customer/Billing Information
+        "customer_name": {"type": "string", "description": "Customer/Buyer name"},
+        "billing_address": {"type": "string", "description": "Complete billing address"},
+        "billing_city": {"type": "string", "description": "Billing city"},
+        "billing_state": {"type": "string", "description": "Billing state/province"},
+        "billing_zip_code": {"type": "string", "description": "Billing postal/ZIP code"},
+        "billing_country": {"type": "string", "description": "Billing country"},
+
+        # Shipping Information
+        "ship_to_name": {"type": "string", "description": "Ship To name"},
+        "shipping_address": {"type": "string", "description": "Complete shipping address"},
+        "shipping_method": {"type": "string", "description": "Shipping carrier/method"},
+
+        # Line Items
+        "line_items": {
+            "type": "array",
+            "description": "Invoice line items",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "line_number": {"type": "integer", "description": "Line number"},
+                    "item_code": {"type": "string", "description": "Item code/SKU"},
+                    "description": {"type": "string", "description": "Item description"},
+                    "quantity": {"type": "number", "description": "Quantity"},
+                    "unit_of_measure": {"type": "string", "description": "Unit (EA, BOX, etc.)"},
+                    "unit_price": {"type": "number", "description": "Price per unit"},
+                    "discount": {"type": "number", "description": "Discount amount"},
+                    "tax": {"type": "number", "description": "Tax amount"},
+                    "line_total": {"type": "number", "description": "Line total"}
+                }
+            }
+        },
+
+        # Financial Summary
+        "currency": {"type": "string", "description": "Currency code (USD, EUR, GBP)"},
+        "subtotal": {"type": "number", "description": "Subtotal before tax"},
+        "discount_total": {"type": "number", "description": "Total discounts"},
+        "tax_rate": {"type": "string", "description": "Tax rate percentage"},
+        "tax_total": {"type": "number", "description": "Total tax amount"},
+        "shipping_cost": {"type": "number", "description": "Shipping charges"},
+        "total_amount": {"type": "number", "description": "Total invoice amount"},
+        "amount_paid": {"type": "number", "description": "Amount already paid"},
+        "balance_due": {"type": "number", "description": "Balance remaining"},
+
+        # Payment Information
+        "payment_terms": {"type": "string", "description": "Payment terms (Net 30, etc.)"},
+        "payment_method": {"type": "string", "description": "Payment method"},
+        "bank_details": {"type": "string", "description": "Bank account details"},
+
+        # Additional
+        "notes": {"type": "string", "description": "Invoice notes/comments"},
+        "sales_rep": {"type": "string", "description": "Sales representative"}
+    },
+    "required": ["invoice_number", "total_amount"]
+}
+
+# Receipt schema
+RECEIPT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "MerchantName": {"type": "string"},
+        "MerchantAddress": {"type": "string"},
+        "TransactionDate": {"type": "string"},
+        "Items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "name": {"type": "string"},
+                    "quantity": {"type": "number"},
+                    "price": {"type": "number"}
+                }
+            }
+        },
+        "Total": {"type": "number"}
+    },
+    "required": ["MerchantName", "Total"]
+}
+
+# Purchase Order schema
+PURCHASE_ORDER_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "PONumber": {"type": "string", "description": "Purchase order number"},
+        "OrderDate": {"type": "string", "description": "Order date"},
+        "Vendor": {"type": "string", "description": "Vendor name"},
+        "ShipTo": {"type": "string", "description": "Shipping address"},
+        "Items": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "itemCode": {"type": "string"},
+                    "description": {"type": "string"},
+                    "quantity": {"type": "number"},
+                    "unitPrice": {"type": "number"}
+                }
+            }
+        },
+        "TotalAmount": {"type": "number"}
+    },
+    "required": ["PONumber"]
+}
+
+# Contract/Agreement schema
+CONTRACT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "contractTitle": {"type": "string"},
+        "effectiveDate": {"type": "string"},
+        "parties": {
+            "type": "array",
+            "items": {"type": "string"}
+        },
+        "terms": {"type": "string"},
+        "signatureDate": {"type": "string"}
+    },
+    "required": ["contractTitle"]
+}
+
+# Sales/Proof of Sale schema
+SALES_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "sellerName": {"type": "string", "description": "Name of seller"},
+        "buyerName": {"type": "string", "description": "Name of buyer"},
+        "saleDate": {"type": "string", "description": "Date of sale"},
+        "itemsSold": {
+            "type": "array",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "description": {"type": "string"},
+                    "quantity": {"type": "number"},
+                    "price": {"type": "number"}
+                }
+            }
+        },
+        "totalAmount": {"type": "number", "description": "Total sale amount"},
+        "paymentMethod": {"type": "string"}
+    },
+    "required": ["totalAmount"]
+}
+
+# Default generic schema
+GENERIC_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "title": {"type": "string", "description": "Document title"},
+        "date": {"type": "string", "description": "Document date"},
+        "content": {"type": "string", "description": "Main content"},
+        "keyValues": {
+            "type": "object",
+            "description": "Key-value pairs extracted"
+        }
+    }
+}
+
+
+# Filename tokens: lowercase/uppercase/camel-case words and digit runs
+_FILENAME_TOKEN = re.compile(r'[A-Z]?[a-z]+|[A-Z]+(?![a-z])|[0-9]+')
+
+# A registered schema: the dict itself, its schemaConfig JSON string and a stable content hash.
+# Registered dicts are shared, never copied - callers must not mutate them.
+SchemaEntry = namedtuple('SchemaEntry', ['name', 'schema', 'json', 'hash', 'keywords'])
+
+
+def schema_hash(schema):
+    """Stable SHA-256 of a schema's canonical (sorted, compact) JSON form"""
+    canonical = json.dumps(schema, sort_keys=True, separators=(',', ':'))
+    return hashlib.sha256(canonical.encode('utf-8')).hexdigest()
+
+
+class SchemaRegistry:
+    """Schemas built and serialized once, looked up by name, hash or filename keywords"""
+
+    def __init__(self, default_name='generic'):
+        self.default_name = default_name
+        self._entries = {}
+        self._by_hash = {}
+        self._by_id = {}
+        self._builtin_order = []
+        self._user_order = []
+        self._lock = threading.Lock()
+
+    def register(self, name, schema, keywords=(), builtin=False):
+        """Register a schema under a name; keyword matches are tried in registration order"""
+        entry = SchemaEntry(name, schema, json.dumps(schema), schema_hash(schema), tuple(k.lower() for k in keywords))
+        with self._lock:
+            previous = self._entries.get(name)
+            if previous:
+                self._by_hash.pop(previous.hash, None)
+                self._by_id.pop(id(previous.schema), None)
+            order = self._builtin_order if builtin else self._user_order
+            if name not in order:
+                order.append(name)
+            self._entries[name] = entry
+            self._by_hash[entry.hash] = entry
+            self._by_id[id(schema)] = entry
+        return entry
+
+    def get(self, name_or_hash):
+        """Look up a schema entry by name or by content hash"""
+        return self._entries.get(name_or_hash) or self._by_hash.get(name_or_hash)
+
+    def serialized(self, schema):
+        """Pre-serialized schemaConfig for a registered schema dict, or None"""
+        entry = self._by_id.get(id(schema))
+        if entry is not None and entry.schema is schema:
+            return entry.json
+        return None
+
+    def match_filename(self, filename, user_only=False):
+        """First schema whose keywords appear in the filename (user schemas win), else the default.
+
+        Short keywords such as "po" or "cv" must match a whole filename token so that
+        e.g. "report.pdf" is not taken for a purchase order.
+        """
+        filename = filename or ''
+        filename_lower = filename.lower()
+        tokens = set(t.lower() for t in _FILENAME_TOKEN.findall(filename))
+        order = self._user_order if user_only else self._user_order + self._builtin_order
+        for name in order:
+            entry = self._entries[name]
+            for word in entry.keywords:
+                if (word in tokens) if len(word) <= 3 else (word in filename_lower):
+                    return entry
+        return None if user_only else self._entries[self.default_name]
+
+    def load_directory(self, directory):
+        """Register every *.json file in a directory.
+
+        A file holds either a plain JSON schema or {"schema": {...}, "keywords": [...]};
+        the file name (without extension) becomes the schema name.
+        """
+        loaded = []
+        for filename in sorted(os.listdir(directory)):
+            if not filename.endswith('.json'):
+                continue
+            path = os.path.join(directory, filename)
+            try:
+                with open(path) as f:
+                    content = json.load(f)
+            except (OSError, ValueError) as e:
+                logger.warning(f"Skipping schema file {path}: {str(e)}")
+                continue
+            if isinstance(content, dict) and isinstance(content.get('schema'), dict):
+                schema = content['schema']
+                keywords = content.get('keywords', [])
+            else:
+                schema = content
+                keywords = []
+            loaded.append(self.register(filename[:-len('.json')], schema, keywords))
+        return loaded
+
+    def names(self):
+        return list(self._builtin_order + self._user_order)
+
+
+registry = SchemaRegistry()
+registry.register('multi_invoice', MULTI_INVOICE_SCHEMA, ['combined', 'multi', 'batch', 'fax', 'merged'], builtin=True)
+registry.register('resume', RESUME_SCHEMA, ['resume', 'cv', 'curriculum'], builtin=True)
+registry.register('invoice', INVOICE_SCHEMA, ['invoice'], builtin=True)
+registry.register('receipt', RECEIPT_SCHEMA, ['receipt'], builtin=True)
+registry.register('purchase_order', PURCHASE_ORDER_SCHEMA, ['purchase', 'order', 'po'], builtin=True)
+registry.register('contract', CONTRACT_SCHEMA, ['contract', 'agreement'], builtin=True)
+registry.register('sales', SALES_SCHEMA, ['sale', 'sales', 'proof'], builtin=True)
+registry.register('generic', GENERIC_SCHEMA, builtin=True)
+
+if SCHEMA_DIR and os.path.isdir(SCHEMA_DIR):
+    registry.load_directory(SCHEMA_DIR)
+
+
+def resolve_schema(schema_id):
+    """Registered schema dict for a schema name or hash, or None"""
+    entry = registry.get(schema_id) if schema_id else None
+    return entry.schema if entry else None
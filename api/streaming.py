@@ -0,0 +1,158 @@
+import os
+import json
+import time
+import base64
+
+# Raw bytes read per step; a multiple of 3 so no base64 padding appears mid-stream
+CHUNK_SIZE = 3 * 64 * 1024
+# Send bodies with Transfer-Encoding: chunked instead of a precomputed Content-Length
+STREAM_CHUNKED = os.environ.get("STREAM_CHUNKED", "false").lower() == "true"
+
+_BASE64_ALPHABET = b'ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789+/='
+_WHITESPACE = str.maketrans('', '', ' \t\r\n')
+
+
+def base64_length(raw_size):
+    """Length of the base64 encoding of raw_size bytes"""
+    return 4 * ((raw_size + 2) // 3)
+
+
+def iter_base64(stream, chunk_size=CHUNK_SIZE):
+    """Base64-encode a binary stream chunk by chunk, yielding ASCII bytes"""
+    remainder = b''
+    while True:
+        chunk = stream.read(chunk_size)
+        if not chunk:
+            break
+        if remainder:
+            chunk = remainder + chunk
+        cut = len(chunk) - len(chunk) % 3
+        if cut:
+            yield base64.b64encode(chunk[:cut])
+        remainder = chunk[cut:]
+    if remainder:
+        yield base64.b64encode(remainder)
+
+
+def json_base64(value):
+    """JSON-safe text for a client's base64 string, placed between the quotes of the body.
+
+    Canonical base64 is used as-is. Line-wrapped base64 (e.g. from
+    base64.encodebytes) has its whitespace dropped; anything else outside the
+    alphabet is escaped the way json.dumps would, so it cannot break or extend
+    the JSON body.
+    """
+    if not isinstance(value, str):
+        value = str(value)
+    if _is_base64_text(value):
+        return value
+    stripped = value.translate(_WHITESPACE)
+    if _is_base64_text(stripped):
+        return stripped
+    return json.dumps(value)[1:-1]
+
+
+def _is_base64_text(value):
+    """Whether a string holds only base64 alphabet characters (checked in slices to avoid a full copy)"""
+    if not value.isascii():
+        return False
+    step = base64_length(CHUNK_SIZE)
+    for offset in range(0, len(value), step):
+        if value[offset:offset + step].encode('ascii').translate(None, _BASE64_ALPHABET):
+            return False
+    return True
+
+
+def _stream_size(stream):
+    """Bytes left in a seekable stream"""
+    position = stream.tell()
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell() - position
+    stream.seek(position)
+    return size
+
+
+class ExtractDataBody:
+    """Iterable extract-data JSON body that base64-encodes file contents on the fly.
+
+    Each entry of ``files`` carries a ``mime_type`` and either ``base64_data`` (an
+    already-encoded string, streamed in slices) or ``stream`` (a seekable binary
+    file object, encoded while the body is sent). Peak memory stays at roughly one
+    chunk per request however large the documents are. The body can be iterated
+    more than once, so urllib3 connection retries replay it correctly.
+    """
+
+    def __init__(self, files, schema_config=None, ml_model=None, idp_config_name=None, chunk_size=CHUNK_SIZE):
+        self.files = files
+        self.chunk_size = chunk_size
+        # Seconds spent reading and encoding streamed files while the body was sent
+        self.encode_seconds = 0.0
+        self._starts = [f['stream'].tell() if f.get('stream') is not None else None for f in files]
+        # Checked up front, so the Content-Length is right and nothing fails halfway through sending
+        self._base64 = [json_base64(f['base64_data']) if f.get('stream') is None and f.get('base64_data') is not None
+                        else None for f in files]
+
+        if idp_config_name:
+            head = '{"idpConfigurationIdOrName": ' + json.dumps(idp_config_name)
+        else:
+            head = '{"mlModel": ' + json.dumps(ml_model) + ', "schemaConfig": ' + json.dumps(schema_config)
+        self._head = (head + ', "files": [').encode('utf-8')
+        self._tail = b']}'
+
+    def _entry_prefix(self, index, file_data):
+        separator = ', ' if index else ''
+        mime_type = file_data.get('mime_type', 'application/pdf')
+        return (separator + '{"mimeType": ' + json.dumps(mime_type) + ', "data": ').encode('utf-8')
+
+    def _data_length(self, index, file_data):
+        if file_data.get('stream') is not None:
+            return base64_length(_stream_size(file_data['stream'])) + 2
+        if self._base64[index] is not None:
+            return len(self._base64[index]) + 2
+        return len(b'null')
+
+    def __len__(self):
+        total = len(self._head) + len(self._tail)
+        for index, file_data in enumerate(self.files):
+            total += len(self._entry_prefix(index, file_data)) + self._data_length(index, file_data) + 1
+        return total
+
+    def _timed(self, chunks):
+        """Yield from `chunks`, adding the time spent producing each one to encode_seconds"""
+        while True:
+            started = time.perf_counter()
+            chunk = next(chunks, None)
+            self.encode_seconds += time.perf_counter() - started
+            if chunk is None:
+                return
+            yield chunk
+
+    def __iter__(self):
+        yield self._head
+        for index, file_data in enumerate(self.files):
+            yield self._entry_prefix(index, file_data)
+            stream = file_data.get('stream')
+            base64_data = self._base64[index]
+            if stream is not None:
+                stream.seek(self._starts[index])
+                yield b'"'
+                yield from self._timed(iter_base64(stream, self.chunk_size))
+                yield b'"'
+                # Leave the stream where it was, so a replayed request sends the whole file again
+                stream.seek(self._starts[index])
+            elif base64_data is not None:
+                yield b'"'
+                step = base64_length(self.chunk_size)
+                for offset in range(0, len(base64_data), step):
+                    yield base64_data[offset:offset + step].encode('ascii')
+                yield b'"'
+            else:
+                yield b'null'
+            yield b'}'
+        yield self._tail
+
+    def request_data(self, chunked=None):
+        """Value for requests' ``data=``: sized (Content-Length) or a bare generator (chunked)"""
+        if chunked if chunked is not None else STREAM_CHUNKED:
+            return iter(self)
+        return self
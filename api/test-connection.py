@@ -1,12 +1,14 @@
 from http.server import BaseHTTPRequestHandler
 import json
-import requests
 import sys
 import os
 
-# Add parent directory to path to import utils
-sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
-from api.utils import create_response, API_VERSION
+# Add parent directory to path to import utils (once; warm invocations and reloads re-run this)
+_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if _ROOT not in sys.path:
+    sys.path.append(_ROOT)
+from api.utils import create_response
+from api import discovery
 
 class handler(BaseHTTPRequestHandler):
     def do_OPTIONS(self):
@@ -36,83 +38,12 @@ class handler(BaseHTTPRequestHandler):
                 self._send_response(response)
                 return
             
-            headers = {
-                'Authorization': f'Bearer {access_token}',
-                'Content-Type': 'application/json'
-            }
-            
-            # Versions to probe
-            versions_to_try = ['v65.0', 'v64.0', 'v63.0', 'v62.0', 'v61.0', 'v60.0']
-            # Move current version to top if it's not in the list
-            if current_version not in versions_to_try:
-                versions_to_try.insert(0, current_version)
-            else:
-                versions_to_try.remove(current_version)
-                versions_to_try.insert(0, current_version)
-                
-            results = []
-            
-            for version in versions_to_try:
-                try:
-                    # 1. Check basic API access
-                    api_url = f"{instance_url}/services/data/{version}"
-                    resp = requests.get(api_url, headers=headers, timeout=5)
-                    
-                    if resp.status_code != 200:
-                        results.append(f"{version}: API not accessible ({resp.status_code})")
-                        continue
-                        
-                    # 2. Check Document AI Configurations endpoint
-                    configs_url = f"{instance_url}/services/data/{version}/ssot/document-processing/configurations"
-                    resp_conf = requests.get(configs_url, headers=headers, timeout=5)
-                    
-                    if resp_conf.status_code == 200:
-                        configs = resp_conf.json()
-                        response = create_response(200, {
-                            'success': True,
-                            'message': f'Document AI is enabled and accessible on {version}',
-                            'api_version': version,
-                            'configurations': configs,
-                            'auto_updated': version != current_version
-                        })
-                        self._send_response(response)
-                        return
-                    
-                    elif resp_conf.status_code == 404:
-                        # Try the Extract Data endpoint directly
-                        extract_url = f"{instance_url}/services/data/{version}/ssot/document-processing/actions/extract-data"
-                        resp_extract = requests.post(extract_url, headers=headers, json={}, timeout=5)
-                        
-                        # 400 Bad Request means it exists but payload was empty (GOOD)
-                        # 405 Method Not Allowed means it exists (GOOD)
-                        if resp_extract.status_code in [400, 405]:
-                            response = create_response(200, {
-                                'success': True,
-                                'message': f'Document AI Extract endpoint found on {version}',
-                                'api_version': version,
-                                'warning': 'Could not list configurations, but extraction endpoint exists.',
-                                'auto_updated': version != current_version
-                            })
-                            self._send_response(response)
-                            return
-                        
-                        results.append(f"{version}: IDP endpoints not found (404)")
-                    else:
-                        results.append(f"{version}: Error {resp_conf.status_code}")
-                        
-                except requests.exceptions.Timeout:
-                    results.append(f"{version}: Timeout")
-                except Exception as e:
-                    results.append(f"{version}: Error - {str(e)}")
-                    
-            # If we get here, no version worked
-            response = create_response(404, {
-                'success': False,
-                'error': 'Could not find working Document AI endpoint on any supported version.',
-                'details': results,
-                'suggestion': 'Ensure "Intelligent Document Processing" is enabled in Data Cloud Setup.'
-            })
-            self._send_response(response)
+            # Probe all candidate versions concurrently (cached per instance/token)
+            status_code, body = discovery.discover(
+                access_token, instance_url, current_version,
+                use_cache=not data.get('refresh', False)
+            )
+            self._send_response(create_response(status_code, body))
                 
         except Exception as e:
             response = create_response(500, {
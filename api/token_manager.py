@@ -0,0 +1,265 @@
+"""
+Server-side OAuth token manager.
+
+Keeps the tokens from the authorization-code exchange per Salesforce user and
+org (from the identity URL in the token response), tracks when each access
+token will expire, refreshes it when a request arrives shortly before it does
+and replays a request once with a fresh token when Salesforce answers 401.
+Only the latest access token of a user is recognised: the previous one is
+dropped at every refresh, so an old or leaked token is never turned into a
+fresh one. The new token is returned to the browser with the response.
+Tokens are held in process memory only, so this only works where the OAuth
+callback and the API requests are served by the same process (the backend/
+servers, not the separate Vercel functions).
+"""
+import os
+import time
+import hashlib
+import logging
+import threading
+from urllib.parse import urlparse
+
+from api import salesforce_client
+from api.utils import normalize_login_url
+
+# Token lifecycle configuration (overridable via environment variables)
+TOKEN_REFRESH = os.environ.get("TOKEN_REFRESH", "true").lower() == "true"
+# Salesforce token responses carry no expiry; this should match the org's session timeout
+TOKEN_LIFETIME = int(os.environ.get("TOKEN_LIFETIME", "7200"))
+TOKEN_REFRESH_MARGIN = int(os.environ.get("TOKEN_REFRESH_MARGIN", "300"))
+# Seconds between background sweeps that forget idle users
+TOKEN_REFRESH_INTERVAL = int(os.environ.get("TOKEN_REFRESH_INTERVAL", "60"))
+# Users idle for longer are forgotten
+TOKEN_IDLE_TTL = int(os.environ.get("TOKEN_IDLE_TTL", "28800"))
+
+logger = logging.getLogger(__name__)
+
+
+def token_hash(access_token):
+    """Stable, non-reversible lookup key for an access token"""
+    return hashlib.sha256((access_token or '').encode('utf-8')).hexdigest()
+
+
+def identity_key(token_data):
+    """'<org id>/<user id>' from the identity URL of a token response"""
+    parts = urlparse(token_data.get('id') or '').path.strip('/').split('/')
+    if len(parts) >= 3 and parts[-3] == 'id':
+        return f'{parts[-2]}/{parts[-1]}'
+    return f"{token_data.get('instance_url')}|{token_hash(token_data.get('access_token'))}"
+
+
+class TokenRecord:
+    """Tokens and OAuth client settings of one user in one org"""
+
+    def __init__(self, key, login_url, client_id, client_secret):
+        self.key = key
+        self.login_url = normalize_login_url(login_url)
+        self.client_id = client_id
+        self.client_secret = client_secret
+        self.access_token = None
+        self.refresh_token = None
+        self.instance_url = None
+        self.expires_at = 0
+        self.last_used = time.time()
+        self.lock = threading.Lock()
+
+    def update(self, token_data, lifetime):
+        self.access_token = token_data.get('access_token')
+        # Refresh responses normally omit the refresh token; keep the one we have
+        self.refresh_token = token_data.get('refresh_token') or self.refresh_token
+        self.instance_url = token_data.get('instance_url') or self.instance_url
+        try:
+            issued_at = int(token_data['issued_at']) / 1000.0
+        except (KeyError, TypeError, ValueError):
+            issued_at = time.time()
+        self.expires_at = issued_at + int(token_data.get('expires_in') or lifetime)
+
+
+class TokenManager:
+    """Per user/org token store with refresh-before-expiry and replay-on-401"""
+
+    def __init__(self, lifetime=TOKEN_LIFETIME, margin=TOKEN_REFRESH_MARGIN, interval=TOKEN_REFRESH_INTERVAL,
+                 idle_ttl=TOKEN_IDLE_TTL, enabled=TOKEN_REFRESH):
+        self.lifetime = lifetime
+        self.margin = margin
+        self.interval = interval
+        self.idle_ttl = idle_ttl
+        self.enabled = enabled
+        self._records = {}
+        self._aliases = {}
+        self._lock = threading.Lock()
+        self._thread = None
+        self._stats = {'stored': 0, 'refreshes': 0, 'proactive_refreshes': 0, 'refresh_failures': 0,
+                       'replays': 0, 'forgotten': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def store(self, token_data, login_url, client_id, client_secret):
+        """Remember the result of an authorization-code exchange; returns the user/org key"""
+        key = identity_key(token_data)
+        with self._lock:
+            record = self._records.get(key)
+            if record is None:
+                record = self._records[key] = TokenRecord(key, login_url, client_id, client_secret)
+            else:
+                record.login_url = normalize_login_url(login_url)
+                record.client_id, record.client_secret = client_id, client_secret
+                self._aliases.pop(token_hash(record.access_token), None)
+            record.update(token_data, self.lifetime)
+            record.last_used = time.time()
+            self._aliases[token_hash(record.access_token)] = key
+            self._stats['stored'] += 1
+        self._start()
+        return key
+
+    def _lookup(self, access_token):
+        with self._lock:
+            key = self._aliases.get(token_hash(access_token))
+            return self._records.get(key) if key else None
+
+    def resolve(self, access_token):
+        """The access token to use for a request; the user's latest token is refreshed when about to expire.
+
+        Only a user's latest token is known here; any other token passes through unchanged.
+        """
+        record = self._lookup(access_token)
+        if record is None:
+            return access_token
+        now = time.time()
+        record.last_used = now
+        if self.enabled and record.refresh_token and record.expires_at - self.margin <= now:
+            self.refresh(record, stale_token=access_token, proactive=record.expires_at > now)
+        return record.access_token or access_token
+
+    def refresh(self, record, stale_token=None, proactive=False):
+        """Exchange the refresh token for a new access token. Returns True when a usable token is available.
+
+        If another thread already replaced `stale_token`, no request is made.
+        """
+        with record.lock:
+            if stale_token is not None and record.access_token != stale_token:
+                return True
+            if not record.refresh_token:
+                return False
+            try:
+                response = salesforce_client.post(f"https://{record.login_url}/services/oauth2/token", data={
+                    'grant_type': 'refresh_token',
+                    'refresh_token': record.refresh_token,
+                    'client_id': record.client_id,
+                    'client_secret': record.client_secret
+                }, timeout=30)
+            except Exception as e:
+                logger.warning(f"Token refresh for {record.key} failed: {str(e)}")
+                self._count('refresh_failures')
+                return False
+
+            if response.status_code != 200:
+                logger.warning(f"Token refresh for {record.key} rejected ({response.status_code})")
+                self._count('refresh_failures')
+                if response.status_code in (400, 401):
+                    # Revoked or expired refresh token: the user has to log in again
+                    self.forget(record.key)
+                return False
+
+            old_alias = token_hash(record.access_token)
+            record.update(response.json(), self.lifetime)
+            with self._lock:
+                # The replaced token stops resolving to this user
+                self._aliases.pop(old_alias, None)
+                self._aliases[token_hash(record.access_token)] = record.key
+            self._count('proactive_refreshes' if proactive else 'refreshes')
+            logger.info(f"Refreshed access token for {record.key}")
+            return True
+
+    def call(self, access_token, func):
+        """Run func(token) -> (status_code, body) with the current token, replaying once after a 401"""
+        token = self.resolve(access_token)
+        status_code, body = func(token)
+
+        if status_code == 401 and self.enabled:
+            record = self._lookup(token)
+            if record is not None and self.refresh(record, stale_token=token):
+                self._count('replays')
+                token = record.access_token
+                status_code, body = func(token)
+
+        return status_code, self._annotate(access_token, token, body)
+
+    async def call_async(self, access_token, func):
+        """call() for a coroutine func; lookups and refreshes run in the loop's default executor"""
+        # Imported here: only the asyncio server gets this far, and it has loaded asyncio already
+        import asyncio
+        loop = asyncio.get_running_loop()
+        token = await loop.run_in_executor(None, self.resolve, access_token)
+        status_code, body = await func(token)
+
+        if status_code == 401 and self.enabled:
+            record = self._lookup(token)
+            if record is not None and await loop.run_in_executor(None, self.refresh, record, token):
+                self._count('replays')
+                token = record.access_token
+                status_code, body = await func(token)
+
+        return status_code, self._annotate(access_token, token, body)
+
+    def _annotate(self, access_token, token, body):
+        if token != access_token and isinstance(body, dict):
+            # Lets the browser replace the token it keeps in localStorage
+            body['refreshed_access_token'] = token
+        return body
+
+    def forget(self, key):
+        with self._lock:
+            if self._records.pop(key, None) is None:
+                return
+            for alias in [alias for alias, value in self._aliases.items() if value == key]:
+                del self._aliases[alias]
+            self._stats['forgotten'] += 1
+
+    def sweep(self):
+        """Forget idle users.
+
+        Tokens are not refreshed here: a token rotated in the background would
+        leave the browser holding one that no longer resolves.
+        """
+        now = time.time()
+        with self._lock:
+            records = list(self._records.values())
+        for record in records:
+            if record.last_used + self.idle_ttl < now:
+                self.forget(record.key)
+
+    def _start(self):
+        with self._lock:
+            if self._thread is not None:
+                return
+            self._thread = threading.Thread(target=self._run, name='token-sweep', daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            time.sleep(self.interval)
+            try:
+                self.sweep()
+            except Exception:
+                logger.exception("Token sweep failed")
+
+    def stats(self):
+        now = time.time()
+        with self._lock:
+            stats = dict(self._stats)
+            records = list(self._records.values())
+        stats['users'] = len(records)
+        stats['refreshable'] = sum(1 for r in records if r.refresh_token)
+        stats['expiring_soon'] = sum(1 for r in records if r.expires_at - self.margin <= now)
+        return stats
+
+
+manager = TokenManager()
+
+
+def get_stats():
+    """Counters of the shared token manager (never includes tokens)"""
+    return manager.stats()
@@ -0,0 +1,189 @@
+"""
+Binary document uploads for process-document and generate-schema.
+
+Besides a JSON body carrying base64 file data, both endpoints accept
+multipart/form-data (a `file` part plus the usual request keys as form
+fields) and application/octet-stream (the document as the body, request
+keys in the query string, the access token as a Bearer header). The file is
+spooled to a temporary file as it arrives and stays binary until the
+extract-data body base64-encodes it on the way out.
+"""
+import os
+import json
+import base64
+import tempfile
+import mimetypes
+
+from api import metrics
+
+# Uploads up to this size stay in memory; larger ones are spooled to a temporary file
+UPLOAD_SPOOL_BYTES = int(os.environ.get("UPLOAD_SPOOL_BYTES", str(8 * 1024 * 1024)))
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+
+CHUNK_SIZE = 64 * 1024
+MAX_FIELD_BYTES = 4 * 1024 * 1024
+MAX_FORM_PARTS = 1000
+
+# Form fields and query parameters that carry JSON values (objects and booleans)
+JSON_FIELDS = ('schema', 'async', 'bypass_cache', 'split_pages', 'preprocess', 'confidence_threshold',
+               'reextract_low_confidence', 'model_fallback')
+
+
+class UploadError(ValueError):
+    """Raised for malformed (400) or oversized (413) binary uploads"""
+
+    def __init__(self, message, status_code=400):
+        super().__init__(message)
+        self.status_code = status_code
+
+
+def media_type(content_type):
+    """Lower-case media type of a Content-Type header, without parameters"""
+    return (content_type or '').split(';', 1)[0].strip().lower()
+
+
+def is_binary_upload(content_type):
+    """Whether a request body is a multipart or raw binary upload rather than JSON"""
+    return media_type(content_type) in ('multipart/form-data', 'application/octet-stream')
+
+
+def spool(stream, length=None, max_bytes=UPLOAD_MAX_BYTES):
+    """Copy a request body (up to `length` bytes when known) into a seekable spooled file"""
+    sink = tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+    size = 0
+    while length is None or size < length:
+        chunk = stream.read(CHUNK_SIZE if length is None else min(CHUNK_SIZE, length - size))
+        if not chunk:
+            break
+        size += len(chunk)
+        if size > max_bytes:
+            sink.close()
+            raise UploadError(f'File exceeds the {max_bytes} byte upload limit', 413)
+        sink.write(chunk)
+    sink.seek(0)
+    return sink
+
+
+def check_multipart_length(length, max_bytes=UPLOAD_MAX_BYTES):
+    """Refuse (413) a multipart body longer than a file of the largest allowed size plus the form fields"""
+    if (length or 0) > max_bytes + MAX_FIELD_BYTES:
+        raise UploadError(f'Upload exceeds the {max_bytes} byte limit', 413)
+
+
+def check_file_size(stream, max_bytes=UPLOAD_MAX_BYTES):
+    """Refuse (413) a parsed file part over the upload limit; leaves the stream at its start"""
+    stream.seek(0, os.SEEK_END)
+    size = stream.tell()
+    stream.seek(0)
+    if size > max_bytes:
+        raise UploadError(f'Upload exceeds the {max_bytes} byte limit', 413)
+
+
+def parse_multipart(stream, content_type, length, max_bytes=UPLOAD_MAX_BYTES):
+    """Parse a multipart/form-data body of `length` bytes into (fields, files).
+
+    Parsing is done by werkzeug's form parser; file parts are written to spooled
+    files as they arrive, so memory use does not grow with the size of the document.
+    """
+    # Imported on first use: the serverless handlers only pay for it on multipart requests
+    from werkzeug.http import parse_options_header
+    from werkzeug.wsgi import LimitedStream
+    from werkzeug.formparser import FormDataParser
+    from werkzeug.exceptions import ClientDisconnected, HTTPException, RequestEntityTooLarge
+
+    mimetype, options = parse_options_header(content_type)
+    if not options.get('boundary'):
+        raise UploadError('multipart/form-data request without a boundary')
+    check_multipart_length(length, max_bytes)
+
+    def stream_factory(total_content_length, content_type, filename, content_length=None):
+        return tempfile.SpooledTemporaryFile(max_size=UPLOAD_SPOOL_BYTES)
+
+    parser = FormDataParser(stream_factory=stream_factory, max_form_memory_size=MAX_FIELD_BYTES,
+                            max_form_parts=MAX_FORM_PARTS, silent=False)
+    try:
+        # LimitedStream stops at the body length instead of blocking on the socket
+        _, form, form_files = parser.parse(LimitedStream(stream, length or 0), mimetype, length, options)
+    except ClientDisconnected:
+        raise UploadError('Truncated multipart body')
+    except RequestEntityTooLarge:
+        raise UploadError('Multipart body has too many parts or a form field over '
+                          f'{MAX_FIELD_BYTES} bytes', 413)
+    except (HTTPException, ValueError) as e:
+        raise UploadError(f'Malformed multipart body: {getattr(e, "description", None) or e}')
+
+    files = {}
+    for name, storage in form_files.items(multi=True):
+        try:
+            check_file_size(storage.stream, max_bytes)
+        except UploadError:
+            for other in form_files.values():
+                other.close()
+            raise
+        files.setdefault(name, {'filename': storage.filename, 'mime_type': storage.content_type,
+                                'stream': storage.stream})
+    return form.to_dict(), files
+
+
+def _coerce(key, value):
+    if key in JSON_FIELDS and isinstance(value, str):
+        try:
+            return json.loads(value)
+        except ValueError:
+            return value
+    return value
+
+
+def _mime_type(part_type, filename):
+    part_type = media_type(part_type)
+    if part_type and part_type != 'application/octet-stream':
+        return part_type
+    return mimetypes.guess_type(filename or '')[0] or 'application/pdf'
+
+
+def build_request(fields, upload=None, authorization=None):
+    """Request dict shaped like the JSON body, with the upload as a stream file entry.
+
+    `fields` are form fields or query parameters; `upload` is a dict with a binary
+    `stream` and optionally the `filename` and `mime_type` it was sent with.
+    """
+    data = {key: _coerce(key, value) for key, value in fields.items()}
+    if not data.get('access_token') and (authorization or '').startswith('Bearer '):
+        data['access_token'] = authorization[len('Bearer '):].strip()
+    if upload is not None:
+        filename = data.get('filename') or upload.get('filename') or 'document.pdf'
+        mime_type = data.get('mime_type') or _mime_type(upload.get('mime_type'), filename)
+        data['filename'], data['mime_type'] = filename, mime_type
+        data['file'] = {'mime_type': mime_type, 'stream': upload['stream']}
+    return data
+
+
+def raw_upload(stream, length=None):
+    """Upload entry for an application/octet-stream body, or None when the body is empty"""
+    body = spool(stream, length)
+    if not body.read(1):
+        body.close()
+        return None
+    body.seek(0)
+    return {'stream': body}
+
+
+def parse_request(content_type, stream, length, query=None, authorization=None):
+    """Build the request dict from a multipart or octet-stream body (serverless handlers)"""
+    query = query or {}
+    if media_type(content_type) == 'multipart/form-data':
+        fields, files = parse_multipart(stream, content_type, length)
+        return build_request(dict(query, **fields), files.get('file'), authorization)
+    return build_request(dict(query), raw_upload(stream, length), authorization)
+
+
+def detach(file_data):
+    """base64 copy of a stream file entry, for work that outlives the request (queued jobs)"""
+    stream = file_data.get('stream')
+    if stream is None:
+        return file_data
+    start = stream.tell()
+    with metrics.span(metrics.BASE64_ENCODE):
+        encoded = base64.b64encode(stream.read()).decode('ascii')
+    stream.seek(start)
+    return {'mime_type': file_data.get('mime_type', 'application/pdf'), 'base64_data': encoded}
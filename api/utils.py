@@ -1,6 +1,5 @@
 import os
 import json
-import requests
 from datetime import datetime
 
 # Load environment variables
@@ -28,6 +27,8 @@ def normalize_login_url(login_url):
 
 def authenticate_with_salesforce(username, password, security_token=None, login_url=None, client_id=None, client_secret=None):
     """Authenticate with Salesforce using Username/Password OAuth flow"""
+    # Imported on use so handlers that only need create_response do not load requests
+    from api import salesforce_client
     try:
         # Use provided config or fall back to environment variables
         use_login_url = login_url or LOGIN_URL
@@ -56,7 +57,7 @@ def authenticate_with_salesforce(username, password, security_token=None, login_
             "password": full_password
         }
         
-        response = requests.post(token_url, data=payload, timeout=30)
+        response = salesforce_client.post(token_url, data=payload, timeout=30)
         
         if response.status_code == 200:
             token_data = response.json()
@@ -107,7 +108,7 @@ def create_response(status_code, body, headers=None):
         "Content-Type": "application/json",
         "Access-Control-Allow-Origin": "*",
         "Access-Control-Allow-Methods": "GET, POST, OPTIONS",
-        "Access-Control-Allow-Headers": "Content-Type, Authorization"
+        "Access-Control-Allow-Headers": "Content-Type, Authorization, X-Request-Timeout"
     }
     
     if headers:
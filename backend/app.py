@@ -1,30 +1,71 @@
-from flask import Flask, request, jsonify, render_template, session, render_template_string
+from flask import Flask, request, jsonify, render_template, session, render_template_string, g
 from flask_cors import CORS
 import requests
-import base64
-import json
 import logging
 from datetime import datetime, timedelta
 import os
+import sys
 
 # Import configuration
-from config import DEFAULT_ML_MODEL, LOGIN_URL, CLIENT_ID, CLIENT_SECRET, API_VERSION
+from config import LOGIN_URL, CLIENT_ID, CLIENT_SECRET, API_VERSION
+from upload_store import create_upload_store, UploadTooLargeError
 
 # Get the directory of this script
 BASE_DIR = os.path.dirname(os.path.abspath(__file__))
 FRONTEND_DIR = os.path.join(os.path.dirname(BASE_DIR), 'frontend')
 
+# Add project root to path to import the shared api package
+sys.path.append(os.path.dirname(BASE_DIR))
+from api import salesforce_client
+from api import document_ai
+from api import circuit_breaker
+from api import model_router
+from api import metrics
+
 app = Flask(__name__, 
             template_folder=os.path.join(FRONTEND_DIR, 'templates'),
             static_folder=os.path.join(FRONTEND_DIR, 'static'),
             static_url_path='/static')
-app.secret_key = os.urandom(24)
+# Every worker process must sign sessions with the same key (see backend/serve.py)
+app.secret_key = os.environ.get('SECRET_KEY') or os.urandom(24)
 # Enable CORS for all routes
 CORS(app, resources={r"/*": {"origins": "*"}})
 
-logging.basicConfig(level=logging.DEBUG)
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
 logger = logging.getLogger(__name__)
 
+# Uploaded files live server-side; the session only carries the upload ID
+upload_store = create_upload_store()
+
+def read_json():
+    """request.get_json(), timing the body read and the parse separately"""
+    with metrics.span(metrics.BODY_READ):
+        request.get_data(cache=True)
+    with metrics.span(metrics.JSON_PARSE):
+        return request.get_json()
+
+def no_upload_response():
+    """Response for a session without a stored upload (never uploaded, expired or evicted)"""
+    return jsonify({
+        'success': False,
+        'error': 'No file found. Please upload a file first.'
+    }), 400
+
+@app.before_request
+def start_metrics():
+    """Time every POST to a known route; the spans recorded while handling it are attributed to it"""
+    if request.method == 'POST' and request.url_rule is not None:
+        g.metrics_request = metrics.start(request.url_rule.rule)
+
+@app.after_request
+def record_metrics_status(response):
+    metrics.set_status(g.get('metrics_request'), response.status_code)
+    return response
+
+@app.teardown_request
+def finish_metrics(error=None):
+    metrics.finish(g.pop('metrics_request', None))
+
 @app.route('/')
 def index():
     return render_template('index.html')
@@ -198,7 +239,7 @@ def auth_exchange():
     logger.info(f"Exchanging code for token: {token_url}")
     logger.debug(f"Redirect URI: {redirect_uri}")
     
-    resp = requests.post(token_url, data=payload, timeout=30)
+    resp = salesforce_client.post(token_url, data=payload, timeout=30)
     logger.info(f"Token exchange response status: {resp.status_code}")
     
     if resp.status_code != 200:
@@ -272,10 +313,6 @@ def generate_schema():
                 'error': 'No file selected'
             }), 400
         
-        # Read file and convert to base64
-        file_data = file.read()
-        base64_data = base64.b64encode(file_data).decode('utf-8')
-        
         # Determine file type
         file_ext = file.filename.rsplit('.', 1)[1].lower() if '.' in file.filename else ''
         mime_types = {
@@ -288,6 +325,15 @@ def generate_schema():
         }
         mime_type = mime_types.get(file_ext, 'application/octet-stream')
         
+        # Stream the upload into the server-side store
+        try:
+            upload_id = upload_store.put_stream(file.stream, file.filename, mime_type)
+        except UploadTooLargeError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 413
+        
         # Generate a basic schema based on document type
         # This is a simple schema generator - in production, you might want more sophisticated logic
         schema = {
@@ -312,20 +358,16 @@ def generate_schema():
             ]
         }
         
-        # Store file info in session for later use
-        session['uploaded_file'] = {
-            'filename': file.filename,
-            'base64_data': base64_data,
-            'mime_type': mime_type,
-            'size': len(file_data)
-        }
+        # Store only the upload ID in session for later use
+        session['upload_id'] = upload_id
         session['generated_schema'] = schema
         
         return jsonify({
             'success': True,
             'schema': schema,
             'filename': file.filename,
-            'mime_type': mime_type
+            'mime_type': mime_type,
+            'upload_id': upload_id
         })
         
     except Exception as e:
@@ -345,9 +387,10 @@ def process_document():
                 'error': 'Authentication required'
             }), 401
         
-        data = request.get_json()
+        data = read_json()
         schema = data.get('schema')
-        ml_model = data.get('mlModel', DEFAULT_ML_MODEL)
+        ml_model = data.get('mlModel') or model_router.default_model()
+        metrics.label(ml_model=ml_model, api_version=API_VERSION, schema_family=metrics.schema_family(schema))
         
         if not schema:
             return jsonify({
@@ -355,13 +398,11 @@ def process_document():
                 'error': 'Schema is required'
             }), 400
         
-        # Get file from session
-        file_info = session.get('uploaded_file')
+        # Get file from the upload store
+        upload_id = session.get('upload_id')
+        file_info = upload_store.get_meta(upload_id) if upload_id else None
         if not file_info:
-            return jsonify({
-                'success': False,
-                'error': 'No file found. Please upload a file first.'
-            }), 400
+            return no_upload_response()
         
         access_token = session.get('access_token')
         instance_url = session.get('instance_url')
@@ -372,88 +413,29 @@ def process_document():
                 'error': 'Authentication required. Please authenticate with Salesforce first.'
             }), 401
         
-        # Prepare Document AI request
-        url = f"{instance_url}/services/data/{API_VERSION}/ssot/document-processing/actions/extract-data"
-        
-        payload = {
-            "mlModel": ml_model,
-            "schemaConfig": json.dumps(schema) if isinstance(schema, dict) else schema,
-            "files": [
-                {
-                    "mimeType": file_info['mime_type'],
-                    "data": file_info['base64_data']
-                }
-            ]
-        }
-        
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {access_token}'
-        }
+        logger.info(f"Calling Document AI at {instance_url}")
         
-        logger.info(f"Calling Document AI endpoint: {url}")
-        logger.debug(f"Payload keys: {list(payload.keys())}")
+        # Stream the stored file, base64-encoding it chunk by chunk into the request body.
+        # The shared path applies the per-org governor, the circuit breaker and the client's time budget.
+        try:
+            upload = upload_store.open(upload_id)
+        except (FileNotFoundError, KeyError):
+            # Evicted since get_meta, e.g. by another worker
+            return no_upload_response()
+        with upload as f:
+            file_data = {'mime_type': file_info['mime_type'], 'stream': f}
+            status_code, body = document_ai.extract_document(
+                access_token, instance_url, API_VERSION, file_data,
+                schema=schema,
+                ml_model=ml_model,
+                use_cache=not data.get('bypass_cache', False),
+                split=data.get('split_pages', True),
+                preprocess=data.get('preprocess'),
+                deadline=circuit_breaker.deadline_from(data.get('timeout') or request.headers.get('X-Request-Timeout'))
+            )
         
-        response = requests.post(url, headers=headers, json=payload, timeout=160)
-        
-        logger.info(f"Document AI response status: {response.status_code}")
-        
-        if response.status_code in [200, 201]:
-            try:
-                json_response = response.json()
-                logger.debug(f"Response structure: {list(json_response.keys()) if isinstance(json_response, dict) else 'list'}")
-                
-                if 'data' in json_response and len(json_response['data']) > 0:
-                    result_data = json_response['data'][0]
-                    
-                    if 'error' in result_data:
-                        return jsonify({
-                            'success': False,
-                            'error': result_data['error']
-                        }), 500
-                    
-                    if 'data' in result_data:
-                        # Parse the nested JSON string
-                        extracted_data_str = result_data['data']
-                        # Replace HTML entities
-                        extracted_data_str = extracted_data_str.replace('&quot;', '"').replace('&#92;', '\\')
-                        extracted_data = json.loads(extracted_data_str)
-                        
-                        return jsonify({
-                            'success': True,
-                            'data': extracted_data
-                        })
-                    else:
-                        return jsonify({
-                            'success': False,
-                            'error': 'No extracted data in response'
-                        }), 500
-                else:
-                    return jsonify({
-                        'success': False,
-                        'error': 'Unexpected response format'
-                    }), 500
-                    
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON decode error: {str(e)}")
-                return jsonify({
-                    'success': False,
-                    'error': f'Error parsing response: {str(e)}',
-                    'raw_response': response.text[:500]
-                }), 500
-        else:
-            error_text = response.text
-            try:
-                error_json = response.json()
-                error_text = error_json.get('message', error_json.get('error', error_text))
-            except:
-                pass
-            
-            return jsonify({
-                'success': False,
-                'error': f'Document AI request failed: {error_text}',
-                'status_code': response.status_code
-            }), response.status_code
+        logger.info(f"Document AI response status: {status_code}")
+        return jsonify(body), status_code
             
     except requests.exceptions.RequestException as e:
         logger.error(f"Request error: {str(e)}")
@@ -468,6 +450,16 @@ def process_document():
             'error': f'Error processing document: {str(e)}'
         }), 500
 
+@app.route('/api/pool-stats', methods=['GET'])
+def pool_stats():
+    """Report Salesforce connection pool usage"""
+    return jsonify(salesforce_client.get_pool_stats())
+
+@app.route('/metrics', methods=['GET'])
+def metrics_endpoint():
+    """Request phase latency histograms in the Prometheus text format"""
+    return app.response_class(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
 @app.route('/api/clear-token', methods=['POST'])
 def clear_token():
     """Clear the access token to force re-authentication"""
@@ -487,5 +479,6 @@ def clear_token():
 if __name__ == '__main__':
     # Use port 5001 to avoid conflict with macOS AirPlay on port 5000
     port = int(os.environ.get('PORT', 5001))
-    app.run(debug=True, port=port, host='0.0.0.0')
+    # Development server only; use backend/serve.py in production
+    app.run(debug=os.environ.get('FLASK_DEBUG', 'false').lower() == 'true', port=port, host='0.0.0.0')
 
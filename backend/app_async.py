@@ -0,0 +1,581 @@
+"""
+asyncio entry point for the document API (aiohttp).
+
+Serves the same routes and request formats as app_local.py, but extract-data calls go out
+through an async HTTP client, so a slow extraction holds a socket instead of
+a thread and thousands can be in flight on one process. The steps around
+the call are shared with api/document_ai.py; the blocking ones (cache key
+hashing and disk cache I/O, building and base64-encoding the body,
+classification, image preprocessing, PDF splitting) and the short
+discovery/token calls run in a bounded thread pool.
+
+Run: python backend/app_async.py
+"""
+import os
+import sys
+import json
+import asyncio
+import logging
+import tempfile
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+import aiohttp
+from aiohttp import web
+
+BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add project root to path to import the shared api package
+sys.path.append(BASE_DIR)
+from api.utils import API_VERSION, normalize_login_url
+from api import document_ai
+from api import discovery
+from api import result_cache
+from api import schemas
+from api import module_loader
+from api import token_manager
+from api import model_router
+from api import governor
+from api import circuit_breaker
+from api import image_preprocess
+from api import pdf_split
+from api import uploads
+from api import confidence
+from api import metrics
+from job_queue import JobQueue, callback_url_error
+
+# Server configuration (overridable via environment variables)
+ASYNC_MAX_CONNECTIONS = int(os.environ.get("ASYNC_MAX_CONNECTIONS", "0"))
+ASYNC_BLOCKING_THREADS = int(os.environ.get("ASYNC_BLOCKING_THREADS", "32"))
+# Largest accepted request body (a 50 MB upload is ~67 MB as base64 JSON)
+ASYNC_MAX_BODY_BYTES = int(os.environ.get("ASYNC_MAX_BODY_BYTES", str(72 * 1024 * 1024)))
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+CORS_HEADERS = {
+    'Access-Control-Allow-Origin': '*',
+    'Access-Control-Allow-Methods': 'GET, POST, OPTIONS',
+    'Access-Control-Allow-Headers': 'Content-Type, Authorization, X-Request-Timeout'
+}
+
+
+def json_response(body, status=200):
+    return web.json_response(body, status=status)
+
+
+async def _iter_body(body):
+    """Yield the streamed extract-data body, reading and base64-encoding each chunk on the thread pool"""
+    loop = asyncio.get_running_loop()
+    chunks = iter(body)
+    while True:
+        chunk = await loop.run_in_executor(None, next, chunks, None)
+        if chunk is None:
+            return
+        yield chunk
+
+
+async def post_extract(http, access_token, instance_url, api_version, file_data, schema, ml_model,
+                       idp_config_name, timeout, deadline=None):
+    """One extract-data call over the async client, interpreted like the synchronous path"""
+    loop = asyncio.get_running_loop()
+    url, headers, body = await loop.run_in_executor(
+        None, document_ai.prepare_call, access_token, instance_url, api_version, file_data, schema, ml_model,
+        idp_config_name
+    )
+    headers['Content-Length'] = str(len(body))
+    rejected = document_ai.admit(url, timeout, deadline)
+    if rejected:
+        return rejected
+    try:
+        await governor.governor.acquire_async(url, deadline)
+    except governor.GovernorTimeout as e:
+        return document_ai.governor_rejected(url, e, deadline)
+    configured_timeout = timeout
+    timeout, rejected = document_ai.admitted_timeout(url, timeout, deadline)
+    if rejected:
+        return rejected
+
+    model = document_ai.call_model(ml_model, idp_config_name)
+    started = loop.time()
+    response = None
+    outcome = False
+    try:
+        async with http.post(url, data=_iter_body(body), headers=headers,
+                             timeout=aiohttp.ClientTimeout(total=timeout)) as response:
+            content = await response.read()
+        outcome = circuit_breaker.outcome(response.status)
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        timed_out = isinstance(e, asyncio.TimeoutError)
+        if timed_out:
+            outcome = circuit_breaker.timeout_outcome(timeout, configured_timeout)
+        return document_ai.network_error(model, (loop.time() - started) * 1000, e, timed_out)
+    finally:
+        document_ai.release_call(url, outcome, *((response.status, response.headers) if response is not None else ()))
+    return document_ai.call_result(model, (loop.time() - started) * 1000, response.status, content)
+
+
+async def _extract_chunk(http, semaphore, access_token, instance_url, api_version, chunk_file, schema, ml_model,
+                         timeout, use_cache, deadline):
+    async with semaphore:
+        for attempt in range(pdf_split.PDF_SPLIT_RETRIES + 1):
+            # Chunks skip the confidence review; the merged result is reviewed once
+            status_code, body = await _extract_document(
+                http, access_token, instance_url, api_version, chunk_file, schema, ml_model,
+                None, timeout, use_cache, False, None, deadline
+            )
+            if not document_ai.should_retry_chunk(status_code, body):
+                break
+        return status_code, body
+
+
+async def _extract_with_fallback(http, access_token, instance_url, api_version, file_data, schema, ml_model,
+                                 idp_config_name, timeout, use_cache, split, preprocess, model_fallback, deadline):
+    """Extract with `ml_model`, moving down the model chain on timeouts and server errors"""
+    loop = asyncio.get_running_loop()
+    models, routing = await loop.run_in_executor(None, document_ai.plan_models, file_data, schema, ml_model,
+                                                 idp_config_name, model_fallback)
+    attempts = []
+    for position, model in enumerate(models):
+        document_ai.start_attempt(models, position)
+        started = loop.time()
+        with metrics.labels(ml_model=model):
+            status_code, body = await _extract_document(http, access_token, instance_url, api_version, file_data,
+                                                        schema, model, idp_config_name, timeout, use_cache, split,
+                                                        preprocess, deadline)
+        attempts.append(document_ai.attempt_entry(model, status_code, body, (loop.time() - started) * 1000))
+        if not model_router.should_fall_back(status_code, body):
+            break
+
+    document_ai.finish_attempts(body, model, routing, attempts)
+    return status_code, body, model
+
+
+async def extract_document(http, access_token, instance_url, api_version, file_data, schema=None, ml_model=None,
+                           idp_config_name=None, timeout=document_ai.EXTRACT_TIMEOUT, use_cache=True, split=True,
+                           preprocess=None, confidence_threshold=None, reextract=None, model_fallback=None,
+                           deadline=None):
+    """Async counterpart of document_ai.extract_document (same caching, preprocessing, splitting, routing and review)"""
+    status_code, body, ml_model = await _extract_with_fallback(
+        http, access_token, instance_url, api_version, file_data, schema, ml_model, idp_config_name, timeout,
+        use_cache, split, preprocess, model_fallback, deadline
+    )
+    if not body['success']:
+        return status_code, body
+
+    plan = document_ai.plan_reextract(body, schema, ml_model, idp_config_name, confidence_threshold, reextract)
+    if plan is None:
+        return status_code, body
+    report, paths, narrowed, model = plan
+
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    with metrics.labels(ml_model=model):
+        rerun_status, rerun = await extract_document(
+            http, access_token, instance_url, api_version, file_data,
+            schema=narrowed, ml_model=model, timeout=timeout, use_cache=use_cache, split=False,
+            preprocess=preprocess, confidence_threshold=0, deadline=deadline
+        )
+    elapsed_ms = round((loop.time() - started) * 1000, 1)
+    return status_code, confidence.apply_review(body, report, paths, rerun_status, rerun, model,
+                                                confidence_threshold, elapsed_ms)
+
+
+async def _extract_document(http, access_token, instance_url, api_version, file_data, schema, ml_model,
+                            idp_config_name, timeout, use_cache, split, preprocess, deadline):
+    loop = asyncio.get_running_loop()
+    started = loop.time()
+    # Hashing the file and the disk cache block, so both run on the thread pool
+    cache, cache_key, cached = await loop.run_in_executor(
+        None, document_ai.lookup_cache, use_cache, instance_url, file_data, schema, ml_model, idp_config_name,
+        api_version
+    )
+    if cached is not None:
+        return cached
+
+    preprocessing = None
+    if image_preprocess.should_preprocess(file_data, preprocess):
+        file_data, preprocessing = await loop.run_in_executor(None, image_preprocess.preprocess, file_data)
+
+    plan = None
+    if split:
+        plan = await loop.run_in_executor(None, document_ai.plan_split, file_data, schema, idp_config_name)
+    if plan is not None:
+        chunks, chunk_files, page_count = plan
+        semaphore = asyncio.Semaphore(pdf_split.PDF_SPLIT_CONCURRENCY)
+        outcomes = await asyncio.gather(*[
+            _extract_chunk(http, semaphore, access_token, instance_url, api_version, chunk_file, schema, ml_model,
+                           timeout, use_cache, deadline)
+            for chunk_file in chunk_files
+        ])
+        status_code, body, complete = document_ai.merge_split(chunks, outcomes, page_count)
+    else:
+        status_code, body = await post_extract(http, access_token, instance_url, api_version, file_data, schema,
+                                               ml_model, idp_config_name, timeout, deadline)
+        complete = body['success']
+
+    await loop.run_in_executor(None, document_ai.store_result, cache, cache_key, body, complete)
+    if preprocessing is not None:
+        body['preprocessing'] = dict(preprocessing, total_ms=round((loop.time() - started) * 1000, 1))
+    return status_code, body
+
+
+async def read_json(request):
+    """Parse a JSON request body, or return an error response"""
+    try:
+        data = await request.json()
+    except (ValueError, UnicodeDecodeError):
+        return None, json_response({
+            'success': False,
+            'error': 'Invalid JSON in request body'
+        }, 400)
+    if not isinstance(data, dict):
+        return None, json_response({
+            'success': False,
+            'error': 'Request must be a JSON object'
+        }, 400)
+    return data, None
+
+
+async def read_request(request):
+    """JSON body, or a multipart/octet-stream upload turned into the same shape"""
+    content_type = request.headers.get('Content-Type', '')
+    if not uploads.is_binary_upload(content_type):
+        return await read_json(request)
+
+    # Spool the body without blocking the loop; parsing runs on the thread pool
+    body = tempfile.SpooledTemporaryFile(max_size=uploads.UPLOAD_SPOOL_BYTES)
+    size = 0
+    async for chunk in request.content.iter_chunked(uploads.CHUNK_SIZE):
+        size += len(chunk)
+        if size > ASYNC_MAX_BODY_BYTES:
+            body.close()
+            return None, json_response({
+                'success': False,
+                'error': f'Request body exceeds the {ASYNC_MAX_BODY_BYTES} byte limit'
+            }, 413)
+        body.write(chunk)
+    body.seek(0)
+
+    authorization = request.headers.get('Authorization')
+    try:
+        if uploads.media_type(content_type) == 'multipart/form-data':
+            data = await asyncio.get_running_loop().run_in_executor(
+                None, uploads.parse_request, content_type, body, size, dict(request.query), authorization
+            )
+        else:
+            data = uploads.build_request(dict(request.query), {'stream': body} if size else None, authorization)
+    except uploads.UploadError as e:
+        return None, json_response({
+            'success': False,
+            'error': str(e)
+        }, e.status_code)
+    return data, None
+
+
+async def api_process_document(request):
+    """Process document using Document AI endpoint"""
+    data, error = await read_request(request)
+    if error:
+        return error
+
+    access_token = data.get('access_token')
+    instance_url = data.get('instance_url')
+    # A registered schema can be referenced by name or hash instead of sent inline
+    schema = data.get('schema') or schemas.resolve_schema(data.get('schema_id'))
+    ml_model = data.get('mlModel') or model_router.default_model()
+    api_version = data.get('api_version', API_VERSION)
+
+    # AUTO-FIX: v60.0 is too old for Document AI. Force upgrade to v65.0.
+    if api_version == 'v60.0':
+        api_version = 'v65.0'
+
+    file_data = data.get('file')
+    idp_config_name = data.get('idpConfigurationIdOrName')
+
+    if not access_token or not instance_url:
+        return json_response({
+            'success': False,
+            'error': 'Authentication required. Please authenticate with Salesforce first.'
+        }, 401)
+
+    if not idp_config_name and not schema:
+        return json_response({
+            'success': False,
+            'error': 'Schema is required when not using a pre-configured IDP'
+        }, 400)
+
+    if not file_data:
+        return json_response({
+            'success': False,
+            'error': 'File data is required'
+        }, 400)
+
+    callback_url = data.get('callback_url')
+    # Resolving the host blocks, so it runs off the event loop
+    callback_error = (await asyncio.get_running_loop().run_in_executor(None, callback_url_error, callback_url)
+                      if callback_url else None)
+    if callback_error:
+        return json_response({
+            'success': False,
+            'error': callback_error
+        }, 400)
+
+    extract_params = {
+        'access_token': access_token,
+        'instance_url': instance_url,
+        'api_version': api_version,
+        'file_data': file_data,
+        'schema': schema,
+        'ml_model': ml_model,
+        'idp_config_name': idp_config_name,
+        'use_cache': not data.get('bypass_cache', False),
+        'split': data.get('split_pages', True),
+        'preprocess': data.get('preprocess'),
+        'confidence_threshold': data.get('confidence_threshold'),
+        'reextract': data.get('reextract_low_confidence'),
+        'model_fallback': data.get('model_fallback')
+    }
+
+    # Async mode: queue the extraction and return a job ID right away
+    if data.get('async'):
+        # Uploaded streams close with the request; queued jobs keep a base64 copy (read and encoded off the loop)
+        loop = asyncio.get_running_loop()
+        extract_params['file_data'] = await loop.run_in_executor(None, uploads.detach, file_data)
+        job_id = await loop.run_in_executor(None, functools.partial(
+            request.app['job_queue'].submit, extract_params, callback_url=callback_url
+        ))
+        return json_response({
+            'success': True,
+            'job_id': job_id,
+            'status': 'queued',
+            'status_url': f'/api/jobs/{job_id}'
+        }, 202)
+
+    http = request.app['http']
+    # A client time budget caps the outbound timeouts instead of the fixed 160 s
+    deadline = circuit_breaker.deadline_from(data.get('timeout') or request.headers.get('X-Request-Timeout'))
+    status_code, body = await token_manager.manager.call_async(
+        access_token,
+        lambda token: extract_document(http, **dict(extract_params, access_token=token, deadline=deadline))
+    )
+    return json_response(body, status_code)
+
+
+async def api_generate_schema(request):
+    """Generate schema from uploaded document"""
+    data, error = await read_request(request)
+    if error:
+        return error
+
+    filename = data.get('filename', 'document.pdf')
+    mime_type = data.get('mime_type', 'application/pdf')
+    base64_data = data.get('base64_data')
+    stream = (data.get('file') or {}).get('stream')
+
+    if not base64_data and stream is None:
+        return json_response({
+            'success': False,
+            'error': 'File data is required'
+        }, 400)
+
+    module = module_loader.load_api_module('generate-schema.py')
+    entry, classification = await asyncio.get_running_loop().run_in_executor(
+        None, module.select_schema, filename, mime_type, base64_data, stream
+    )
+    return web.Response(
+        text=module.schema_response_body(entry, filename, mime_type, classification),
+        content_type='application/json'
+    )
+
+
+async def api_test_connection(request):
+    """Test connection to Salesforce Document AI API with auto-discovery"""
+    data, error = await read_json(request)
+    if error:
+        return error
+
+    access_token = data.get('access_token')
+    instance_url = data.get('instance_url')
+    current_version = data.get('api_version', 'v65.0')
+
+    if not access_token or not instance_url:
+        return json_response({
+            'success': False,
+            'error': 'Access token and instance URL are required'
+        }, 400)
+
+    # Short probes (PROBE_TIMEOUT each) run on the blocking pool
+    status_code, body = await asyncio.get_running_loop().run_in_executor(
+        None, lambda: token_manager.manager.call(access_token, lambda token: discovery.discover(
+            token, instance_url, current_version,
+            use_cache=not data.get('refresh', False)
+        ))
+    )
+    return json_response(body, status_code)
+
+
+async def api_oauth_callback(request):
+    """Exchange OAuth authorization code for access token"""
+    data, error = await read_json(request)
+    if error:
+        return error
+
+    code = data.get('code')
+    login_url = data.get('login_url')
+    client_id = data.get('client_id')
+    client_secret = data.get('client_secret')
+
+    if not code:
+        return json_response({
+            'success': False,
+            'error': 'Authorization code is required'
+        }, 400)
+
+    if not login_url or not client_id or not client_secret:
+        return json_response({
+            'success': False,
+            'error': 'Login URL, Client ID, and Client Secret are required'
+        }, 400)
+
+    # Use the exact same redirect URI that was used in the authorization request
+    redirect_uri = f"{request.scheme}://{request.host}/auth/callback"
+    token_url = f"https://{normalize_login_url(login_url)}/services/oauth2/token"
+    payload = {
+        "grant_type": "authorization_code",
+        "code": code,
+        "client_id": client_id,
+        "client_secret": client_secret,
+        "redirect_uri": redirect_uri
+    }
+
+    try:
+        async with request.app['http'].post(token_url, data=payload,
+                                            timeout=aiohttp.ClientTimeout(total=30)) as response:
+            status = response.status
+            text = await response.text()
+    except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+        return json_response({
+            'success': False,
+            'error': f'Network error: {str(e) or type(e).__name__}'
+        }, 500)
+
+    if status != 200:
+        error_text = text
+        try:
+            error_json = json.loads(text)
+            error_text = error_json.get('error_description', error_json.get('error', error_text))
+        except ValueError:
+            pass
+        return json_response({
+            'success': False,
+            'error': f'Token exchange failed: {error_text}'
+        }, 400)
+
+    token_data = json.loads(text)
+    # Keep the refresh token server-side so expiring sessions can be renewed
+    token_manager.manager.store(token_data, login_url, client_id, client_secret)
+    return json_response({
+        'success': True,
+        'access_token': token_data.get('access_token'),
+        'instance_url': token_data.get('instance_url'),
+        'token_type': token_data.get('token_type', 'Bearer')
+    })
+
+
+async def api_job_status(request):
+    """Poll an asynchronous document processing job"""
+    job = request.app['job_queue'].get(request.match_info['job_id'])
+    if not job:
+        return json_response({
+            'success': False,
+            'error': 'Job not found (it may have expired)'
+        }, 404)
+    return json_response(job)
+
+
+async def api_job_metrics(request):
+    return json_response(request.app['job_queue'].metrics())
+
+
+async def api_cache_stats(request):
+    return json_response(result_cache.get_stats())
+
+
+async def api_token_stats(request):
+    return json_response(token_manager.get_stats())
+
+
+async def api_model_stats(request):
+    return json_response(model_router.get_stats())
+
+
+async def api_governor_stats(request):
+    return json_response(governor.get_stats())
+
+
+async def api_circuit_stats(request):
+    return json_response(circuit_breaker.get_stats())
+
+
+@web.middleware
+async def cors_and_errors(request, handler):
+    """CORS on every response, preflight handling and JSON errors"""
+    if request.method == 'OPTIONS':
+        return web.Response(status=200, headers=CORS_HEADERS)
+    try:
+        response = await handler(request)
+    except web.HTTPException as e:
+        response = json_response({
+            'success': False,
+            'error': e.reason
+        }, e.status)
+    except Exception as e:
+        logger.exception("Unhandled error:")
+        response = json_response({
+            'success': False,
+            'error': f'Server error: {str(e)}'
+        }, 500)
+    response.headers.update(CORS_HEADERS)
+    return response
+
+
+async def _startup(app):
+    asyncio.get_running_loop().set_default_executor(
+        ThreadPoolExecutor(max_workers=ASYNC_BLOCKING_THREADS, thread_name_prefix='blocking')
+    )
+    app['http'] = aiohttp.ClientSession(
+        connector=aiohttp.TCPConnector(limit=ASYNC_MAX_CONNECTIONS, ttl_dns_cache=300)
+    )
+
+
+async def _cleanup(app):
+    await app['http'].close()
+
+
+def create_app():
+    app = web.Application(middlewares=[cors_and_errors], client_max_size=ASYNC_MAX_BODY_BYTES)
+    # Jobs sent with "async": true still run on the thread-based queue shared with app_local.py
+    app['job_queue'] = JobQueue(lambda params: token_manager.manager.call(
+        params['access_token'],
+        lambda token: document_ai.extract_document(**dict(params, access_token=token))
+    ))
+    app.on_startup.append(_startup)
+    app.on_cleanup.append(_cleanup)
+    app.router.add_post('/api/process-document', api_process_document)
+    app.router.add_post('/api/generate-schema', api_generate_schema)
+    app.router.add_post('/api/test-connection', api_test_connection)
+    app.router.add_post('/api/oauth/callback', api_oauth_callback)
+    app.router.add_get('/api/jobs/{job_id}', api_job_status)
+    app.router.add_get('/api/jobs-metrics', api_job_metrics)
+    app.router.add_get('/api/cache-stats', api_cache_stats)
+    app.router.add_get('/api/token-stats', api_token_stats)
+    app.router.add_get('/api/model-stats', api_model_stats)
+    app.router.add_get('/api/governor-stats', api_governor_stats)
+    app.router.add_get('/api/circuit-stats', api_circuit_stats)
+    return app
+
+
+if __name__ == '__main__':
+    port = int(os.environ.get('PORT', 5003))
+    web.run_app(create_app(), host='0.0.0.0', port=port)
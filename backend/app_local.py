@@ -2,7 +2,7 @@
 Local Flask server for testing - proxies to API endpoints
 Run this locally: python backend/app_local.py
 """
-from flask import Flask, request, jsonify, render_template, send_from_directory
+from flask import Flask, request, jsonify, render_template, send_from_directory, g
 from flask_cors import CORS
 import requests
 import base64
@@ -12,23 +12,90 @@ import sys
 import logging
 
 # Configure logging
-logging.basicConfig(level=logging.INFO)
+logging.basicConfig(level=os.environ.get('LOG_LEVEL', 'INFO').upper())
 logger = logging.getLogger(__name__)
 
-# Add api directory to path
-sys.path.append(os.path.join(os.path.dirname(os.path.dirname(__file__)), 'api'))
-from utils import authenticate_with_salesforce, create_response, API_VERSION, DEFAULT_ML_MODEL
-
 BASE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Add project root to path to import the shared api package
+sys.path.append(BASE_DIR)
+from api.utils import authenticate_with_salesforce, create_response, API_VERSION
+from api import salesforce_client
+from api import document_ai
+from api import discovery
+from api import result_cache
+from api import schemas
+from api import module_loader
+from api import token_manager
+from api import model_router
+from api import governor
+from api import circuit_breaker
+from api import uploads
+from api import metrics
+from job_queue import JobQueue, callback_url_error
+
 FRONTEND_DIR = os.path.join(BASE_DIR, 'frontend')
 
 app = Flask(__name__, 
             template_folder=os.path.join(FRONTEND_DIR, 'templates'),
             static_folder=os.path.join(FRONTEND_DIR, 'static'),
             static_url_path='/static')
-app.secret_key = os.urandom(24)
+app.secret_key = os.environ.get('SECRET_KEY') or os.urandom(24)
 CORS(app, resources={r"/*": {"origins": "*"}})
 
+def extract_with_token(params):
+    """Run an extraction with the user's current access token, replaying once after a 401"""
+    return token_manager.manager.call(
+        params['access_token'],
+        lambda token: document_ai.extract_document(**dict(params, access_token=token))
+    )
+
+# Background workers for async document processing
+job_queue = JobQueue(extract_with_token)
+
+def read_request():
+    """JSON body, or a multipart/octet-stream upload turned into the same shape"""
+    authorization = request.headers.get('Authorization')
+    if uploads.media_type(request.content_type) == 'multipart/form-data':
+        # Werkzeug spools the file part to memory or a temporary file while parsing the form;
+        # the size limits match the octet-stream and serverless paths
+        uploads.check_multipart_length(request.content_length)
+        with metrics.span(metrics.BODY_READ):
+            upload = request.files.get('file')
+            form = request.form.to_dict()
+        if upload is not None:
+            uploads.check_file_size(upload.stream)
+            upload = {'filename': upload.filename, 'mime_type': upload.mimetype, 'stream': upload.stream}
+        with metrics.span(metrics.JSON_PARSE):
+            return uploads.build_request(dict(request.args.to_dict(), **form), upload, authorization)
+    if uploads.is_binary_upload(request.content_type):
+        with metrics.span(metrics.BODY_READ):
+            upload = uploads.raw_upload(request.stream, request.content_length)
+        return uploads.build_request(request.args.to_dict(), upload, authorization)
+    return read_json()
+
+def read_json(silent=False):
+    """request.get_json(), timing the body read and the parse separately"""
+    with metrics.span(metrics.BODY_READ):
+        request.get_data(cache=True)
+    with metrics.span(metrics.JSON_PARSE):
+        return request.get_json(silent=silent)
+
+@app.before_request
+def start_metrics():
+    """Time every POST to a known route; the spans recorded while handling it are attributed to it"""
+    if request.method == 'POST' and request.url_rule is not None:
+        g.metrics_request = metrics.start(request.url_rule.rule)
+
+@app.after_request
+def record_metrics_status(response):
+    metrics.set_status(g.get('metrics_request'), response.status_code)
+    return response
+
+@app.teardown_request
+def finish_metrics(error=None):
+    metrics.finish(g.pop('metrics_request', None))
+
 # Error handlers to ensure JSON responses
 @app.errorhandler(404)
 def not_found(error):
@@ -288,10 +355,12 @@ def api_oauth_callback():
             "redirect_uri": redirect_uri
         }
         
-        response = requests.post(token_url, data=payload, timeout=30)
+        response = salesforce_client.post(token_url, data=payload, timeout=30)
         
         if response.status_code == 200:
             token_data = response.json()
+            # Keep the refresh token server-side so expiring sessions can be renewed
+            token_manager.manager.store(token_data, login_url, client_id, client_secret)
             return jsonify({
                 'success': True,
                 'access_token': token_data.get('access_token'),
@@ -329,6 +398,11 @@ def api_auth():
         'error': 'Please use OAuth login flow. Click "Login to Salesforce" button to be redirected to Salesforce login page.'
     }), 400
 
+@app.route('/api/pool-stats', methods=['GET'])
+def api_pool_stats():
+    """Report Salesforce connection pool usage"""
+    return jsonify(salesforce_client.get_pool_stats())
+
 @app.route('/api/test-connection', methods=['POST', 'OPTIONS'])
 def api_test_connection():
     """Test connection to Salesforce Document AI API with auto-discovery"""
@@ -347,94 +421,18 @@ def api_test_connection():
                 'error': 'Access token and instance URL are required'
             }), 400
         
-        headers = {
-            'Authorization': f'Bearer {access_token}',
-            'Content-Type': 'application/json'
-        }
-        
         logger.info(f"Testing connection. Instance: {instance_url}, Version: {current_version}")
         
-        # Versions to probe
-        versions_to_try = ['v65.0', 'v64.0', 'v63.0', 'v62.0', 'v61.0', 'v60.0']
-        # Move current version to top if it's not in the list
-        if current_version not in versions_to_try:
-            versions_to_try.insert(0, current_version)
-        else:
-            # Move it to top
-            versions_to_try.remove(current_version)
-            versions_to_try.insert(0, current_version)
-            
-        working_version = None
-        working_endpoint = None
-        idp_enabled = False
+        # Probe all candidate versions concurrently (cached per instance/token)
+        status_code, body = token_manager.manager.call(access_token, lambda token: discovery.discover(
+            token, instance_url, current_version,
+            use_cache=not data.get('refresh', False)
+        ))
         
-        results = []
+        if body.get('success'):
+            logger.info(f"Found working IDP endpoint at {body['api_version']} (cached: {body['cached']})")
         
-        for version in versions_to_try:
-            logger.info(f"Probing version {version}...")
-            
-            # 1. Check basic API access
-            api_url = f"{instance_url}/services/data/{version}"
-            resp = requests.get(api_url, headers=headers, timeout=5)
-            
-            if resp.status_code != 200:
-                results.append(f"{version}: API not accessible ({resp.status_code})")
-                continue
-                
-            # 2. Check Document AI Configurations endpoint
-            # This confirms the IDP feature is enabled
-            configs_url = f"{instance_url}/services/data/{version}/ssot/document-processing/configurations"
-            resp_conf = requests.get(configs_url, headers=headers, timeout=5)
-            
-            if resp_conf.status_code == 200:
-                logger.info(f"Found working IDP endpoint at {version}")
-                working_version = version
-                working_endpoint = configs_url
-                idp_enabled = True
-                
-                # Get available configs
-                configs = resp_conf.json()
-                
-                return jsonify({
-                    'success': True,
-                    'message': f'Document AI is enabled and accessible on {version}',
-                    'api_version': version,
-                    'configurations': configs,
-                    'auto_updated': version != current_version
-                })
-            
-            elif resp_conf.status_code == 404:
-                 # 3. Try the Extract Data endpoint directly (POST with empty body just to check existence, or OPTIONS)
-                 # Note: A GET on a POST-only endpoint usually returns 405 Method Not Allowed, which proves existence!
-                 # If it returns 404, it doesn't exist.
-                 extract_url = f"{instance_url}/services/data/{version}/ssot/document-processing/actions/extract-data"
-                 resp_extract = requests.post(extract_url, headers=headers, json={}, timeout=5)
-                 
-                 # 400 Bad Request means it exists but payload was empty (GOOD)
-                 # 405 Method Not Allowed means it exists (GOOD)
-                 # 404 Not Found means it doesn't exist (BAD)
-                 if resp_extract.status_code in [400, 405]:
-                     logger.info(f"Found working Extract Data endpoint at {version} (Status: {resp_extract.status_code})")
-                     working_version = version
-                     return jsonify({
-                        'success': True,
-                        'message': f'Document AI Extract endpoint found on {version}',
-                        'api_version': version,
-                        'warning': 'Could not list configurations, but extraction endpoint exists.',
-                        'auto_updated': version != current_version
-                    })
-                 
-                 results.append(f"{version}: IDP endpoints not found (404)")
-            else:
-                results.append(f"{version}: Error {resp_conf.status_code}")
-                
-        # If we get here, no version worked
-        return jsonify({
-            'success': False,
-            'error': 'Could not find working Document AI endpoint on any supported version.',
-            'details': results,
-            'suggestion': 'Ensure "Intelligent Document Processing" is enabled in Data Cloud Setup.'
-        }), 404
+        return jsonify(body), status_code
             
     except Exception as e:
         logger.exception("Test connection error:")
@@ -450,13 +448,13 @@ def api_generate_schema():
         return '', 200
     
     try:
-        if not request.is_json:
+        if not request.is_json and not uploads.is_binary_upload(request.content_type):
             return jsonify({
                 'success': False,
-                'error': 'Request must be JSON'
+                'error': 'Request must be JSON, multipart/form-data or application/octet-stream'
             }), 400
         
-        data = request.get_json()
+        data = read_request()
         if data is None:
             return jsonify({
                 'success': False,
@@ -465,34 +463,30 @@ def api_generate_schema():
         filename = data.get('filename', 'document.pdf')
         mime_type = data.get('mime_type', 'application/pdf')
         base64_data = data.get('base64_data')
+        stream = (data.get('file') or {}).get('stream')
         
-        if not base64_data:
+        if not base64_data and stream is None:
             return jsonify({
                 'success': False,
                 'error': 'File data is required'
             }), 400
         
-        # Import schema generator
-        # Add api directory to path if not already there
-        api_path = os.path.join(os.path.dirname(os.path.dirname(__file__)), 'api')
-        if api_path not in sys.path:
-            sys.path.append(api_path)
-            
-        # Use importlib to import the module since it contains a hyphen
-        import importlib.util
-        spec = importlib.util.spec_from_file_location("generate_schema", os.path.join(api_path, "generate-schema.py"))
-        module = importlib.util.module_from_spec(spec)
-        spec.loader.exec_module(module)
+        # Schema generator is imported once (file name contains a hyphen); see MODULE_HOT_RELOAD
+        module = module_loader.load_api_module('generate-schema.py')
         
-        schema = module.generate_schema_from_document(filename, mime_type)
+        entry, classification = module.select_schema(filename, mime_type, base64_data, stream)
+        logger.info(f"Schema '{entry.name}' selected by {classification['source']} for {filename}")
         
-        return jsonify({
-            'success': True,
-            'schema': schema,
-            'filename': filename,
-            'mime_type': mime_type
-        })
+        return app.response_class(
+            module.schema_response_body(entry, filename, mime_type, classification),
+            mimetype='application/json'
+        )
         
+    except uploads.UploadError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), e.status_code
     except Exception as e:
         return jsonify({
             'success': False,
@@ -506,13 +500,13 @@ def api_process_document():
         return '', 200
     
     try:
-        if not request.is_json:
+        if not request.is_json and not uploads.is_binary_upload(request.content_type):
             return jsonify({
                 'success': False,
-                'error': 'Request must be JSON'
+                'error': 'Request must be JSON, multipart/form-data or application/octet-stream'
             }), 400
         
-        data = request.get_json()
+        data = read_request()
         if data is None:
             return jsonify({
                 'success': False,
@@ -520,8 +514,9 @@ def api_process_document():
             }), 400
         access_token = data.get('access_token')
         instance_url = data.get('instance_url')
-        schema = data.get('schema')
-        ml_model = data.get('mlModel', DEFAULT_ML_MODEL)
+        # A registered schema can be referenced by name or hash instead of sent inline
+        schema = data.get('schema') or schemas.resolve_schema(data.get('schema_id'))
+        ml_model = data.get('mlModel') or model_router.default_model()
         api_version = data.get('api_version', API_VERSION)
         
         # AUTO-FIX: v60.0 is too old for Document AI. Force upgrade to v65.0.
@@ -551,161 +546,72 @@ def api_process_document():
                 'error': 'File data is required'
             }), 400
         
-        # Prepare Document AI request
-        # Include query params for confidence scores and disable HTML encoding
-        url = f"{instance_url}/services/data/{api_version}/ssot/document-processing/actions/extract-data?htmlEncode=false&extractDataWithConfidenceScore=true"
+        callback_url = data.get('callback_url')
+        callback_error = callback_url_error(callback_url) if callback_url else None
+        if callback_error:
+            return jsonify({
+                'success': False,
+                'error': callback_error
+            }), 400
         
+        metrics.label(ml_model=ml_model, api_version=api_version,
+                      schema_family=metrics.schema_family(schema, idp_config_name))
         logger.info(f"=== Document AI Request ===")
-        logger.info(f"URL: {url}")
         logger.info(f"Instance URL: {instance_url}")
         logger.info(f"API Version: {api_version}")
         
-        # Check if idpConfigurationIdOrName is provided (pre-configured Document AI)
-        idp_config = idp_config_name
-        
-        # schemaConfig must be a JSON string (escaped), not an object
-        schema_config_str = json.dumps(schema) if isinstance(schema, dict) else schema
-        
-        if idp_config:
+        if idp_config_name:
             # Use pre-configured Document AI configuration
-            logger.info(f"Using IDP Configuration: {idp_config}")
-            payload = {
-                "idpConfigurationIdOrName": idp_config,
-                "files": [
-                    {
-                        "mimeType": file_data.get('mime_type', 'application/pdf'),
-                        "data": file_data.get('base64_data')
-                    }
-                ]
-            }
+            logger.info(f"Using IDP Configuration: {idp_config_name}")
         else:
             # Use dynamic schema with ML model (as shown in Postman)
             logger.info(f"Using ML Model: {ml_model}")
-            # Ensure schema_config_str is not None
-            if not schema_config_str:
-                 schema_config_str = "{}" 
-            
-            logger.info(f"Schema Config: {str(schema_config_str)[:200]}...")
-            
-            payload = {
-                "mlModel": ml_model,
-                "schemaConfig": schema_config_str,
-                "files": [
-                    {
-                        "mimeType": file_data.get('mime_type', 'application/pdf'),
-                        "data": file_data.get('base64_data')[:50] + "..." if file_data.get('base64_data') else None
-                    }
-                ]
-            }
-            # Log payload keys only (not full base64)
-            logger.info(f"Payload keys: {list(payload.keys())}")
-            
-            # Rebuild actual payload for the request
-            payload = {
-                "mlModel": ml_model,
-                "schemaConfig": schema_config_str,
-                "files": [
-                    {
-                        "mimeType": file_data.get('mime_type', 'application/pdf'),
-                        "data": file_data.get('base64_data')
-                    }
-                ]
-            }
-        
-        headers = {
-            'Content-Type': 'application/json',
-            'Authorization': f'Bearer {access_token}'
-        }
-        
-        # Make request to Document AI API
-        response = requests.post(url, headers=headers, json=payload, timeout=160)
+            logger.info(f"Schema Config: {str(document_ai.build_schema_config(schema))[:200]}...")
         
-        logger.info(f"API Response Status: {response.status_code}")
+        extract_params = {
+            'access_token': access_token,
+            'instance_url': instance_url,
+            'api_version': api_version,
+            'file_data': file_data,
+            'schema': schema,
+            'ml_model': ml_model,
+            'idp_config_name': idp_config_name,
+            'use_cache': not data.get('bypass_cache', False),
+            'split': data.get('split_pages', True),
+            'preprocess': data.get('preprocess'),
+            'confidence_threshold': data.get('confidence_threshold'),
+            'reextract': data.get('reextract_low_confidence'),
+            'model_fallback': data.get('model_fallback')
+        }
         
-        if response.status_code in [200, 201]:
-            try:
-                json_response = response.json()
-                logger.info(f"API Response Content (Keys): {list(json_response.keys())}")
-                
-                if 'data' in json_response and len(json_response['data']) > 0:
-                    result_data = json_response['data'][0]
-                    logger.info(f"Result Data Keys: {list(result_data.keys())}")
-                    
-                    # Check for error (ignore if None)
-                    if result_data.get('error'):
-                        logger.error(f"API returned error in data: {result_data['error']}")
-                        return jsonify({
-                            'success': False,
-                            'error': result_data['error']
-                        }), 500
-                    
-                    # Check for data
-                    if 'data' in result_data and result_data['data']:
-                        # Parse the nested JSON string
-                        extracted_data_str = result_data['data']
-                        # Replace HTML entities
-                        extracted_data_str = extracted_data_str.replace('&quot;', '"').replace('&#92;', '\\')
-                        try:
-                            extracted_data = json.loads(extracted_data_str)
-                            return jsonify({
-                                'success': True,
-                                'data': extracted_data
-                            })
-                        except Exception as e:
-                            logger.error(f"Failed to parse inner JSON: {str(e)}")
-                            logger.error(f"Inner JSON content: {extracted_data_str[:500]}")
-                            return jsonify({
-                                'success': False,
-                                'error': f'Failed to parse extracted data: {str(e)}'
-                            }), 500
-                    else:
-                        logger.error(f"Unexpected result data keys: {list(result_data.keys())}")
-                        return jsonify({
-                            'success': False,
-                            'error': 'No extracted data in response (missing "data" field)',
-                            'raw_response': str(result_data)[:500]
-                        }), 500
-                else:
-                    logger.error(f"Unexpected response format (no data list): {str(json_response)[:500]}")
-                    return jsonify({
-                        'success': False,
-                        'error': 'Unexpected response format (no data list)',
-                        'raw_response': str(json_response)[:500]
-                    }), 500
-                    
-            except json.JSONDecodeError as e:
-                logger.error(f"JSON Decode Error: {str(e)}")
-                return jsonify({
-                    'success': False,
-                    'error': f'Error parsing response: {str(e)}',
-                    'raw_response': response.text[:500]
-                }), 500
-            except Exception as e:
-                logger.exception("Error processing success response:")
-                return jsonify({
-                    'success': False,
-                    'error': f'Processing error: {str(e)}'
-                }), 500
-        else:
-            logger.error(f"API Error Response: {response.text}")
-            error_text = response.text
-            try:
-                error_json = response.json()
-                error_text = error_json.get('message', error_json.get('error', error_text))
-            except:
-                pass
-            
+        # Async mode: queue the extraction and return a job ID right away
+        if data.get('async'):
+            # Uploaded streams close with the request; queued jobs keep a base64 copy
+            extract_params['file_data'] = uploads.detach(file_data)
+            job_id = job_queue.submit(extract_params, callback_url=callback_url)
+            logger.info(f"Queued document processing job {job_id}")
             return jsonify({
-                'success': False,
-                'error': f'Document AI request failed: {error_text}',
-                'status_code': response.status_code
-            }), response.status_code
+                'success': True,
+                'job_id': job_id,
+                'status': 'queued',
+                'status_url': f'/api/jobs/{job_id}'
+            }), 202
+        
+        # A client time budget caps the outbound timeouts instead of the fixed 160 s
+        deadline = circuit_breaker.deadline_from(data.get('timeout') or request.headers.get('X-Request-Timeout'))
+        status_code, body = extract_with_token(dict(extract_params, deadline=deadline))
+        return jsonify(body), status_code
             
     except json.JSONDecodeError as e:
         return jsonify({
             'success': False,
             'error': f'Invalid JSON in request: {str(e)}'
         }), 400
+    except uploads.UploadError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), e.status_code
     except requests.exceptions.RequestException as e:
         return jsonify({
             'success': False,
@@ -719,7 +625,138 @@ def api_process_document():
             'error': f'Server error: {str(e)}'
         }), 500
 
+@app.route('/api/cache-stats', methods=['GET'])
+def api_cache_stats():
+    """Report extract-data result cache hit/miss statistics"""
+    return jsonify(result_cache.get_stats())
+
+@app.route('/api/token-stats', methods=['GET'])
+def api_token_stats():
+    """Report server-side token refresh statistics"""
+    return jsonify(token_manager.get_stats())
+
+@app.route('/api/model-stats', methods=['GET'])
+def api_model_stats():
+    """Report per-model latency histograms, errors and fallbacks"""
+    return jsonify(model_router.get_stats())
+
+@app.route('/api/governor-stats', methods=['GET'])
+def api_governor_stats():
+    """Report per-org Document AI call rate, in-flight calls and queueing"""
+    return jsonify(governor.get_stats())
+
+@app.route('/api/circuit-stats', methods=['GET'])
+def api_circuit_stats():
+    """Report the circuit breaker state of every Salesforce instance"""
+    return jsonify(circuit_breaker.get_stats())
+
+@app.route('/metrics', methods=['GET'])
+def api_metrics():
+    """Request phase latency histograms in the Prometheus text format"""
+    return app.response_class(metrics.render(), content_type=metrics.CONTENT_TYPE)
+
+@app.route('/api/jobs/<job_id>', methods=['GET'])
+def api_job_status(job_id):
+    """Poll an asynchronous document processing job"""
+    job = job_queue.get(job_id)
+    if not job:
+        return jsonify({
+            'success': False,
+            'error': 'Job not found'
+        }), 404
+    
+    return jsonify(job)
+
+@app.route('/api/jobs-metrics', methods=['GET'])
+def api_job_metrics():
+    """Report job queue depth, wait time and run time"""
+    return jsonify(job_queue.metrics())
+
+@app.route('/api/process-batch', methods=['POST', 'OPTIONS'])
+def api_process_batch():
+    """Process many documents with as few Document AI calls as possible"""
+    if request.method == 'OPTIONS':
+        return '', 200
+    
+    try:
+        data = read_json(silent=True)
+        if data is None:
+            return jsonify({
+                'success': False,
+                'error': 'Invalid JSON in request body'
+            }), 400
+        
+        access_token = data.get('access_token')
+        instance_url = data.get('instance_url')
+        # A registered schema can be referenced by name or hash instead of sent inline
+        schema = data.get('schema') or schemas.resolve_schema(data.get('schema_id'))
+        ml_model = data.get('mlModel') or model_router.default_model()
+        api_version = data.get('api_version', API_VERSION)
+        
+        # AUTO-FIX: v60.0 is too old for Document AI. Force upgrade to v65.0.
+        if api_version == 'v60.0':
+            api_version = 'v65.0'
+            
+        files = data.get('files')
+        idp_config_name = data.get('idpConfigurationIdOrName')
+        
+        if not access_token or not instance_url:
+            return jsonify({
+                'success': False,
+                'error': 'Authentication required. Please authenticate with Salesforce first.'
+            }), 401
+        
+        if not idp_config_name and not schema:
+            return jsonify({
+                'success': False,
+                'error': 'Schema is required when not using a pre-configured IDP'
+            }), 400
+        
+        if not files or not isinstance(files, list) or not all(isinstance(f, dict) and f.get('base64_data') for f in files):
+            return jsonify({
+                'success': False,
+                'error': 'A non-empty files list with base64_data for every file is required'
+            }), 400
+        
+        try:
+            max_batch_size, max_payload_bytes = document_ai.batch_limits(data.get('max_batch_size'),
+                                                                         data.get('max_payload_bytes'))
+        except ValueError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 400
+        
+        logger.info(f"Batch request: {len(files)} files, API Version: {api_version}")
+        metrics.label(ml_model=ml_model, api_version=api_version,
+                      schema_family=metrics.schema_family(schema, idp_config_name))
+        
+        batch_result = document_ai.extract_batch(
+            token_manager.manager.resolve(access_token), instance_url, api_version, files,
+            schema=schema,
+            ml_model=ml_model,
+            idp_config_name=idp_config_name,
+            max_batch_size=max_batch_size,
+            max_payload_bytes=max_payload_bytes
+        )
+        
+        logger.info(f"Batch summary: {batch_result['summary']}")
+        
+        return jsonify({
+            'success': batch_result['summary']['succeeded'] > 0,
+            'results': batch_result['results'],
+            'summary': batch_result['summary']
+        })
+        
+    except Exception as e:
+        logger.exception("Batch processing error:")
+        return jsonify({
+            'success': False,
+            'error': f'Server error: {str(e)}'
+        }), 500
+
 if __name__ == '__main__':
     port = int(os.environ.get('PORT', 5001))
-    app.run(debug=True, port=port, host='0.0.0.0')
+    # Development server only; use backend/serve.py in production
+    app.run(debug=os.environ.get('FLASK_DEBUG', 'false').lower() == 'true', port=port, host='0.0.0.0')
 
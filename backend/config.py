@@ -11,5 +11,5 @@ CLIENT_ID = os.environ.get("CLIENT_ID")
 CLIENT_SECRET = os.environ.get("CLIENT_SECRET")
 API_VERSION = os.environ.get("API_VERSION", "v60.0")
 
-DEFAULT_ML_MODEL = "llmgateway__VertexAIGemini20Flash001"
+DEFAULT_ML_MODEL = os.environ.get("DEFAULT_ML_MODEL", "llmgateway__VertexAIGemini20Flash001")
 
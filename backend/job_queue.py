@@ -0,0 +1,452 @@
+"""
+Background job queue for asynchronous document processing.
+
+Jobs are stored either in process memory or in a SQLite database (so several
+worker processes on one host can share a queue) and executed by a pool of
+daemon worker threads. Finished jobs can be polled by ID or pushed to an
+optional callback URL.
+
+The SQLite store never writes access tokens to disk: they stay in the memory
+of the process that accepted the job, which runs it. Every process writes a
+heartbeat from its own thread; once a process has sent none for
+JOB_LEASE_SECONDS its queued and running jobs are taken over by another one,
+and since their token went with the process they fail with a request to
+submit them again.
+"""
+import os
+import json
+import time
+import uuid
+import socket
+import sqlite3
+import logging
+import ipaddress
+import threading
+from urllib.parse import urlparse
+
+import requests
+
+JOB_BACKEND = os.environ.get("JOB_BACKEND", "memory")
+JOB_DB_PATH = os.environ.get("JOB_DB_PATH", "jobs.sqlite3")
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+JOB_RESULT_TTL = int(os.environ.get("JOB_RESULT_TTL", "3600"))
+JOB_POLL_INTERVAL = float(os.environ.get("JOB_POLL_INTERVAL", "0.5"))
+# A process that has sent no heartbeat for this long is assumed to have exited
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "60"))
+# Comma-separated hosts callbacks may go to; when empty any host resolving to public addresses is allowed
+JOB_CALLBACK_HOSTS = {host.strip().lower() for host in os.environ.get("JOB_CALLBACK_HOSTS", "").split(',')
+                      if host.strip()}
+CALLBACK_TIMEOUT = 10
+# Payload fields kept in process memory only
+SECRET_FIELDS = ('access_token',)
+
+logger = logging.getLogger(__name__)
+
+
+def callback_url_error(callback_url):
+    """Why a callback URL is refused, or None when jobs may POST to it.
+
+    Callbacks are sent from inside the deployment, so they must not reach
+    loopback, private, link-local (cloud metadata) or other internal addresses.
+    """
+    parsed = urlparse(callback_url or '')
+    if parsed.scheme not in ('http', 'https') or not parsed.hostname:
+        return 'callback_url must be an http(s) URL'
+    host = parsed.hostname.lower()
+    if JOB_CALLBACK_HOSTS:
+        return None if host in JOB_CALLBACK_HOSTS else f'callback_url host {host} is not allowed'
+    try:
+        infos = socket.getaddrinfo(host, parsed.port or 443, proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError, ValueError):
+        return f'callback_url host {host} cannot be resolved'
+    for info in infos:
+        address = ipaddress.ip_address(info[4][0].split('%')[0])
+        if address.version == 6 and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global:
+            return 'callback_url must not point to a private, loopback or link-local address'
+    return None
+
+
+class MemoryJobStore:
+    """Keeps jobs in a dict guarded by a condition variable"""
+
+    def __init__(self):
+        self._jobs = {}
+        self._queue = []
+        self._cond = threading.Condition()
+
+    def add(self, job):
+        with self._cond:
+            self._jobs[job['id']] = job
+            self._queue.append(job['id'])
+            self._cond.notify()
+
+    def claim(self, timeout):
+        """Mark the oldest queued job as running and return it, or None after timeout"""
+        with self._cond:
+            if not self._queue:
+                self._cond.wait(timeout)
+            if not self._queue:
+                return None
+            job = self._jobs[self._queue.pop(0)]
+            job['status'] = 'running'
+            job['started_at'] = time.time()
+            return dict(job)
+
+    def finish(self, job_id, status, status_code, result):
+        with self._cond:
+            job = self._jobs[job_id]
+            job.update({
+                'status': status,
+                'status_code': status_code,
+                'result': result,
+                'finished_at': time.time(),
+                'payload': None
+            })
+
+    def get(self, job_id):
+        with self._cond:
+            job = self._jobs.get(job_id)
+            return dict(job) if job else None
+
+    def purge(self, older_than):
+        with self._cond:
+            expired = [k for k, j in self._jobs.items() if j['finished_at'] and j['finished_at'] < older_than]
+            for job_id in expired:
+                del self._jobs[job_id]
+
+    def depth(self):
+        with self._cond:
+            return len(self._queue)
+
+
+class SQLiteJobStore:
+    """Keeps jobs in SQLite so they survive restarts and can be shared between processes.
+
+    Each job is run by the process that accepted it, which holds its access
+    token; other processes only take it over once that process has stopped
+    sending heartbeats. Heartbeats come from a dedicated thread, so a process
+    whose job workers are all busy still counts as alive.
+    """
+
+    _COLUMNS = ('id', 'status', 'payload', 'callback_url', 'status_code', 'result',
+                'created_at', 'started_at', 'finished_at', 'owner')
+
+    def __init__(self, path=JOB_DB_PATH, lease_seconds=JOB_LEASE_SECONDS):
+        self.path = path
+        self.lease_seconds = lease_seconds
+        self.worker_id = uuid.uuid4().hex
+        self._secrets = {}
+        self._secrets_lock = threading.Lock()
+        self._local = threading.local()
+        with self._connect() as conn:
+            conn.execute("""
+                CREATE TABLE IF NOT EXISTS jobs (
+                    id TEXT PRIMARY KEY,
+                    status TEXT NOT NULL,
+                    payload TEXT,
+                    callback_url TEXT,
+                    status_code INTEGER,
+                    result TEXT,
+                    created_at REAL NOT NULL,
+                    started_at REAL,
+                    finished_at REAL
+                )
+            """)
+            conn.execute("CREATE INDEX IF NOT EXISTS jobs_status_created ON jobs (status, created_at)")
+            conn.execute("CREATE TABLE IF NOT EXISTS job_workers (id TEXT PRIMARY KEY, seen_at REAL NOT NULL)")
+            try:
+                conn.execute("ALTER TABLE jobs ADD COLUMN owner TEXT")
+            except sqlite3.OperationalError:
+                pass
+            # Databases written before tokens were kept out of them
+            for field in SECRET_FIELDS:
+                conn.execute("UPDATE jobs SET payload = json_remove(payload, ?) WHERE payload IS NOT NULL",
+                             (f'$.{field}',))
+        # Beat once before accepting jobs so other processes never see them ownerless
+        self._heartbeat()
+        threading.Thread(target=self._heartbeat_loop, name='job-heartbeat', daemon=True).start()
+
+    def _connect(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            self._local.conn = conn
+        return conn
+
+    def _row_to_job(self, row):
+        if row is None:
+            return None
+        job = dict(zip(self._COLUMNS, row))
+        job['payload'] = json.loads(job['payload']) if job['payload'] else None
+        job['result'] = json.loads(job['result']) if job['result'] else None
+        return job
+
+    def add(self, job):
+        payload = dict(job['payload'] or {})
+        secrets = {field: payload.pop(field) for field in SECRET_FIELDS if field in payload}
+        with self._secrets_lock:
+            self._secrets[job['id']] = secrets
+        self._connect().execute(
+            "INSERT INTO jobs (id, status, payload, callback_url, created_at, owner) VALUES (?, ?, ?, ?, ?, ?)",
+            (job['id'], job['status'], json.dumps(payload), job['callback_url'], job['created_at'], self.worker_id)
+        )
+
+    def _heartbeat(self):
+        now = time.time()
+        conn = self._connect()
+        conn.execute("INSERT OR REPLACE INTO job_workers (id, seen_at) VALUES (?, ?)", (self.worker_id, now))
+        conn.execute("DELETE FROM job_workers WHERE seen_at < ?", (now - self.lease_seconds,))
+
+    def _heartbeat_loop(self):
+        # Several beats per lease, so one slow write does not make this process look dead
+        interval = min(5.0, self.lease_seconds / 4)
+        while True:
+            time.sleep(interval)
+            try:
+                self._heartbeat()
+            except sqlite3.Error:
+                logger.exception("Job heartbeat failed")
+
+    def claim(self, timeout):
+        """Mark the oldest job this process may run as running and return it, or None after timeout.
+
+        A job taken over from a process that exited carries no access token and
+        comes back with ``orphaned`` set.
+        """
+        conn = self._connect()
+        deadline = time.time() + timeout
+        while True:
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                now = time.time()
+                alive = "(SELECT id FROM job_workers WHERE seen_at >= ?)"
+                # Jobs of a process that exited mid-run (e.g. recycled by gunicorn's max_requests)
+                conn.execute("UPDATE jobs SET status = 'queued', started_at = NULL WHERE status = 'running' "
+                             f"AND (owner IS NULL OR owner NOT IN {alive})", (now - self.lease_seconds,))
+                row = conn.execute(
+                    "SELECT id FROM jobs WHERE status = 'queued' AND (owner = ? OR owner IS NULL OR owner NOT IN "
+                    f"{alive}) ORDER BY created_at LIMIT 1",
+                    (self.worker_id, now - self.lease_seconds)
+                ).fetchone()
+                if row:
+                    conn.execute(
+                        "UPDATE jobs SET status = 'running', started_at = ?, owner = ? WHERE id = ?",
+                        (now, self.worker_id, row[0])
+                    )
+                conn.execute("COMMIT")
+            except Exception:
+                conn.execute("ROLLBACK")
+                raise
+            if row:
+                job = self.get(row[0])
+                with self._secrets_lock:
+                    secrets = self._secrets.get(job['id'])
+                if secrets is None:
+                    job['orphaned'] = True
+                else:
+                    job['payload'] = dict(job['payload'] or {}, **secrets)
+                return job
+            if time.time() >= deadline:
+                return None
+            time.sleep(min(JOB_POLL_INTERVAL, timeout))
+
+    def finish(self, job_id, status, status_code, result):
+        with self._secrets_lock:
+            self._secrets.pop(job_id, None)
+        self._connect().execute(
+            "UPDATE jobs SET status = ?, status_code = ?, result = ?, finished_at = ?, payload = NULL WHERE id = ?",
+            (status, status_code, json.dumps(result), time.time(), job_id)
+        )
+
+    def get(self, job_id):
+        row = self._connect().execute(
+            f"SELECT {', '.join(self._COLUMNS)} FROM jobs WHERE id = ?", (job_id,)
+        ).fetchone()
+        return self._row_to_job(row)
+
+    def purge(self, older_than):
+        self._connect().execute(
+            "DELETE FROM jobs WHERE finished_at IS NOT NULL AND finished_at < ?", (older_than,)
+        )
+
+    def depth(self):
+        return self._connect().execute("SELECT COUNT(*) FROM jobs WHERE status = 'queued'").fetchone()[0]
+
+
+class JobQueue:
+    """Runs ``handler(payload) -> (status_code, body)`` for queued jobs on a worker pool"""
+
+    def __init__(self, handler, store=None, workers=JOB_WORKERS, result_ttl=JOB_RESULT_TTL):
+        self.handler = handler
+        self.store = store or (SQLiteJobStore() if JOB_BACKEND == 'sqlite' else MemoryJobStore())
+        self.workers = workers
+        self.result_ttl = result_ttl
+        self._threads = []
+        self._stop = threading.Event()
+        self._started = False
+        self._start_lock = threading.Lock()
+        self._stats_lock = threading.Lock()
+        # Jobs submitted here and not finished yet (their access token lives in this process)
+        self._pending = set()
+        self._stats = {
+            'submitted': 0,
+            'succeeded': 0,
+            'failed': 0,
+            'running': 0,
+            'wait_time_total': 0.0,
+            'wait_time_max': 0.0,
+            'run_time_total': 0.0,
+            'run_time_max': 0.0
+        }
+
+    def start(self):
+        """Start worker threads (idempotent; called lazily on first submit)"""
+        with self._start_lock:
+            if self._started:
+                return
+            for i in range(self.workers):
+                thread = threading.Thread(target=self._worker, name=f'job-worker-{i}', daemon=True)
+                thread.start()
+                self._threads.append(thread)
+            self._started = True
+
+    def stop(self):
+        self._stop.set()
+
+    def drain(self, timeout):
+        """Let the jobs submitted here finish (up to `timeout` seconds), then stop the workers.
+
+        Called as the process exits (gunicorn's worker_exit): once it is gone its
+        jobs can only fail as orphaned. Returns how many were left unfinished.
+        """
+        deadline = time.time() + timeout
+        while time.time() < deadline:
+            with self._stats_lock:
+                if not self._pending:
+                    break
+            time.sleep(min(JOB_POLL_INTERVAL, max(deadline - time.time(), 0)))
+        self.stop()
+        with self._stats_lock:
+            left = len(self._pending)
+        if left:
+            logger.warning(f"{left} jobs left unfinished at exit")
+        return left
+
+    def submit(self, payload, callback_url=None):
+        """Queue a job and return its ID"""
+        self.start()
+        job_id = uuid.uuid4().hex
+        self.store.add({
+            'id': job_id,
+            'status': 'queued',
+            'payload': payload,
+            'callback_url': callback_url,
+            'status_code': None,
+            'result': None,
+            'created_at': time.time(),
+            'started_at': None,
+            'finished_at': None
+        })
+        with self._stats_lock:
+            self._stats['submitted'] += 1
+            self._pending.add(job_id)
+        self.store.purge(time.time() - self.result_ttl)
+        return job_id
+
+    def get(self, job_id):
+        """Public view of a job (without its payload)"""
+        job = self.store.get(job_id)
+        if not job:
+            return None
+        view = {
+            'job_id': job['id'],
+            'status': job['status'],
+            'created_at': job['created_at'],
+            'started_at': job['started_at'],
+            'finished_at': job['finished_at']
+        }
+        if job['status'] in ('succeeded', 'failed'):
+            view['status_code'] = job['status_code']
+            view['result'] = job['result']
+        return view
+
+    def metrics(self):
+        """Queue depth plus wait/run time aggregates for this process"""
+        with self._stats_lock:
+            stats = dict(self._stats)
+        finished = stats['succeeded'] + stats['failed']
+        started = finished + stats['running']
+        return {
+            'queue_depth': self.store.depth(),
+            'workers': self.workers,
+            'running': stats['running'],
+            'submitted': stats['submitted'],
+            'succeeded': stats['succeeded'],
+            'failed': stats['failed'],
+            'wait_time_avg': round(stats['wait_time_total'] / started, 4) if started else 0.0,
+            'wait_time_max': round(stats['wait_time_max'], 4),
+            'run_time_avg': round(stats['run_time_total'] / finished, 4) if finished else 0.0,
+            'run_time_max': round(stats['run_time_max'], 4)
+        }
+
+    def _worker(self):
+        while not self._stop.is_set():
+            try:
+                job = self.store.claim(timeout=1.0)
+            except Exception:
+                logger.exception("Failed to claim job")
+                time.sleep(1.0)
+                continue
+            if job:
+                self._run(job)
+
+    def _run(self, job):
+        wait_time = job['started_at'] - job['created_at']
+        with self._stats_lock:
+            self._stats['running'] += 1
+            self._stats['wait_time_total'] += wait_time
+            self._stats['wait_time_max'] = max(self._stats['wait_time_max'], wait_time)
+
+        try:
+            if job.get('orphaned'):
+                # The access token was only held by the worker that accepted the job
+                status_code, result = 401, {
+                    'success': False,
+                    'error': 'The worker that accepted this job exited and its access token is not stored; '
+                             'submit the document again.'
+                }
+            else:
+                status_code, result = self.handler(job['payload'])
+        except Exception as e:
+            logger.exception(f"Job {job['id']} crashed")
+            status_code, result = 500, {'success': False, 'error': f'Server error: {str(e)}'}
+
+        status = 'succeeded' if result.get('success') else 'failed'
+        self.store.finish(job['id'], status, status_code, result)
+
+        run_time = time.time() - job['started_at']
+        with self._stats_lock:
+            self._stats['running'] -= 1
+            self._stats[status] += 1
+            self._stats['run_time_total'] += run_time
+            self._stats['run_time_max'] = max(self._stats['run_time_max'], run_time)
+
+        if job['callback_url']:
+            self._notify(job['id'], job['callback_url'])
+        with self._stats_lock:
+            self._pending.discard(job['id'])
+
+    def _notify(self, job_id, callback_url):
+        """POST the finished job to its callback URL (best effort)"""
+        # Checked again in case the host now resolves elsewhere; redirects are not followed for the same reason
+        error = callback_url_error(callback_url)
+        if error:
+            logger.warning(f"Callback for job {job_id} skipped: {error}")
+            return
+        try:
+            requests.post(callback_url, json=self.get(job_id), timeout=CALLBACK_TIMEOUT, allow_redirects=False)
+        except requests.exceptions.RequestException as e:
+            logger.warning(f"Callback for job {job_id} to {callback_url} failed: {str(e)}")
@@ -0,0 +1,110 @@
+"""
+Production launcher for the Flask backends (gunicorn, threaded workers).
+
+Run: python backend/serve.py                 # serves app_local.py
+     WEB_APP=app python backend/serve.py     # serves app.py
+
+Worker processes each run a thread pool and are recycled after WEB_MAX_REQUESTS
+requests. Send SIGHUP to the master for a graceful restart (new workers start,
+old ones finish their in-flight requests) and SIGTERM for a graceful shutdown.
+An exiting worker first finishes the async jobs it accepted, whose access
+tokens only it holds. Token refresh (api/token_manager.py) is per process too:
+it only knows the tokens of users whose OAuth callback that worker served.
+"""
+import os
+import sys
+import secrets
+import importlib
+import multiprocessing
+
+from gunicorn.app.base import BaseApplication
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Launcher configuration (overridable via environment variables)
+WEB_APP = os.environ.get("WEB_APP", "app_local")
+WEB_BIND = os.environ.get("WEB_BIND", f"0.0.0.0:{os.environ.get('PORT', '5001')}")
+WEB_WORKERS = int(os.environ.get("WEB_WORKERS", str(multiprocessing.cpu_count())))
+WEB_THREADS = int(os.environ.get("WEB_THREADS", "16"))
+# Recycle workers to cap memory growth from large base64 bodies
+WEB_MAX_REQUESTS = int(os.environ.get("WEB_MAX_REQUESTS", "1000"))
+WEB_MAX_REQUESTS_JITTER = int(os.environ.get("WEB_MAX_REQUESTS_JITTER", "100"))
+# Must outlast the 160 s extract-data timeout
+WEB_TIMEOUT = int(os.environ.get("WEB_TIMEOUT", "180"))
+WEB_GRACEFUL_TIMEOUT = int(os.environ.get("WEB_GRACEFUL_TIMEOUT", "170"))
+WEB_KEEPALIVE = int(os.environ.get("WEB_KEEPALIVE", "5"))
+WEB_BACKLOG = int(os.environ.get("WEB_BACKLOG", "2048"))
+LOG_LEVEL = os.environ.get("LOG_LEVEL", "info")
+
+
+def options():
+    """gunicorn settings built from the environment"""
+    settings = {
+        'bind': WEB_BIND,
+        'workers': WEB_WORKERS,
+        'worker_class': 'gthread',
+        'threads': WEB_THREADS,
+        'max_requests': WEB_MAX_REQUESTS,
+        'max_requests_jitter': WEB_MAX_REQUESTS_JITTER,
+        'timeout': WEB_TIMEOUT,
+        'graceful_timeout': WEB_GRACEFUL_TIMEOUT,
+        'keepalive': WEB_KEEPALIVE,
+        'backlog': WEB_BACKLOG,
+        'loglevel': LOG_LEVEL.lower(),
+        'accesslog': '-',
+        # The apps start background threads at import, which must not be forked
+        'preload_app': False,
+        'chdir': BACKEND_DIR,
+        'proc_name': f'docai-mini-{WEB_APP}',
+        'worker_exit': drain_jobs
+    }
+    # Worker heartbeats on tmpfs avoid stalls on slow disks
+    if os.path.isdir('/dev/shm'):
+        settings['worker_tmp_dir'] = '/dev/shm'
+    return settings
+
+
+def drain_jobs(server, worker):
+    """gunicorn worker_exit hook: finish this worker's queued and running async jobs before it exits"""
+    job_queue = getattr(sys.modules.get(WEB_APP), 'job_queue', None)
+    if job_queue is None:
+        return
+    # The master kills a worker that stays silent past the timeout, or outlives the graceful timeout on shutdown
+    job_queue.drain(max(min(WEB_TIMEOUT, WEB_GRACEFUL_TIMEOUT) - 5, 0))
+
+
+def prepare_environment(workers):
+    """Settings every worker must agree on, fixed in the master before workers start"""
+    # Sessions signed by one worker must validate in the others
+    os.environ.setdefault('SECRET_KEY', secrets.token_hex(32))
+    os.environ.setdefault('FLASK_DEBUG', 'false')
+    if workers > 1:
+        # Uploads and async jobs must be visible to whichever worker serves the next request
+        os.environ.setdefault('UPLOAD_STORE', 'disk')
+        os.environ.setdefault('JOB_BACKEND', 'sqlite')
+
+
+class Launcher(BaseApplication):
+    def __init__(self, module_name, settings):
+        self.module_name = module_name
+        self.settings = settings
+        super().__init__()
+
+    def load_config(self):
+        for key, value in self.settings.items():
+            self.cfg.set(key, value)
+
+    def load(self):
+        if BACKEND_DIR not in sys.path:
+            sys.path.insert(0, BACKEND_DIR)
+        return importlib.import_module(self.module_name).app
+
+
+def main():
+    settings = options()
+    prepare_environment(settings['workers'])
+    Launcher(WEB_APP, settings).run()
+
+
+if __name__ == '__main__':
+    main()
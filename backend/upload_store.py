@@ -0,0 +1,233 @@
+"""
+Server-side store for uploaded documents.
+
+Uploads are content-addressed (SHA-256 of the file bytes), so the Flask
+session only needs to carry the upload ID instead of the whole base64 file.
+"""
+import os
+import io
+import json
+import time
+import hashlib
+import tempfile
+import threading
+
+UPLOAD_STORE = os.environ.get("UPLOAD_STORE", "disk")
+UPLOAD_DIR = os.environ.get("UPLOAD_DIR", os.path.join(tempfile.gettempdir(), "docai-mini-uploads"))
+UPLOAD_MAX_BYTES = int(os.environ.get("UPLOAD_MAX_BYTES", str(50 * 1024 * 1024)))
+UPLOAD_STORE_MAX_BYTES = int(os.environ.get("UPLOAD_STORE_MAX_BYTES", str(500 * 1024 * 1024)))
+UPLOAD_TTL = int(os.environ.get("UPLOAD_TTL", "3600"))
+
+CHUNK_SIZE = 64 * 1024
+
+
+class UploadTooLargeError(ValueError):
+    """Raised when an upload exceeds the per-file size limit"""
+
+
+class _BaseUploadStore:
+    def __init__(self, max_bytes=UPLOAD_MAX_BYTES, max_total_bytes=UPLOAD_STORE_MAX_BYTES, ttl=UPLOAD_TTL):
+        self.max_bytes = max_bytes
+        self.max_total_bytes = max_total_bytes
+        self.ttl = ttl
+        self._meta = {}
+        self._lock = threading.Lock()
+
+    def put_stream(self, stream, filename, mime_type):
+        """Store an upload read from a binary stream and return its upload ID"""
+        digest = hashlib.sha256()
+        size = 0
+        sink = self._open_sink()
+        try:
+            while True:
+                chunk = stream.read(CHUNK_SIZE)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if size > self.max_bytes:
+                    raise UploadTooLargeError(f'File exceeds the {self.max_bytes} byte upload limit')
+                digest.update(chunk)
+                sink.write(chunk)
+        except BaseException:
+            self._discard_sink(sink)
+            raise
+
+        upload_id = digest.hexdigest()
+        self._commit_sink(sink, upload_id)
+
+        with self._lock:
+            self._meta[upload_id] = {
+                'upload_id': upload_id,
+                'filename': filename,
+                'mime_type': mime_type,
+                'size': size,
+                'expires_at': time.time() + self.ttl
+            }
+            self._persist_meta(upload_id)
+        self.evict()
+        return upload_id
+
+    def put_bytes(self, data, filename, mime_type):
+        """Store an in-memory upload and return its upload ID"""
+        return self.put_stream(io.BytesIO(data), filename, mime_type)
+
+    def get_meta(self, upload_id):
+        """Return upload metadata, or None if unknown or expired"""
+        with self._lock:
+            meta = self._meta.get(upload_id) or self._load_meta(upload_id)
+            if not meta:
+                return None
+            if meta['expires_at'] < time.time():
+                self._remove(upload_id)
+                return None
+            return dict(meta)
+
+    def iter_chunks(self, upload_id, chunk_size=CHUNK_SIZE):
+        """Yield the raw bytes of an upload in chunks"""
+        with self.open(upload_id) as f:
+            while True:
+                chunk = f.read(chunk_size)
+                if not chunk:
+                    break
+                yield chunk
+
+    def delete(self, upload_id):
+        with self._lock:
+            self._remove(upload_id)
+
+    def evict(self):
+        """Drop expired uploads, then the oldest ones until the store fits its byte budget"""
+        now = time.time()
+        with self._lock:
+            uploads = self._scan_meta(now)
+            for upload_id in [k for k, m in uploads.items() if m['expires_at'] < now]:
+                self._remove(upload_id)
+                del uploads[upload_id]
+
+            total = sum(m['size'] for m in uploads.values())
+            for upload_id in sorted(uploads, key=lambda k: uploads[k]['expires_at']):
+                if total <= self.max_total_bytes:
+                    break
+                total -= uploads[upload_id]['size']
+                self._remove(upload_id)
+
+    def _remove(self, upload_id):
+        self._meta.pop(upload_id, None)
+        self._delete_data(upload_id)
+
+    def _persist_meta(self, upload_id):
+        pass
+
+    def _load_meta(self, upload_id):
+        return None
+
+    def _scan_meta(self, now):
+        """Metadata of every stored upload, keyed by upload ID"""
+        return dict(self._meta)
+
+
+class MemoryUploadStore(_BaseUploadStore):
+    """Keeps uploads in process memory (single-process deployments only)"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._data = {}
+
+    def _open_sink(self):
+        return io.BytesIO()
+
+    def _discard_sink(self, sink):
+        sink.close()
+
+    def _commit_sink(self, sink, upload_id):
+        self._data[upload_id] = sink.getvalue()
+        sink.close()
+
+    def open(self, upload_id):
+        data = self._data.get(upload_id)
+        if data is None:
+            raise KeyError(upload_id)
+        return io.BytesIO(data)
+
+    def _delete_data(self, upload_id):
+        self._data.pop(upload_id, None)
+
+
+class DiskUploadStore(_BaseUploadStore):
+    """Keeps uploads on local disk so they are shared by every worker on the host"""
+
+    def __init__(self, directory=UPLOAD_DIR, **kwargs):
+        super().__init__(**kwargs)
+        self.directory = directory
+        os.makedirs(self.directory, exist_ok=True)
+
+    def _path(self, upload_id, suffix=''):
+        # Upload IDs are hex digests; refuse anything else to keep paths inside the store
+        if not upload_id or any(c not in '0123456789abcdef' for c in upload_id):
+            raise KeyError(upload_id)
+        return os.path.join(self.directory, upload_id + suffix)
+
+    def _open_sink(self):
+        return tempfile.NamedTemporaryFile(dir=self.directory, delete=False, suffix='.part')
+
+    def _discard_sink(self, sink):
+        sink.close()
+        if os.path.exists(sink.name):
+            os.remove(sink.name)
+
+    def _commit_sink(self, sink, upload_id):
+        sink.close()
+        os.replace(sink.name, self._path(upload_id))
+
+    def open(self, upload_id):
+        return open(self._path(upload_id), 'rb')
+
+    def _persist_meta(self, upload_id):
+        with open(self._path(upload_id, '.json'), 'w') as f:
+            json.dump(self._meta[upload_id], f)
+
+    def _load_meta(self, upload_id):
+        try:
+            with open(self._path(upload_id, '.json')) as f:
+                meta = json.load(f)
+        except (OSError, ValueError, KeyError):
+            return None
+        self._meta[upload_id] = meta
+        return meta
+
+    def _scan_meta(self, now):
+        # Read from the directory, so uploads of other workers (including recycled ones) are evicted too
+        uploads = {}
+        for entry in os.scandir(self.directory):
+            name, suffix = os.path.splitext(entry.name)
+            if suffix == '.json':
+                meta = self._load_meta(name)
+                if meta is not None:
+                    uploads[name] = meta
+                continue
+            # Leftovers of a worker that died mid-write: partial files, or data whose metadata was never written
+            if suffix not in ('', '.part') or (not suffix and os.path.exists(entry.path + '.json')):
+                continue
+            try:
+                if entry.stat().st_mtime < now - self.ttl:
+                    os.remove(entry.path)
+            except OSError:
+                pass
+        # Uploads other workers have already removed
+        for upload_id in set(self._meta) - set(uploads):
+            del self._meta[upload_id]
+        return uploads
+
+    def _delete_data(self, upload_id):
+        for suffix in ('', '.json'):
+            try:
+                os.remove(self._path(upload_id, suffix))
+            except (OSError, KeyError):
+                pass
+
+
+def create_upload_store():
+    """Create the upload store selected by the UPLOAD_STORE environment variable"""
+    if UPLOAD_STORE == 'memory':
+        return MemoryUploadStore()
+    return DiskUploadStore()
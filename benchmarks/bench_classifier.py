@@ -0,0 +1,34 @@
+"""
+Latency of content-based document classification (target: < 20 ms per file).
+
+Run: python benchmarks/bench_classifier.py
+"""
+import os
+import sys
+import base64
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api import classifier
+from benchmarks import corpus
+
+CASES = [
+    ('invoice, 1 page', corpus.invoice_pdf(1)),
+    ('resume, 1 page', corpus.resume_pdf()),
+    ('fax batch, 20 invoices', corpus.invoice_pdf(20)),
+    ('fax batch, 200 invoices', corpus.invoice_pdf(200)),
+    ('scan, 1 page + 10 MB image', corpus.invoice_pdf(1, padding=10 * 1024 * 1024)),
+]
+
+
+def main():
+    print(f"{'document':<28} {'size KB':>9} {'family':>14} {'conf':>6} {'ms':>8}")
+    for name, data in CASES:
+        encoded = base64.b64encode(data).decode('ascii')
+        result = classifier.classify_base64(encoded)
+        seconds = min(timeit.repeat(lambda: classifier.classify_base64(encoded), number=5, repeat=3)) / 5
+        print(f"{name:<28} {len(data) / 1024:>9.0f} {str(result['family']):>14} {result['confidence']:>6.2f} {seconds * 1000:>8.2f}")
+
+
+if __name__ == '__main__':
+    main()
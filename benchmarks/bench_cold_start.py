@@ -0,0 +1,118 @@
+"""
+Import-time (cold start) report for the Vercel handlers.
+
+Every handler routed in vercel.json is imported in a fresh interpreter,
+--runs times, the way the Vercel Python runtime loads it. Reports the median
+and best import time, how many modules the import loads, which heavy
+dependencies it pulled in and, from one extra run under `python -X importtime`,
+where the time went per top-level package. Timings come from this machine's
+interpreter, not the runtime pinned in vercel.json; compare runs on the same
+machine, e.g. by keeping the --json output.
+
+Run: python benchmarks/bench_cold_start.py [--runs 7] [--top 5] [--json]
+"""
+import os
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+from collections import Counter
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+# Dependencies worth knowing about when they load at import time
+HEAVY = ('requests', 'urllib3', 'pypdf', 'PIL', 'orjson', 'asyncio', 'concurrent.futures')
+MARKER = '-- handler import --'
+
+# Runs in the child interpreter: import one handler file and report what it cost
+CHILD = '''
+import sys, json, time, importlib.util
+root, path, marker = sys.argv[1:4]
+sys.path.insert(0, root)
+before = set(sys.modules)
+sys.stderr.write(marker + "\\n")
+started = time.perf_counter()
+spec = importlib.util.spec_from_file_location("handler_under_test", path)
+module = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(module)
+elapsed = time.perf_counter() - started
+print(json.dumps({"seconds": elapsed, "modules": sorted(set(sys.modules) - before)}))
+'''
+
+
+def routed_handlers():
+    """api/*.py files that vercel.json routes requests to, in route order"""
+    with open(os.path.join(ROOT, 'vercel.json')) as f:
+        routes = json.load(f).get('routes', [])
+    handlers = []
+    for route in routes:
+        dest = route.get('dest', '').lstrip('/')
+        if dest.startswith('api/') and dest.endswith('.py') and dest not in handlers:
+            handlers.append(dest)
+    return handlers
+
+
+def import_once(path, importtime=False):
+    """(report dict, importtime stderr lines) for one fresh-interpreter import"""
+    command = [sys.executable] + (['-X', 'importtime'] if importtime else []) + \
+              ['-c', CHILD, ROOT, os.path.join(ROOT, path), MARKER]
+    completed = subprocess.run(command, cwd=ROOT, capture_output=True, text=True, check=True)
+    lines = completed.stderr.splitlines()
+    return json.loads(completed.stdout), lines[lines.index(MARKER) + 1:] if MARKER in lines else []
+
+
+def package_breakdown(lines):
+    """Self time per top-level package (seconds) from `-X importtime` output"""
+    totals = Counter()
+    for line in lines:
+        if not line.startswith('import time:') or 'self [us]' in line:
+            continue
+        self_us, _, name = line[len('import time:'):].split('|')
+        totals[name.strip().split('.')[0]] += int(self_us) / 1e6
+    return totals
+
+
+def profile(path, runs):
+    timings = []
+    modules = []
+    for _ in range(runs):
+        report, _ = import_once(path)
+        timings.append(report['seconds'])
+        modules = report['modules']
+    _, lines = import_once(path, importtime=True)
+    return {
+        'median_ms': round(statistics.median(timings) * 1000, 1),
+        'best_ms': round(min(timings) * 1000, 1),
+        'modules': len(modules),
+        'heavy': [name for name in HEAVY if name in modules],
+        'packages_ms': {name: round(seconds * 1000, 1)
+                        for name, seconds in package_breakdown(lines).most_common()}
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--runs', type=int, default=7, help='fresh interpreters per handler (median is reported)')
+    parser.add_argument('--top', type=int, default=5, help='packages shown per handler')
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    parser.add_argument('handlers', nargs='*', help='api/ files to profile (default: every routed handler)')
+    args = parser.parse_args()
+
+    handlers = [h if h.startswith('api/') else f'api/{h}' for h in args.handlers] or routed_handlers()
+    report = {path: profile(path, args.runs) for path in handlers}
+    if args.json:
+        print(json.dumps({'python': sys.version.split()[0], 'handlers': report}, indent=2))
+        return
+
+    print(f"{'handler':<26} {'median ms':>10} {'best ms':>8} {'modules':>8}  heavy dependencies")
+    for path, row in report.items():
+        print(f"{path:<26} {row['median_ms']:>10.1f} {row['best_ms']:>8.1f} {row['modules']:>8}  "
+              f"{', '.join(row['heavy']) or '-'}")
+    print("\nslowest packages per handler (self time, one -X importtime run)")
+    for path, row in report.items():
+        top = list(row['packages_ms'].items())[:args.top]
+        print(f"{path:<26} " + ', '.join(f'{name} {ms:.1f}' for name, ms in top))
+
+
+if __name__ == '__main__':
+    main()
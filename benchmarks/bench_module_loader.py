@@ -0,0 +1,50 @@
+"""
+Per-request cost of obtaining the schema generator in app_local.
+
+Compares re-executing api/generate-schema.py on every request (the old
+importlib.spec_from_file_location + exec_module path) with the cached
+module_loader, with and without mtime-based hot reload.
+
+Run: python benchmarks/bench_module_loader.py [iterations]
+"""
+import os
+import sys
+import timeit
+import importlib.util
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api import module_loader
+
+PATH = os.path.join(module_loader.API_DIR, 'generate-schema.py')
+
+
+def exec_every_request():
+    spec = importlib.util.spec_from_file_location("generate_schema", PATH)
+    module = importlib.util.module_from_spec(spec)
+    spec.loader.exec_module(module)
+    return module.generate_schema_from_document('invoice.pdf', 'application/pdf')
+
+
+def cached_loader():
+    module = module_loader.load_api_module('generate-schema.py', hot_reload=False)
+    return module.generate_schema_from_document('invoice.pdf', 'application/pdf')
+
+
+def cached_loader_hot_reload():
+    module = module_loader.load_api_module('generate-schema.py', hot_reload=True)
+    return module.generate_schema_from_document('invoice.pdf', 'application/pdf')
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 2000
+    print(f"{'path':<28} {'per request (us)':>17}")
+    for name, func in (('exec_module every request', exec_every_request),
+                       ('module_loader', cached_loader),
+                       ('module_loader + hot reload', cached_loader_hot_reload)):
+        func()
+        seconds = min(timeit.repeat(func, number=iterations, repeat=3))
+        print(f"{name:<28} {seconds / iterations * 1e6:>17.1f}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,88 @@
+"""
+CPU time of decoding extract-data responses: the old response.json() +
+chained replace + json.loads path against api/response_decoder.py with the
+standard library and (when installed) orjson.
+
+Run: python benchmarks/bench_response_decoder.py [invoices ...]
+"""
+import os
+import sys
+import json
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api import response_decoder
+
+
+def _field(value, confidence=0.97):
+    return {'value': value, 'confidence_score': confidence}
+
+
+def make_result(invoices):
+    """Multi-invoice extraction result shaped like the multi-invoice schema"""
+    return {
+        'invoices': [{
+            'invoice_number': _field(f'INV-{n:05d}'),
+            'invoice_date': _field('2024-03-14'),
+            'vendor_name': _field('ACME Supplies Inc.'),
+            'vendor_address': _field('PO Box 100\\Springfield'),
+            'total_amount': _field('267.84'),
+            'page_range': _field(f'{n + 1}'),
+            'line_items': [{
+                'description': _field(f'Widget "{chr(65 + i)}"'),
+                'quantity': _field(str(i + 1)),
+                'unit_price': _field('12.50'),
+                'line_total': _field(f'{12.5 * (i + 1):.2f}')
+            } for i in range(8)]
+        } for n in range(invoices)],
+        'document_summary': {
+            'total_invoices_found': _field(str(invoices)),
+            'total_pages_processed': _field(str(invoices))
+        }
+    }
+
+
+def make_body(invoices, html_encoded):
+    """Raw extract-data response bytes carrying one data[0] entry"""
+    inner = json.dumps(make_result(invoices))
+    if html_encoded:
+        inner = inner.replace('\\', '&#92;').replace('"', '&quot;')
+    return json.dumps({'data': [{'data': inner, 'error': None}]}).encode('utf-8')
+
+
+def legacy_decode(content):
+    """The previous path: text decode, json.loads, chained replace, json.loads"""
+    result_data = json.loads(content.decode('utf-8'))['data'][0]
+    return json.loads(result_data['data'].replace('&quot;', '"').replace('&#92;', '\\'))
+
+
+def decoder(name):
+    def decode(content):
+        response_decoder.RESPONSE_JSON_BACKEND = name
+        return response_decoder.decode_response(content)[0][0]
+    return decode
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10, 200, 2000]
+    variants = [('legacy', legacy_decode), ('json', decoder('json'))]
+    if response_decoder.orjson is not None:
+        variants.append(('orjson', decoder('auto')))
+
+    print(f"{'invoices':>8} {'entities':>9} {'size KB':>9} " + ''.join(f"{name + ' ms':>12}" for name, _ in variants))
+    for invoices in sizes:
+        for html_encoded in (False, True):
+            body = make_body(invoices, html_encoded)
+            expected = legacy_decode(body)
+            timings = []
+            for name, decode in variants:
+                assert decode(body) == expected, name
+                number = max(1, 2000 // invoices)
+                timings.append(min(timeit.repeat(lambda: decode(body), number=number, repeat=3)) / number)
+            print(f"{invoices:>8} {'yes' if html_encoded else 'no':>9} {len(body) / 1024:>9.0f} "
+                  + ''.join(f"{seconds * 1000:>12.2f}" for seconds in timings))
+    response_decoder.RESPONSE_JSON_BACKEND = 'auto'
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,72 @@
+"""
+Peak-memory benchmark for building the extract-data request body.
+
+Compares the legacy path (read -> b64encode -> decode -> payload dict -> json
+serialization) with the streamed ExtractDataBody that encodes the file while it
+is being sent. Bodies are consumed chunk by chunk, the way urllib3 writes them
+to the socket, so no network is needed.
+
+Run: python benchmarks/bench_streaming_memory.py [size_mb ...]
+"""
+import os
+import sys
+import json
+import base64
+import tempfile
+import tracemalloc
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from api import document_ai
+
+SCHEMA = {"type": "object", "properties": {"invoice_number": {"type": "string"}}}
+
+
+def legacy_body(path):
+    with open(path, 'rb') as f:
+        file_data = f.read()
+    base64_data = base64.b64encode(file_data).decode('utf-8')
+    payload = {
+        "mlModel": "model",
+        "schemaConfig": json.dumps(SCHEMA),
+        "files": [{"mimeType": "application/pdf", "data": base64_data}]
+    }
+    body = json.dumps(payload).encode('utf-8')
+    return len(body)
+
+
+def streamed_body(path):
+    sent = 0
+    with open(path, 'rb') as f:
+        body = document_ai.build_extract_body([{'mime_type': 'application/pdf', 'stream': f}], SCHEMA, "model")
+        for chunk in body:
+            sent += len(chunk)
+    return sent
+
+
+def measure(func, path):
+    tracemalloc.start()
+    size = func(path)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return size, peak
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [1, 10, 50]
+    print(f"{'file MB':>8} {'body MB':>8} {'legacy peak MB':>15} {'streamed peak MB':>17}")
+    for size_mb in sizes:
+        with tempfile.NamedTemporaryFile(delete=False) as f:
+            for _ in range(size_mb):
+                f.write(os.urandom(1024 * 1024))
+            path = f.name
+        try:
+            legacy_size, legacy_peak = measure(legacy_body, path)
+            streamed_size, streamed_peak = measure(streamed_body, path)
+            assert legacy_size == streamed_size, (legacy_size, streamed_size)
+            print(f"{size_mb:>8} {legacy_size / 2**20:>8.1f} {legacy_peak / 2**20:>15.1f} {streamed_peak / 2**20:>17.2f}")
+        finally:
+            os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,77 @@
+"""
+Deterministic synthetic documents shared by the benchmarks.
+"""
+import zlib
+import random
+
+INVOICE_PAGE = [
+    "ACME Supplies Inc.", "INVOICE", "Invoice Number: INV-{n:05d}", "Invoice Date: 2024-03-{d:02d}",
+    "Bill To: Globex Corporation", "Due Date: 2024-04-{d:02d}", "Item Qty Unit Price Line Total",
+    "Widget A 4 12.50 50.00", "Widget B 2 99.00 198.00", "Subtotal 248.00", "Tax 19.84",
+    "Balance Due 267.84", "Payment Terms: Net 30", "Remit To: ACME Supplies Inc., PO Box 100"
+]
+
+
+def make_pdf(pages, compress=True, padding=0):
+    """Build a minimal valid PDF whose pages carry the given lines of text.
+
+    ``padding`` appends an uncompressed binary stream of that many bytes to mimic
+    embedded images in large scans.
+    """
+    objects = []
+
+    def add(body):
+        objects.append(body)
+        return len(objects)
+
+    catalog = add(None)
+    pages_id = add(None)
+    font = add(b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>")
+    page_ids = []
+    for lines in pages:
+        content = b"BT /F1 10 Tf 50 750 Td 12 TL " + b" ".join(
+            b"(" + line.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)").encode("latin-1") + b") Tj T*"
+            for line in lines
+        ) + b" ET"
+        if compress:
+            data = zlib.compress(content)
+            stream = add(b"<< /Length %d /Filter /FlateDecode >>\nstream\n" % len(data) + data + b"\nendstream")
+        else:
+            stream = add(b"<< /Length %d >>\nstream\n" % len(content) + content + b"\nendstream")
+        page_ids.append(add(
+            b"<< /Type /Page /Parent %d 0 R /MediaBox [0 0 612 792] /Contents %d 0 R "
+            b"/Resources << /Font << /F1 %d 0 R >> >> >>" % (pages_id, stream, font)
+        ))
+    if padding:
+        blob = random.Random(0).randbytes(padding)
+        add(b"<< /Length %d /Filter /DCTDecode >>\nstream\n" % len(blob) + blob + b"\nendstream")
+
+    objects[catalog - 1] = b"<< /Type /Catalog /Pages %d 0 R >>" % pages_id
+    objects[pages_id - 1] = b"<< /Type /Pages /Kids [%s] /Count %d >>" % (
+        b" ".join(b"%d 0 R" % p for p in page_ids), len(page_ids))
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = []
+    for number, body in enumerate(objects, 1):
+        offsets.append(len(out))
+        out += b"%d 0 obj\n" % number + body + b"\nendobj\n"
+    xref = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for offset in offsets:
+        out += b"%010d 00000 n \n" % offset
+    out += b"trailer\n<< /Size %d /Root %d 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, catalog, xref)
+    return bytes(out)
+
+
+def invoice_pdf(invoices=1, padding=0):
+    """PDF with one invoice per page"""
+    return make_pdf([[line.format(n=i + 1, d=(i % 28) + 1) for line in INVOICE_PAGE] for i in range(invoices)],
+                    padding=padding)
+
+
+def resume_pdf():
+    return make_pdf([[
+        "Jane Doe", "jane@example.com | linkedin.com/in/janedoe", "Objective",
+        "Professional Experience", "Senior Engineer, Initech 2019-2024", "Education",
+        "B.Sc. Computer Science, 2015", "Skills: Python, SQL, Salesforce", "References available on request"
+    ]])
@@ -0,0 +1,155 @@
+"""
+Load test: Flask (app_local.py) vs asyncio (app_async.py) under slow extractions.
+
+Starts the mock Salesforce (benchmarks/mock_salesforce.py) with extract-data
+answering after --delay seconds, runs each server in its own process and fires --requests concurrent
+/api/process-document calls at it. Reports latency percentiles, errors and the
+server's peak thread count and memory.
+
+Run: python benchmarks/load_compare.py --requests 500 --delay 5   (requires aiohttp)
+"""
+import os
+import sys
+import time
+import base64
+import socket
+import asyncio
+import argparse
+import threading
+import subprocess
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from benchmarks import corpus
+
+SERVERS = {
+    'flask': [sys.executable, '-c', 'import os, app_local; app_local.app.run(port=int(os.environ["PORT"]), threaded=True)'],
+    'asyncio': [sys.executable, 'app_async.py'],
+}
+MOCK_SALESFORCE = [sys.executable, os.path.join(ROOT, 'benchmarks', 'mock_salesforce.py')]
+
+
+def free_port():
+    with socket.socket() as s:
+        s.bind(('127.0.0.1', 0))
+        return s.getsockname()[1]
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with socket.create_connection(('127.0.0.1', port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.1)
+    raise RuntimeError(f'nothing listening on port {port}')
+
+
+def proc_status(pid):
+    """(threads, RSS in MB) of a process from /proc, or (0, 0) where unavailable"""
+    try:
+        with open(f'/proc/{pid}/status') as f:
+            fields = dict(line.split(':', 1) for line in f if ':' in line)
+        return int(fields['Threads']), int(fields['VmRSS'].split()[0]) / 1024
+    except (OSError, KeyError, ValueError):
+        return 0, 0
+
+
+class Sampler(threading.Thread):
+    def __init__(self, pid):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.peak_threads = 0
+        self.peak_rss = 0
+        self.running = True
+
+    def run(self):
+        while self.running:
+            threads, rss = proc_status(self.pid)
+            self.peak_threads = max(self.peak_threads, threads)
+            self.peak_rss = max(self.peak_rss, rss)
+            time.sleep(0.1)
+
+
+async def fire(port, sf_url, count, timeout):
+    document = base64.b64encode(corpus.invoice_pdf(1)).decode('ascii')
+    request = {
+        'access_token': 'load-test',
+        'instance_url': sf_url,
+        'schema_id': 'invoice',
+        'bypass_cache': True,
+        'file': {'mime_type': 'application/pdf', 'base64_data': document}
+    }
+    latencies, errors = [], 0
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as http:
+        async def one():
+            nonlocal errors
+            started = time.perf_counter()
+            try:
+                async with http.post(f'http://127.0.0.1:{port}/api/process-document', json=request) as response:
+                    body = await response.json()
+                    if response.status != 200 or not body.get('success'):
+                        errors += 1
+                        return
+            except Exception:
+                errors += 1
+                return
+            latencies.append(time.perf_counter() - started)
+
+        started = time.perf_counter()
+        await asyncio.gather(*[one() for _ in range(count)])
+        return latencies, errors, time.perf_counter() - started
+
+
+def percentile(values, fraction):
+    if not values:
+        return float('nan')
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--requests', type=int, default=500, help='concurrent requests per server')
+    parser.add_argument('--delay', type=float, default=5.0, help='seconds each fake extraction takes')
+    parser.add_argument('--timeout', type=float, default=160.0, help='client timeout per request')
+    parser.add_argument('--servers', default='flask,asyncio')
+    args = parser.parse_args()
+
+    sf_port = free_port()
+    fake = subprocess.Popen(MOCK_SALESFORCE + ['--port', str(sf_port), '--latency', f'fixed:{args.delay}'],
+                            stderr=subprocess.DEVNULL)
+    try:
+        wait_for_port(sf_port)
+        print(f"{args.requests} concurrent requests, {args.delay:.1f} s per extraction")
+        print(f"{'server':<9} {'ok':>6} {'errors':>6} {'wall s':>8} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} "
+              f"{'threads':>8} {'RSS MB':>7}")
+        for name in args.servers.split(','):
+            port = free_port()
+            env = dict(os.environ, PORT=str(port), RESULT_CACHE='off', PYTHONUNBUFFERED='1')
+            server = subprocess.Popen(SERVERS[name], cwd=os.path.join(ROOT, 'backend'), env=env,
+                                      stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+            try:
+                wait_for_port(port)
+                sampler = Sampler(server.pid)
+                sampler.start()
+                latencies, errors, wall = asyncio.run(fire(port, f'http://127.0.0.1:{sf_port}', args.requests,
+                                                           args.timeout))
+                sampler.running = False
+                print(f"{name:<9} {len(latencies):>6} {errors:>6} {wall:>8.2f} {percentile(latencies, 0.5):>7.2f} "
+                      f"{percentile(latencies, 0.95):>7.2f} {percentile(latencies, 0.99):>7.2f} "
+                      f"{sampler.peak_threads:>8} {sampler.peak_rss:>7.0f}")
+            finally:
+                server.terminate()
+                server.wait()
+    finally:
+        fake.terminate()
+        fake.wait()
+
+
+if __name__ == '__main__':
+    main()
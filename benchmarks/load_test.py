@@ -0,0 +1,240 @@
+"""
+End-to-end load test against the mock Salesforce org.
+
+Starts benchmarks/mock_salesforce.py (unless --instance-url points at a
+running one) and a backend (unless --url points at a running one), then
+drives /api/process-document, /api/generate-schema and /api/test-connection
+at --rps requests per second for --duration seconds. Arrivals are open-loop:
+requests go out on schedule whether or not earlier ones have answered, and
+latency is measured from the scheduled send time, so a stalled server shows
+up as latency instead of a lower request rate. Reports p50/p95/p99 latency,
+throughput and response statuses per endpoint.
+
+Every test-connection request uses its own access token, so each one runs a
+full version discovery instead of hitting the discovery cache. The per-org
+governor applies to the mock org like any other: raise GOVERNOR_RATE /
+GOVERNOR_MAX_IN_FLIGHT (or set GOVERNOR=false) in the environment to load the
+server itself rather than its throttling.
+
+Run: python benchmarks/load_test.py --rps 20 --duration 60 -- --latency lognormal:2:0.5 --error-rate 0.01
+     (arguments after -- are passed to the mock server; requires aiohttp)
+"""
+import os
+import sys
+import json
+import base64
+import random
+import asyncio
+import argparse
+import subprocess
+from collections import Counter
+
+import aiohttp
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from benchmarks import corpus
+from benchmarks.load_compare import SERVERS, MOCK_SALESFORCE, free_port, wait_for_port, percentile
+
+ENDPOINTS = ('process-document', 'generate-schema', 'test-connection')
+
+
+def parse_mix(spec):
+    """{endpoint: weight} from 'process-document=8,generate-schema=1,test-connection=1'"""
+    mix = {}
+    for part in spec.split(','):
+        name, _, weight = part.strip().partition('=')
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f'unknown endpoint {name!r} (one of {", ".join(ENDPOINTS)})')
+        mix[name] = float(weight or 1)
+    return mix
+
+
+def request_builders(instance_url, pages, use_cache):
+    """Body factory per endpoint; each takes the request's sequence number"""
+    document = base64.b64encode(corpus.invoice_pdf(pages)).decode('ascii')
+    process = {
+        'access_token': 'load-test',
+        'instance_url': instance_url,
+        'schema_id': 'invoice',
+        'bypass_cache': not use_cache,
+        'file': {'mime_type': 'application/pdf', 'base64_data': document}
+    }
+    generate = {'filename': 'scan.pdf', 'mime_type': 'application/pdf', 'base64_data': document}
+    return {
+        'process-document': lambda n: process,
+        'generate-schema': lambda n: generate,
+        'test-connection': lambda n: {'access_token': f'load-test-{n}', 'instance_url': instance_url,
+                                      'api_version': 'v65.0'},
+    }
+
+
+class Results:
+    def __init__(self):
+        self.sent = Counter()
+        self.dropped = Counter()
+        self.ok = Counter()
+        self.statuses = {name: Counter() for name in ENDPOINTS}
+        self.latencies = {name: [] for name in ENDPOINTS}
+        self.in_flight = 0
+
+
+async def drive(base_url, builders, mix, rps, duration, timeout, max_in_flight, poisson, seed):
+    """Send requests on an open-loop schedule and collect per-endpoint outcomes"""
+    rng = random.Random(seed)
+    names, weights = list(mix), list(mix.values())
+    results = Results()
+    loop = asyncio.get_running_loop()
+
+    async def one(http, name, number, scheduled):
+        results.in_flight += 1
+        try:
+            async with http.post(f'{base_url}/api/{name}', json=builders[name](number)) as response:
+                body = await response.json(content_type=None)
+                status = str(response.status)
+                success = response.status in (200, 202) and isinstance(body, dict) and body.get('success', True)
+        except asyncio.TimeoutError:
+            status, success = 'timeout', False
+        except (aiohttp.ClientError, ValueError) as e:
+            status, success = type(e).__name__, False
+        finally:
+            results.in_flight -= 1
+        results.statuses[name][status] += 1
+        if success:
+            results.ok[name] += 1
+            results.latencies[name].append(loop.time() - scheduled)
+
+    connector = aiohttp.TCPConnector(limit=0)
+    async with aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=timeout)) as http:
+        tasks = []
+        started = loop.time()
+        scheduled = started
+        number = 0
+        while True:
+            scheduled += rng.expovariate(rps) if poisson else 1.0 / rps
+            if scheduled - started >= duration:
+                break
+            await asyncio.sleep(max(0.0, scheduled - loop.time()))
+            name = rng.choices(names, weights)[0]
+            number += 1
+            results.sent[name] += 1
+            if results.in_flight >= max_in_flight:
+                results.dropped[name] += 1
+                continue
+            tasks.append(asyncio.ensure_future(one(http, name, number, scheduled)))
+        await asyncio.gather(*tasks)
+        return results, loop.time() - started
+
+
+def summarize(results, wall):
+    """Per-endpoint and overall numbers (latencies in ms)"""
+    rows = {}
+    for name in [n for n in ENDPOINTS if results.sent[n]] + ['total']:
+        if name == 'total':
+            latencies = [value for values in results.latencies.values() for value in values]
+            sent, ok, dropped = sum(results.sent.values()), sum(results.ok.values()), sum(results.dropped.values())
+            statuses = sum(results.statuses.values(), Counter())
+        else:
+            latencies = results.latencies[name]
+            sent, ok, dropped = results.sent[name], results.ok[name], results.dropped[name]
+            statuses = results.statuses[name]
+        rows[name] = {
+            'sent': sent,
+            'ok': ok,
+            'errors': sent - ok - dropped,
+            'dropped': dropped,
+            'throughput_rps': round(ok / wall, 2) if wall else 0.0,
+            'p50_ms': round(percentile(latencies, 0.5) * 1000, 1),
+            'p95_ms': round(percentile(latencies, 0.95) * 1000, 1),
+            'p99_ms': round(percentile(latencies, 0.99) * 1000, 1),
+            'max_ms': round(max(latencies) * 1000, 1) if latencies else float('nan'),
+            'statuses': dict(statuses.most_common())
+        }
+    return rows
+
+
+def print_table(rows, wall, rps):
+    print(f"target {rps:g} req/s, wall {wall:.1f} s")
+    print(f"{'endpoint':<17} {'sent':>6} {'ok':>6} {'errors':>6} {'dropped':>7} {'ok/s':>7} "
+          f"{'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}  statuses")
+    for name, row in rows.items():
+        statuses = ' '.join(f'{status}:{count}' for status, count in row['statuses'].items())
+        print(f"{name:<17} {row['sent']:>6} {row['ok']:>6} {row['errors']:>6} {row['dropped']:>7} "
+              f"{row['throughput_rps']:>7.2f} {row['p50_ms']:>8.1f} {row['p95_ms']:>8.1f} {row['p99_ms']:>8.1f} "
+              f"{row['max_ms']:>8.1f}  {statuses}")
+
+
+def mock_stats(instance_url):
+    """Counters of the mock server, or None when it does not expose them"""
+    async def fetch():
+        async with aiohttp.ClientSession() as http:
+            async with http.get(f'{instance_url}/mock/stats') as response:
+                return await response.json()
+    try:
+        return asyncio.run(fetch())
+    except (aiohttp.ClientError, ValueError):
+        return None
+
+
+def main():
+    argv = sys.argv[1:]
+    mock_args = argv[argv.index('--') + 1:] if '--' in argv else []
+    argv = argv[:argv.index('--')] if '--' in argv else argv
+
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--rps', type=float, default=10.0, help='target requests per second')
+    parser.add_argument('--duration', type=float, default=30.0, help='seconds to send requests for')
+    parser.add_argument('--mix', type=parse_mix, default=parse_mix('process-document=8,generate-schema=1,test-connection=1'),
+                        help='endpoint weights (default process-document=8,generate-schema=1,test-connection=1)')
+    parser.add_argument('--server', choices=sorted(SERVERS), default='flask', help='backend to start')
+    parser.add_argument('--url', help='use a running backend instead of starting one')
+    parser.add_argument('--instance-url', help='use a running mock org instead of starting one')
+    parser.add_argument('--pages', type=int, default=1, help='pages of the test invoice PDF')
+    parser.add_argument('--cache', action='store_true', help='let the result cache answer repeated documents')
+    parser.add_argument('--poisson', action='store_true', help='exponential inter-arrival times instead of a fixed rate')
+    parser.add_argument('--timeout', type=float, default=160.0, help='client timeout per request')
+    parser.add_argument('--max-in-flight', type=int, default=5000,
+                        help='requests beyond this many outstanding are dropped and counted')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--json', action='store_true', help='print the report as JSON')
+    args = parser.parse_args(argv)
+
+    processes = []
+    try:
+        instance_url = args.instance_url
+        if not instance_url:
+            sf_port = free_port()
+            processes.append(subprocess.Popen(MOCK_SALESFORCE + ['--port', str(sf_port)] + mock_args,
+                                              stderr=subprocess.DEVNULL))
+            wait_for_port(sf_port)
+            instance_url = f'http://127.0.0.1:{sf_port}'
+
+        base_url = args.url
+        if not base_url:
+            port = free_port()
+            env = dict(os.environ, PORT=str(port), PYTHONUNBUFFERED='1')
+            processes.append(subprocess.Popen(SERVERS[args.server], cwd=os.path.join(ROOT, 'backend'), env=env,
+                                              stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL))
+            wait_for_port(port)
+            base_url = f'http://127.0.0.1:{port}'
+
+        builders = request_builders(instance_url, args.pages, args.cache)
+        results, wall = asyncio.run(drive(base_url.rstrip('/'), builders, args.mix, args.rps, args.duration,
+                                          args.timeout, args.max_in_flight, args.poisson, args.seed))
+        rows = summarize(results, wall)
+        if args.json:
+            print(json.dumps({'target_rps': args.rps, 'wall_s': round(wall, 2), 'endpoints': rows,
+                              'mock': mock_stats(instance_url)}, indent=2))
+        else:
+            print_table(rows, wall, args.rps)
+            stats = mock_stats(instance_url)
+            if stats:
+                print(f"mock org: {json.dumps(stats)}")
+    finally:
+        for process in reversed(processes):
+            process.terminate()
+            process.wait()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,223 @@
+"""
+Microbenchmarks of the in-process hot paths, compared against a stored baseline.
+
+Every case runs on fixed synthetic inputs (benchmarks/corpus.py documents,
+seeded random bytes, generated multi-invoice responses) and reports the best
+per-call time over --repeat rounds. Times are also divided by a calibration
+workload timed in the same run, and comparisons use these normalized times, so a
+baseline recorded on another machine is still roughly comparable. Record
+the baseline on the machine that runs the comparison for tight thresholds.
+
+Run: python benchmarks/microbench.py                  # run and print
+     python benchmarks/microbench.py --save           # (re)write benchmarks/baseline.json
+     python benchmarks/microbench.py --compare        # exit 1 when a case is over --threshold slower
+     python benchmarks/microbench.py --filter base64 --sizes 1,10
+"""
+import io
+import os
+import sys
+import copy
+import json
+import time
+import base64
+import random
+import hashlib
+import argparse
+import platform
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, ROOT)
+from api import schemas
+from api import document_ai
+from api import result_cache
+from api import module_loader
+from api import response_decoder
+from api.streaming import ExtractDataBody
+from api.utils import create_response
+from benchmarks import corpus
+from benchmarks.bench_response_decoder import make_body, make_result
+
+BASELINE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'baseline.json')
+# Each timed round runs the case at least this long
+MIN_ROUND_SECONDS = 0.2
+
+
+def calibrate():
+    """Fixed mix of interpreter, JSON, base64 and hashing work used to normalize timings"""
+    payload = {'items': [{'n': i, 'text': f'line {i}', 'ok': i % 2 == 0} for i in range(2000)]}
+    blob = random.Random(1).randbytes(1024 * 1024)
+
+    def workload():
+        total = 0
+        for i in range(100000):
+            total += i * i
+        hashlib.sha256(base64.b64encode(blob)).digest()
+        json.loads(json.dumps(payload))
+        return total
+    return workload
+
+
+def cases(sizes_mb):
+    """(name, zero-argument callable) for every benchmark; inputs are built up front"""
+    generator = module_loader.load_api_module('generate-schema.py', hot_reload=False)
+    invoice_1 = base64.b64encode(corpus.invoice_pdf(1)).decode('ascii')
+    invoice_20 = base64.b64encode(corpus.invoice_pdf(20)).decode('ascii')
+    invoice_entry = schemas.registry.get('invoice')
+    custom_schema = copy.deepcopy(schemas.MULTI_INVOICE_SCHEMA)
+
+    yield 'schema.lookup.filename', lambda: generator.generate_schema_from_document('merged_batch.pdf', 'application/pdf')
+    yield 'schema.lookup.content_1_page', lambda: generator.generate_schema_from_document('scan.pdf', 'application/pdf',
+                                                                                        invoice_1)
+    yield 'schema.lookup.content_20_pages', lambda: generator.generate_schema_from_document('scan.pdf', 'application/pdf',
+                                                                                          invoice_20)
+    yield 'schema.response_body', lambda: generator.schema_response_body(invoice_entry, 'scan.pdf', 'application/pdf')
+    yield 'schema_config.registered', lambda: document_ai.build_schema_config(schemas.MULTI_INVOICE_SCHEMA)
+    yield 'schema_config.custom', lambda: document_ai.build_schema_config(custom_schema)
+
+    for size in sizes_mb:
+        raw = random.Random(size).randbytes(size * 1024 * 1024)
+        encoded = base64.b64encode(raw).decode('ascii')
+        stream = io.BytesIO(raw)
+        yield f'base64.encode_stream_body.{size}MB', _drain(lambda stream=stream: ExtractDataBody(
+            [{'mime_type': 'application/pdf', 'stream': stream}], '{}', 'model'))
+        yield f'base64.slice_base64_body.{size}MB', _drain(lambda encoded=encoded: ExtractDataBody(
+            [{'mime_type': 'application/pdf', 'base64_data': encoded}], '{}', 'model'))
+        yield f'base64.decode_digest.{size}MB', lambda encoded=encoded: result_cache.file_digest({'base64_data': encoded})
+
+    for invoices in (20, 200, 2000):
+        plain, escaped = make_body(invoices, False), make_body(invoices, True)
+        yield f'response.decode.{invoices}_invoices', lambda body=plain: response_decoder.decode_response(body)
+        yield f'response.decode_escaped.{invoices}_invoices', lambda body=escaped: response_decoder.decode_response(body)
+
+    small = {'success': True, 'message': 'Token cleared successfully. Please authenticate again.'}
+    large = {'success': True, 'data': make_result(200)}
+    yield 'create_response.small', lambda: create_response(200, small)
+    yield 'create_response.200_invoices', lambda: create_response(200, large)
+
+
+def _drain(build):
+    """Build an extract-data body and consume it the way the HTTP client does"""
+    def run():
+        for _ in build():
+            pass
+    return run
+
+
+def measure(fn, repeat):
+    """Best seconds per call over `repeat` rounds of at least MIN_ROUND_SECONDS each"""
+    started = time.perf_counter()
+    fn()
+    once = time.perf_counter() - started
+    number = max(1, int(MIN_ROUND_SECONDS / once)) if once > 0 else 1000
+    best = float('inf')
+    for _ in range(repeat):
+        started = time.perf_counter()
+        for _ in range(number):
+            fn()
+        best = min(best, (time.perf_counter() - started) / number)
+    return best
+
+
+def run(sizes_mb, repeat, selected=lambda name: True, log=sys.stdout):
+    workload = calibrate()
+    before = measure(workload, repeat)
+    results = {}
+    for name, fn in cases(sizes_mb):
+        if not selected(name):
+            continue
+        results[name] = {'seconds': measure(fn, repeat)}
+        print(f"{name:<42} {results[name]['seconds'] * 1000:>12.4f} ms", file=log)
+    # The first rounds of a run are often slower (cold caches, clock ramp-up); keep the faster calibration
+    calibration = min(before, measure(workload, repeat))
+    for result in results.values():
+        result['normalized'] = result['seconds'] / calibration
+    return {
+        'meta': {
+            'python': platform.python_version(),
+            'implementation': platform.python_implementation(),
+            'machine': platform.machine(),
+            'json_backend': response_decoder.backend(),
+            'calibration_s': calibration,
+            'created': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+        },
+        'cases': results
+    }
+
+
+def compare(current, baseline, threshold, absolute=False):
+    """Print a comparison table; returns the names of cases slower than the threshold allows"""
+    key = 'seconds' if absolute else 'normalized'
+    for field in ('python', 'json_backend'):
+        if baseline['meta'].get(field) != current['meta'][field]:
+            print(f"warning: baseline {field} is {baseline['meta'].get(field)}, "
+                  f"this run uses {current['meta'][field]}")
+
+    regressions = []
+    print(f"{'case':<42} {'baseline ms':>12} {'current ms':>12} {'change':>8}")
+    for name, result in current['cases'].items():
+        base = baseline['cases'].get(name)
+        if base is None:
+            print(f"{name:<42} {'-':>12} {result['seconds'] * 1000:>12.4f} {'new':>8}")
+            continue
+        change = result[key] / base[key] - 1
+        status = ''
+        if change > threshold:
+            status = '  REGRESSION'
+            regressions.append(name)
+        print(f"{name:<42} {base['seconds'] * 1000:>12.4f} {result['seconds'] * 1000:>12.4f} "
+              f"{change * 100:>+7.1f}%{status}")
+    skipped = [name for name in baseline['cases'] if name not in current['cases']]
+    if skipped:
+        print(f"{len(skipped)} baseline case(s) not run")
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--sizes', default='1,10,100', help='base64 input sizes in MB (default 1,10,100)')
+    parser.add_argument('--repeat', type=int, default=5, help='timed rounds per case (best is kept)')
+    parser.add_argument('--filter', help='only run cases whose name contains this')
+    parser.add_argument('--baseline', default=BASELINE, help='baseline file (default benchmarks/baseline.json)')
+    parser.add_argument('--save', action='store_true', help='write the results as the new baseline')
+    parser.add_argument('--compare', action='store_true', help='compare with the baseline; exit 1 on regressions')
+    parser.add_argument('--threshold', type=float, default=0.25,
+                        help='allowed slowdown before a case counts as a regression (default 0.25 = 25%%)')
+    parser.add_argument('--absolute', action='store_true', help='compare raw times instead of calibrated ones')
+    parser.add_argument('--json', action='store_true', help='print the results as JSON')
+    args = parser.parse_args()
+
+    sizes = [int(size) for size in args.sizes.split(',') if size.strip()]
+    # Progress goes to stderr when stdout carries a report
+    log = sys.stderr if args.json or args.compare else sys.stdout
+    current = run(sizes, args.repeat, lambda name: not args.filter or args.filter in name, log)
+
+    if args.json:
+        print(json.dumps(current, indent=2))
+    if args.save:
+        if args.filter and os.path.exists(args.baseline):
+            # Keep the cases that were not run this time
+            with open(args.baseline) as f:
+                current = dict(current, cases=dict(json.load(f)['cases'], **current['cases']))
+        with open(args.baseline, 'w') as f:
+            json.dump(current, f, indent=2, sort_keys=True)
+            f.write('\n')
+        print(f"baseline written to {args.baseline}")
+    if args.compare:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(current, baseline, args.threshold, args.absolute)
+        if regressions:
+            # Rule out a noisy round: measure the slow cases again and keep the better time
+            print(f"re-measuring {len(regressions)} case(s)")
+            again = run(sizes, args.repeat, lambda name: name in regressions, sys.stderr)
+            for name in regressions:
+                if again['cases'][name]['normalized'] < current['cases'][name]['normalized']:
+                    current['cases'][name] = again['cases'][name]
+            regressions = compare(current, baseline, args.threshold, args.absolute)
+        if regressions:
+            print(f"{len(regressions)} case(s) regressed more than {args.threshold:.0%}: {', '.join(regressions)}")
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,278 @@
+"""
+Offline stand-in for the Salesforce endpoints this project calls.
+
+Serves the OAuth token endpoint, the REST version root, the Document AI
+configurations list and extract-data. Extract-data answers with one `data[i]`
+entry per file, each built from the request's schemaConfig: every leaf field
+becomes `{"value": ..., "confidence_score": ...}`, and the JSON string is
+HTML-entity-escaped (`&quot;`, `&#92;`) the way some orgs return it. Latency,
+failure rates and payload size are configurable, so backends can be
+benchmarked without a live org.
+
+Run: python benchmarks/mock_salesforce.py --port 8787 --latency lognormal:2:0.5 --error-rate 0.02
+Then send requests with "instance_url": "http://127.0.0.1:8787" and any access token
+("expired" gets a 401). Counters: GET /mock/stats. Requires aiohttp.
+
+Latency specs: fixed:S, uniform:LOW:HIGH, normal:MEAN:SD, lognormal:MEDIAN:SIGMA (seconds).
+"""
+import sys
+import json
+import time
+import math
+import random
+import asyncio
+import argparse
+from collections import Counter
+
+from aiohttp import web
+
+VERSIONS = ['v60.0', 'v61.0', 'v62.0', 'v63.0', 'v64.0', 'v65.0']
+EXPIRED_TOKEN = 'expired'
+
+CONFIGURATIONS = [
+    {'id': '0pxMOCK000000001', 'name': 'Invoice_Extraction', 'label': 'Invoice Extraction', 'status': 'ACTIVE'},
+    {'id': '0pxMOCK000000002', 'name': 'Receipt_Extraction', 'label': 'Receipt Extraction', 'status': 'ACTIVE'}
+]
+
+# Schema used for IDP configuration requests, which carry no schemaConfig
+IDP_SCHEMA = {
+    'type': 'object',
+    'properties': {
+        'invoice_number': {'type': 'string'},
+        'invoice_date': {'type': 'string', 'format': 'date'},
+        'total_amount': {'type': 'number'}
+    }
+}
+
+
+def parse_latency(spec):
+    """Sampler for a latency spec such as 'lognormal:2:0.5' (argparse type)"""
+    name, _, params = spec.partition(':')
+    try:
+        values = [float(value) for value in params.split(':')] if params else []
+    except ValueError:
+        raise argparse.ArgumentTypeError(f'bad latency parameters: {spec}')
+    samplers = {
+        'fixed': (1, lambda rng, s: s),
+        'uniform': (2, lambda rng, low, high: rng.uniform(low, high)),
+        'normal': (2, lambda rng, mean, sd: rng.gauss(mean, sd)),
+        'lognormal': (2, lambda rng, median, sigma: rng.lognormvariate(math.log(median), sigma)),
+    }
+    if name not in samplers or len(values) != samplers[name][0]:
+        raise argparse.ArgumentTypeError(f'unknown latency spec: {spec} (fixed:S, uniform:A:B, normal:M:SD, '
+                                         'lognormal:MEDIAN:SIGMA)')
+    sample = samplers[name][1]
+    return lambda rng: max(0.0, sample(rng, *values))
+
+
+def add_arguments(parser):
+    """Mock behaviour options (shared with benchmarks/load_test.py)"""
+    parser.add_argument('--latency', type=parse_latency, default=parse_latency('lognormal:2:0.5'),
+                        help='extract-data latency distribution (default lognormal:2:0.5)')
+    parser.add_argument('--latency-per-mb', type=float, default=0.0,
+                        help='extra extract-data seconds per MB of request body')
+    parser.add_argument('--api-latency', type=parse_latency, default=parse_latency('fixed:0.02'),
+                        help='latency of the token, version and configuration endpoints')
+    parser.add_argument('--error-rate', type=float, default=0.0, help='share of extract-data calls failing with 500')
+    parser.add_argument('--throttle-rate', type=float, default=0.0,
+                        help='share of extract-data calls answered 429 with Retry-After')
+    parser.add_argument('--retry-after', type=float, default=1.0, help='Retry-After seconds on throttled calls')
+    parser.add_argument('--timeout-rate', type=float, default=0.0,
+                        help='share of extract-data calls that hang for --hang seconds')
+    parser.add_argument('--hang', type=float, default=200.0, help='seconds a hanging call waits before answering')
+    parser.add_argument('--entry-error-rate', type=float, default=0.0,
+                        help='share of files answered with an error inside a 200 response')
+    parser.add_argument('--array-items', type=int, default=3, help='elements generated for every array field')
+    parser.add_argument('--min-confidence', type=float, default=0.6, help='lowest generated confidence score')
+    parser.add_argument('--html-encode', action=argparse.BooleanOptionalAction, default=True,
+                        help='HTML-entity-escape the nested data strings (default on)')
+    parser.add_argument('--api-limit', type=int, default=15000, help='limit reported in Sforce-Limit-Info')
+    parser.add_argument('--seed', type=int, default=None, help='random seed')
+
+
+class MockSalesforce:
+    """State and request handlers of one mock org"""
+
+    def __init__(self, options):
+        self.options = options
+        self.rng = random.Random(options.seed)
+        self.api_calls = 0
+        self.stats = Counter()
+        self.started = time.time()
+
+    # -- helpers -----------------------------------------------------------
+
+    def _fail_auth(self, request):
+        token = request.headers.get('Authorization', '').partition(' ')[2]
+        if token and token != EXPIRED_TOKEN:
+            return None
+        return web.json_response([{'errorCode': 'INVALID_SESSION_ID', 'message': 'Session expired or invalid'}],
+                                 status=401)
+
+    def _limit_headers(self):
+        self.api_calls += 1
+        return {'Sforce-Limit-Info': f'api-usage={self.api_calls}/{self.options.api_limit}'}
+
+    async def _api_delay(self):
+        await asyncio.sleep(self.options.api_latency(self.rng))
+
+    def _outcome(self):
+        """'hang', 'throttled', 'error' or 'ok' for one extract-data call, drawn from the configured rates"""
+        roll = self.rng.random()
+        options = self.options
+        for outcome, rate in (('hang', options.timeout_rate), ('throttled', options.throttle_rate),
+                              ('error', options.error_rate)):
+            if roll < rate:
+                return outcome
+            roll -= rate
+        return 'ok'
+
+    def _field(self, name, schema):
+        kind = schema.get('type')
+        if kind == 'number' or kind == 'integer':
+            value = round(self.rng.uniform(1, 1000), 2) if kind == 'number' else self.rng.randint(1, 100)
+        elif kind == 'boolean':
+            value = self.rng.random() < 0.5
+        elif schema.get('format') == 'date' or 'date' in name:
+            value = f'2024-{self.rng.randint(1, 12):02d}-{self.rng.randint(1, 28):02d}'
+        else:
+            # Quotes and backslashes exercise the entity unescaping
+            value = f'{name.replace("_", " ").title()} "{self.rng.randint(1, 9999)}" C:\\docs'
+        return {'value': value, 'confidence_score': round(self.rng.uniform(self.options.min_confidence, 1.0), 3)}
+
+    def generate(self, schema, name='value'):
+        """Extraction result shaped like `schema`"""
+        if not isinstance(schema, dict):
+            return self._field(name, {})
+        if isinstance(schema.get('properties'), dict):
+            return {key: self.generate(value, key) for key, value in schema['properties'].items()}
+        if schema.get('type') == 'array':
+            return [self.generate(schema.get('items') or {}, name) for _ in range(self.options.array_items)]
+        return self._field(name, schema)
+
+    def _entry(self, schema):
+        if self.rng.random() < self.options.entry_error_rate:
+            self.stats['entry_error'] += 1
+            return {'data': None, 'error': 'Mock extraction failed for this file'}
+        inner = json.dumps(self.generate(schema))
+        if self.options.html_encode:
+            inner = inner.replace('\\', '&#92;').replace('"', '&quot;')
+        return {'data': inner, 'error': None}
+
+    # -- handlers ----------------------------------------------------------
+
+    async def token(self, request):
+        form = await request.post()
+        self.stats['token'] += 1
+        await self._api_delay()
+        if form.get('grant_type') not in ('password', 'refresh_token', 'authorization_code', 'client_credentials'):
+            return web.json_response({'error': 'unsupported_grant_type', 'error_description': 'grant type not supported'},
+                                     status=400)
+        host = f'{request.scheme}://{request.host}'
+        issued_at = int(time.time() * 1000)
+        body = {
+            'access_token': f'mock-{issued_at}-{self.rng.randrange(1 << 30):x}',
+            'instance_url': host,
+            'id': f'{host}/id/00DMOCK0000000001/005MOCK0000000001',
+            'token_type': 'Bearer',
+            'issued_at': str(issued_at),
+            'signature': 'mock'
+        }
+        if form.get('grant_type') != 'refresh_token':
+            body['refresh_token'] = f'mock-refresh-{self.rng.randrange(1 << 30):x}'
+        return web.json_response(body)
+
+    async def version_root(self, request):
+        self.stats['version'] += 1
+        await self._api_delay()
+        if request.match_info['version'] not in VERSIONS:
+            return web.json_response([{'errorCode': 'NOT_FOUND', 'message': 'The requested resource does not exist'}],
+                                     status=404)
+        failed = self._fail_auth(request)
+        if failed is not None:
+            return failed
+        version = request.match_info['version']
+        return web.json_response({'sobjects': f'/services/data/{version}/sobjects',
+                                  'ssot': f'/services/data/{version}/ssot'}, headers=self._limit_headers())
+
+    async def configurations(self, request):
+        self.stats['configurations'] += 1
+        await self._api_delay()
+        failed = self._fail_auth(request)
+        if failed is not None:
+            return failed
+        return web.json_response({'configurations': CONFIGURATIONS}, headers=self._limit_headers())
+
+    async def extract(self, request):
+        raw = await request.read()
+        failed = self._fail_auth(request)
+        if failed is not None:
+            self.stats['unauthorized'] += 1
+            return failed
+        try:
+            payload = json.loads(raw)
+        except ValueError:
+            payload = None
+        if not isinstance(payload, dict) or not payload.get('files'):
+            self.stats['bad_request'] += 1
+            return web.json_response([{'errorCode': 'INVALID_INPUT', 'message': 'files is required'}], status=400)
+
+        options = self.options
+        outcome = self._outcome()
+        if outcome == 'hang':
+            self.stats['hang'] += 1
+            await asyncio.sleep(options.hang)
+        else:
+            await asyncio.sleep(options.latency(self.rng) + options.latency_per_mb * len(raw) / (1024 * 1024))
+        headers = self._limit_headers()
+
+        if outcome == 'throttled':
+            self.stats['throttled'] += 1
+            return web.json_response([{'errorCode': 'REQUEST_LIMIT_EXCEEDED', 'message': 'Mock throttling'}],
+                                     status=429, headers=dict(headers, **{'Retry-After': f'{options.retry_after:g}'}))
+        if outcome == 'error':
+            self.stats['error'] += 1
+            return web.json_response([{'errorCode': 'UNKNOWN_EXCEPTION', 'message': 'Mock server error'}],
+                                     status=500, headers=headers)
+
+        if payload.get('idpConfigurationIdOrName'):
+            schema = IDP_SCHEMA
+        else:
+            try:
+                schema = json.loads(payload.get('schemaConfig') or '{}')
+            except ValueError:
+                schema = {}
+        self.stats['ok'] += 1
+        self.stats['files'] += len(payload['files'])
+        body = {'data': [self._entry(schema) for _ in payload['files']]}
+        return web.json_response(body, headers=headers)
+
+    async def mock_stats(self, request):
+        return web.json_response(dict(self.stats, api_calls=self.api_calls,
+                                      uptime_s=round(time.time() - self.started, 1)))
+
+
+def make_app(options):
+    """aiohttp application serving the mock org"""
+    mock = MockSalesforce(options)
+    app = web.Application(client_max_size=256 * 1024 * 1024)
+    app.router.add_post('/services/oauth2/token', mock.token)
+    app.router.add_get('/services/data/{version}', mock.version_root)
+    app.router.add_get('/services/data/{version}/ssot/document-processing/configurations', mock.configurations)
+    app.router.add_post('/services/data/{version}/ssot/document-processing/actions/extract-data', mock.extract)
+    app.router.add_get('/mock/stats', mock.mock_stats)
+    return app
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8787)
+    add_arguments(parser)
+    options = parser.parse_args(argv)
+    print(f'Mock Salesforce on http://{options.host}:{options.port}', file=sys.stderr)
+    web.run_app(make_app(options), host=options.host, port=options.port, print=None, access_log=None, backlog=4096)
+
+
+if __name__ == '__main__':
+    main()
@@ -142,6 +142,14 @@ function loadConfig() {
     }
 }
 
+function applyRefreshedToken(data) {
+    // The server renewed an expired session; keep using the new token
+    if (data && data.refreshed_access_token) {
+        accessToken = data.refreshed_access_token;
+        localStorage.setItem('sf_access_token', accessToken);
+    }
+}
+
 function loadAuthState() {
     // Load token from localStorage
     accessToken = localStorage.getItem('sf_access_token');
@@ -356,18 +364,6 @@ function displayFileInfo(file) {
     }
 }
 
-function fileToBase64(file) {
-    return new Promise((resolve, reject) => {
-        const reader = new FileReader();
-        reader.onload = () => {
-            const base64 = reader.result.split(',')[1]; // Remove data:type;base64, prefix
-            resolve(base64);
-        };
-        reader.onerror = reject;
-        reader.readAsDataURL(file);
-    });
-}
-
 async function handleFileUpload(e) {
     e.preventDefault();
     
@@ -394,22 +390,18 @@ async function handleFileUpload(e) {
     }
     
     try {
-        // Convert file to base64
-        const base64Data = await fileToBase64(uploadedFile);
-        
         // Determine MIME type
         const mimeType = uploadedFile.type || 'application/pdf';
         
+        // Send the file as raw multipart binary; the server encodes it only when calling Salesforce
+        const formData = new FormData();
+        formData.append('filename', uploadedFile.name);
+        formData.append('mime_type', mimeType);
+        formData.append('file', uploadedFile, uploadedFile.name);
+        
         const response = await fetch('/api/generate-schema', {
             method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                filename: uploadedFile.name,
-                mime_type: mimeType,
-                base64_data: base64Data
-            })
+            body: formData
         });
         
         // Check if response is JSON
@@ -511,26 +503,21 @@ async function handleProcessDocument() {
         const mlModel = document.getElementById('mlModel');
         const mlModelValue = mlModel ? mlModel.value : config.DEFAULT_ML_MODEL;
         
-        // Convert file to base64
-        const base64Data = await fileToBase64(uploadedFile);
         const mimeType = uploadedFile.type || 'application/pdf';
         
+        // Multipart upload: request keys as form fields, the document as a binary part
+        const formData = new FormData();
+        formData.append('access_token', accessToken);
+        formData.append('instance_url', formattedInstanceUrl);
+        formData.append('schema', JSON.stringify(schema));
+        formData.append('mlModel', mlModelValue);
+        formData.append('api_version', config.API_VERSION);
+        formData.append('mime_type', mimeType);
+        formData.append('file', uploadedFile, uploadedFile.name);
+        
         const response = await fetch('/api/process-document', {
             method: 'POST',
-            headers: {
-                'Content-Type': 'application/json'
-            },
-            body: JSON.stringify({
-                access_token: accessToken,
-                instance_url: formattedInstanceUrl,
-                schema: schema,
-                mlModel: mlModelValue,
-                api_version: config.API_VERSION,
-                file: {
-                    mime_type: mimeType,
-                    base64_data: base64Data
-                }
-            })
+            body: formData
         });
         
         // Check if response is JSON
@@ -541,6 +528,7 @@ async function handleProcessDocument() {
         }
         
         const data = await response.json();
+        applyRefreshedToken(data);
         
         if (response.ok && data.success) {
             extractedData = data.data;
@@ -1028,6 +1016,7 @@ async function testApiConnection() {
         });
         
         const data = await response.json();
+        applyRefreshedToken(data);
         
         if (data.success) {
             // Auto-update API version if different